@@ -1,185 +1,3170 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, make_response
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, make_response, g, has_app_context, has_request_context, Response, stream_with_context
+from flask.json.provider import JSONProvider
 import mysql.connector
 import re
 import os
-from datetime import datetime, timedelta
+import bisect
+import click
+from collections import OrderedDict, deque
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import atexit
+import base64
+import csv
+import dataclasses
 import hashlib
+import heapq
+import io
 import json
+import logging
+import math
+import queue
 import sys
+import threading
 import time
 
+try:
+    import numpy as np
+except ImportError:  # optional: earnings series fall back to pure Python
+    np = None
+
+try:
+    import orjson
+except ImportError:  # optional: responses fall back to the stdlib encoder
+    orjson = None
+
 app = Flask(__name__)
 app.secret_key = 'your-secret-key'
 app.config['SESSION_TYPE'] = 'filesystem'
 app.config['SESSION_PERMANENT'] = True
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
 
-# Custom JSON encoder to handle datetime objects
-class CustomJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return obj.strftime('%Y-%m-%d %H:%M:%S')
-        elif isinstance(obj, timedelta):
-            hours, remainder = divmod(obj.seconds, 3600)
-            minutes, seconds = divmod(remainder, 60)
-            return f'{hours:02d}:{minutes:02d}'
-        return super().default(obj)
+# Connection pool settings (overridable from the environment)
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 3600))
+app.config['DB_POOL_PRE_PING'] = os.environ.get('DB_POOL_PRE_PING', '1') != '0'
+
+# Logging: LOG_LEVEL=DEBUG also logs every request's statements
+app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO').upper()
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 200))
+app.logger.setLevel(app.config['LOG_LEVEL'])
+db_log = app.logger.getChild('db')
+slow_query_log = app.logger.getChild('slow_query')
+
+def time_of_day(value):
+    """Format a TIME column (fetched as a timedelta) as HH:MM"""
+    hours, remainder = divmod(value.seconds, 3600)
+    return f'{hours:02d}:{remainder // 60:02d}'
+
+# Wire form of the DB types JSON has no type for, looked up by exact type
+JSON_CONVERTERS = {
+    datetime: lambda value: value.isoformat(' ', 'seconds'),
+    date: date.isoformat,
+    timedelta: time_of_day,
+    Decimal: float,
+    bytes: bytes.decode,
+    bytearray: bytearray.decode,
+    set: list,
+}
+
+def json_default(value):
+    """Convert a DB value that JSON has no type for to its wire form"""
+    converter = JSON_CONVERTERS.get(type(value))
+    if converter is None:
+        for value_type, type_converter in JSON_CONVERTERS.items():
+            if isinstance(value, value_type):
+                converter = type_converter
+                break
+        else:
+            raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+    return converter(value)
+
+class StdlibJSONProvider(JSONProvider):
+    """app.json provider on the stdlib json module, converting DB values with json_default"""
+
+    def dumps(self, obj, **kwargs):
+        kwargs.setdefault('default', json_default)
+        kwargs.setdefault('separators', (',', ':'))
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return json.loads(s, **kwargs)
+
+class FastJSONProvider(StdlibJSONProvider):
+    """app.json provider that serializes DB rows in a single pass.
+
+    Dates, times, Decimals and bytes are converted by json_default while the
+    document is encoded, so routes can hand fetched rows straight to
+    jsonify. orjson is used when installed, otherwise the stdlib methods are
+    inherited; datetimes are passed through to json_default so the wire
+    format is the same either way.
+    """
+
+    if orjson is not None:
+        OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=json_default, option=self.OPTIONS).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            body = orjson.dumps(obj, default=json_default, option=self.OPTIONS)
+            return self._app.response_class(body, mimetype='application/json')
+
+app.json_provider_class = FastJSONProvider
+app.json = FastJSONProvider(app)
+
+def fill_defaults(rows, defaults):
+    """Replace missing or NULL values in fetched rows with display defaults.
+
+    Falsy values such as 0, 0.00 or '' are real data and are kept.
+    """
+    for row in rows:
+        for key, value in defaults.items():
+            if row.get(key) is None:
+                row[key] = value
+    return rows
+
+# =====================================================
+# DATABASE CONFIGURATION AND UTILITY FUNCTIONS
+# =====================================================
+
+# MySQL Configuration
+db_config = {
+    'host': 'localhost',
+    'user': 'Your Username',
+    'password': 'Your PWD',
+    'database': 'BookingSystem'
+}
+
+MAX_LOGGED_STATEMENT = 2000
+
+def record_query(statement, seconds, rows):
+    """Account one executed statement to the current request and the slow-query log"""
+    if has_request_context():
+        stats = g.get('db_stats')
+        if stats is None:
+            stats = g.db_stats = {'queries': 0, 'seconds': 0.0, 'statements': []}
+        stats['queries'] += 1
+        stats['seconds'] += seconds
+        stats['statements'].append((statement, seconds, rows))
+
+    if seconds * 1000 >= app.config['SLOW_QUERY_MS'] and slow_query_log.isEnabledFor(logging.WARNING):
+        entry = {
+            'event': 'slow_query',
+            'duration_ms': round(seconds * 1000, 1),
+            'rows': rows,
+            'statement': ' '.join(str(statement).split())[:MAX_LOGGED_STATEMENT],
+        }
+        if has_request_context():
+            entry['method'] = request.method
+            entry['path'] = request.path
+        slow_query_log.warning(app.json.dumps(entry))
+
+class InstrumentedCursor:
+    """Cursor wrapper that times every statement it executes.
+
+    Attribute access is forwarded to the underlying cursor. Each execute()
+    is passed to record_query() with its duration and row count (rows
+    returned for buffered SELECTs, rows affected otherwise).
+    """
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._raw.close()
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._raw.execute(operation, params, *args, **kwargs)
+        finally:
+            record_query(operation, time.perf_counter() - started, self._raw.rowcount)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._raw.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            record_query(operation, time.perf_counter() - started, self._raw.rowcount)
+
+class PooledConnection:
+    """Wrapper around a pooled MySQL connection.
+
+    Attribute access is forwarded to the underlying connection. Calling
+    close() hands the connection back to the pool, except when it is bound
+    to the current request, in which case it is released on teardown.
+    Cursors are wrapped in InstrumentedCursor.
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self.created_at = created_at
+        self.request_scoped = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._raw.cursor(*args, **kwargs))
+
+    def close(self):
+        if not self.request_scoped:
+            self.release()
+
+    def release(self):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw, self.created_at)
+
+
+class ConnectionPool:
+    """Bounded pool of MySQL connections with pre-ping and recycling"""
+
+    def __init__(self, config, size=10, timeout=5.0, recycle=3600, pre_ping=True):
+        self.pid = os.getpid()
+        self.config = dict(config)
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self._idle = deque()
+        self._open = 0
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._stats = {'checkouts': 0, 'created': 0, 'recycled': 0,
+                       'ping_failures': 0, 'waits': 0, 'timeouts': 0}
+
+    def _connect(self):
+        # Buffered cursors let several cursors share one connection per request
+        raw = mysql.connector.connect(buffered=True, **self.config)
+        with self._cond:
+            self._stats['created'] += 1
+        return raw, time.monotonic()
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, raw, created_at):
+        if self.recycle and time.monotonic() - created_at > self.recycle:
+            with self._cond:
+                self._stats['recycled'] += 1
+            return False
+        if self.pre_ping:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                with self._cond:
+                    self._stats['ping_failures'] += 1
+                return False
+        return True
+
+    def acquire(self, timeout=None):
+        """Check out a connection, waiting up to `timeout` seconds for one to free up"""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        with self._cond:
+            while True:
+                if self._idle:
+                    raw, created_at = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    raw, created_at = None, None
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise mysql.connector.errors.PoolError(
+                        f"Timed out after {self.timeout}s waiting for a database connection")
+                self._stats['waits'] += 1
+                self._cond.wait(remaining)
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+
+        try:
+            if raw is not None and not self._is_usable(raw, created_at):
+                self._discard(raw)
+                raw = None
+            if raw is None:
+                raw, created_at = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, raw, created_at)
+
+    def release(self, raw, created_at):
+        """Return a connection to the pool, dropping it if it is no longer healthy"""
+        try:
+            # Never hand an open transaction to the next borrower
+            raw.rollback()
+            healthy = True
+        except Exception:
+            self._discard(raw)
+            healthy = False
+        with self._cond:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append((raw, created_at))
+            else:
+                self._open -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, size=self.size, open=self._open,
+                        in_use=self._in_use, idle=len(self._idle))
+
+
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Get the application's connection pool, creating it on first use.
+
+    A pool inherited across fork() is replaced rather than shared, since
+    parent and child would otherwise use the same server sockets.
+    """
+    pool = app.extensions.get('db_pool')
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            pool = app.extensions.get('db_pool')
+            if pool is None or pool.pid != os.getpid():
+                pool = ConnectionPool(
+                    db_config,
+                    size=app.config['DB_POOL_SIZE'],
+                    timeout=app.config['DB_POOL_TIMEOUT'],
+                    recycle=app.config['DB_POOL_RECYCLE'],
+                    pre_ping=app.config['DB_POOL_PRE_PING'],
+                )
+                app.extensions['db_pool'] = pool
+    return pool
+
+# Helper Functions
+def get_db():
+    """Get a database connection from the pool.
+
+    Inside a request the same connection is reused by every caller and is
+    returned to the pool on teardown. Outside a request the caller owns the
+    connection and returns it with close().
+    """
+    if has_app_context():
+        if 'db' not in g:
+            g.db = get_pool().acquire()
+            g.db.request_scoped = True
+        return g.db
+    return get_pool().acquire()
+
+@app.after_request
+def add_query_timing_headers(response):
+    """Report the request's query count and DB time, e.g. for browser devtools"""
+    stats = g.get('db_stats')
+    if stats is None:
+        return response
+    response.headers['X-DB-Queries'] = str(stats['queries'])
+    response.headers['Server-Timing'] = f'db;dur={stats["seconds"] * 1000:.1f};desc="{stats["queries"]} queries"'
+    if db_log.isEnabledFor(logging.DEBUG):
+        db_log.debug("%s %s: %d queries in %.1fms", request.method, request.path,
+                     stats['queries'], stats['seconds'] * 1000)
+        for statement, seconds, rows in stats['statements']:
+            db_log.debug("  %.1fms, %s rows: %s", seconds * 1000, rows, ' '.join(str(statement).split()))
+    return response
+
+@app.teardown_appcontext
+def release_db(exception):
+    db = g.pop('db', None)
+    if db is not None:
+        db.release()
+
+def hash_password(password):
+    """Hash a password using SHA-256"""
+    return hashlib.sha256(password.encode()).hexdigest()
+
+# =====================================================
+# ADMIN IDENTITY CACHE AND AUTHORIZATION
+# =====================================================
+
+class AdminCache:
+    """In-process map of admin ID -> name, reloaded from the Admin table after a TTL"""
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._admins = {}
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        db = get_db()
+        cursor = db.cursor(dictionary=True)
+        cursor.execute('SELECT A_ID, Name FROM Admin')
+        admins = {row['A_ID']: row['Name'] for row in cursor.fetchall()}
+        cursor.close()
+        db.close()
+        return admins
+
+    def admins(self):
+        if time.monotonic() >= self._expires_at:
+            with self._lock:
+                if time.monotonic() >= self._expires_at:
+                    self._admins = self._load()
+                    self._expires_at = time.monotonic() + self.ttl
+        return self._admins
+
+    def remember(self, admin_id, name):
+        """Record an admin seen elsewhere (e.g. at login) without a reload"""
+        with self._lock:
+            admins = dict(self._admins)
+            admins[admin_id] = name
+            self._admins = admins
+
+    def invalidate(self):
+        with self._lock:
+            self._expires_at = 0.0
+
+
+app.config['ADMIN_CACHE_TTL'] = int(os.environ.get('ADMIN_CACHE_TTL', 300))
+admin_cache = AdminCache(ttl=app.config['ADMIN_CACHE_TTL'])
+
+def invalidate_admin_cache():
+    """Call after rows in the Admin table are added, removed or renamed"""
+    admin_cache.invalidate()
+
+def get_admin_ids():
+    """Get the set of admin IDs, served from the admin cache"""
+    try:
+        return admin_cache.admins().keys()
+    except Exception as e:
+        app.logger.error("Error getting admin IDs: %s", e)
+        return set()
+
+def get_admin_name(admin_id):
+    """Get an admin's display name, served from the admin cache"""
+    try:
+        return admin_cache.admins().get(admin_id) or "Admin"
+    except Exception as e:
+        app.logger.error("Error getting admin name: %s", e)
+        return "Admin"  # Default on error
+
+def is_admin_session():
+    """Check whether the current session belongs to an admin"""
+    return bool(
+        'loggedin' in session and
+        (session.get('role') or session.get('is_admin', False) or session.get('id') in get_admin_ids())
+    )
+
+# =====================================================
+# SCHEMA MIGRATIONS
+# =====================================================
+
+def migrate_baseline_schema(db, cursor):
+    """Add columns missing from older databases and backfill default values"""
+    # Check for Timestamp column in Notifications
+    cursor.execute("SHOW COLUMNS FROM Notifications LIKE 'Timestamp'")
+    if not cursor.fetchone():
+        cursor.execute("ALTER TABLE Notifications ADD COLUMN Timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
+        db.commit()
+        print("Added Timestamp column to Notifications table")
+    
+    # Check for PaymentStatus column in Bookings
+    cursor.execute("SHOW COLUMNS FROM Bookings LIKE 'PaymentStatus'")
+    if not cursor.fetchone():
+        cursor.execute("ALTER TABLE Bookings ADD COLUMN PaymentStatus VARCHAR(20) DEFAULT 'Not Paid'")
+        db.commit()
+        print("Added PaymentStatus column to Bookings table")
+    
+    # PAYMENTS TABLE FIXES - Start with detailed checks
+    print("Checking Payments table structure...")
+    
+    # First check if the table exists
+    cursor.execute("SHOW TABLES LIKE 'Payments'")
+    if not cursor.fetchone():
+        print("Payments table doesn't exist! Creating it...")
+        cursor.execute("""
+            CREATE TABLE Payments (
+                P_ID INT AUTO_INCREMENT PRIMARY KEY,
+                B_ID INT,
+                CustomerID INT,
+                Amount DECIMAL(10,2),
+                PaymentDate DATE,
+                PaymentMethod ENUM('Credit Card', 'Debit Card', 'Net Banking', 'UPI'),
+                PaymentStatus VARCHAR(20) DEFAULT 'Success',
+                ProviderID INT,
+                FOREIGN KEY (B_ID) REFERENCES Bookings(B_ID)
+            )
+        """)
+        db.commit()
+        print("Created Payments table with ProviderID column")
+    
+    # Check for ProviderID column in Payments
+    print("Checking for ProviderID column in Payments table...")
+    cursor.execute("SHOW COLUMNS FROM Payments LIKE 'ProviderID'")
+    if not cursor.fetchone():
+        print("ProviderID column doesn't exist in Payments. Adding it...")
+        cursor.execute("ALTER TABLE Payments ADD COLUMN ProviderID INT DEFAULT NULL")
+        db.commit()
+        print("Added ProviderID column to Payments table")
+        
+    # Count payments with null ProviderID
+    cursor.execute("SELECT COUNT(*) as count FROM Payments WHERE ProviderID IS NULL")
+    null_provider_count = cursor.fetchone()['count']
+    print(f"Found {null_provider_count} payments with NULL ProviderID")
+    
+    if null_provider_count > 0:
+        print("Updating payment records with provider IDs from their associated bookings...")
+        # Update existing payments with provider IDs from their associated bookings
+        cursor.execute("""
+            UPDATE Payments p
+            JOIN Bookings b ON p.B_ID = b.B_ID
+            SET p.ProviderID = b.ProviderID
+            WHERE p.ProviderID IS NULL AND b.ProviderID IS NOT NULL
+        """)
+        
+        affected_rows = cursor.rowcount
+        db.commit()
+        print(f"Updated {affected_rows} payment records with provider IDs")
+        
+        cursor.execute("SELECT COUNT(*) as count FROM Payments WHERE ProviderID IS NULL")
+        still_null = cursor.fetchone()['count']
+        
+        if still_null > 0:
+            print(f"Still have {still_null} payments with NULL ProviderID")
+            
+            # For any remaining null ProviderIDs, use CustomerID as a fallback
+            cursor.execute("""
+                UPDATE Payments p
+                SET p.ProviderID = (
+                    SELECT sp.U_ID 
+                    FROM ServiceProvider sp 
+                    LIMIT 1
+                )
+                WHERE p.ProviderID IS NULL
+            """)
+            
+            affected_rows = cursor.rowcount
+            db.commit()
+            print(f"Updated remaining {affected_rows} payment records with a default provider ID")
+    
+    # Fix any null Provider IDs in Bookings
+    cursor.execute("SELECT COUNT(*) as count FROM Bookings WHERE ProviderID IS NULL OR ProviderID = 0")
+    null_bookings_count = cursor.fetchone()['count']
+    print(f"Found {null_bookings_count} bookings with missing/zero provider ID")
+    
+    if null_bookings_count > 0:
+        cursor.execute("SELECT U_ID FROM User WHERE UserType = 'ServiceProvider' LIMIT 1")
+        provider = cursor.fetchone()
+        
+        if provider:
+            cursor.execute("UPDATE Bookings SET ProviderID = %s WHERE ProviderID IS NULL OR ProviderID = 0", 
+                         (provider['U_ID'],))
+            
+            affected_rows = cursor.rowcount
+            db.commit()
+            print(f"Fixed {affected_rows} bookings with missing provider ID")
+    
+    # Set default status for service providers
+    cursor.execute("UPDATE ServiceProvider SET Status = 'Pending' WHERE Status IS NULL OR Status = ''")
+    
+    # Set default status for bookings
+    cursor.execute("UPDATE Bookings SET Status = 'Pending' WHERE Status IS NULL OR Status = ''")
+    
+    # Set default payment status for bookings
+    cursor.execute("UPDATE Bookings SET PaymentStatus = 'Not Paid' WHERE PaymentStatus IS NULL OR PaymentStatus = ''")
+    
+    # Set default status for payments
+    cursor.execute("UPDATE Payments SET PaymentStatus = 'Success' WHERE PaymentStatus IS NULL OR PaymentStatus = ''")
+    db.commit()
+
+# Indexes for the columns the hot paths filter on: (table, index name, columns)
+HOT_INDEXES = [
+    ('Bookings', 'idx_bookings_customer', ['CustomerID', 'BookingDate']),
+    ('Bookings', 'idx_bookings_provider', ['ProviderID', 'BookingDate', 'BookingTime']),
+    ('Bookings', 'idx_bookings_service', ['S_ID']),
+    ('Payments', 'idx_payments_booking', ['B_ID']),
+    ('Payments', 'idx_payments_provider', ['ProviderID', 'PaymentStatus', 'PaymentDate']),
+    ('Notifications', 'idx_notifications_user', ['U_ID', 'IsRead', 'Timestamp']),
+    ('Invoices', 'idx_invoices_booking', ['B_ID']),
+    ('ServiceProvider', 'idx_serviceprovider_status', ['Status']),
+    ('User', 'idx_user_email', ['Email']),
+]
+
+# Representative hot queries used to verify index use: name -> (sql, sample params)
+HOT_QUERIES = {
+    'customer_bookings': ("SELECT * FROM Bookings WHERE CustomerID = %s", (0,)),
+    'provider_bookings': ("SELECT * FROM Bookings WHERE ProviderID = %s", (0,)),
+    'service_bookings': ("SELECT COUNT(*) FROM Bookings WHERE S_ID = %s", (0,)),
+    'booking_payments': ("SELECT * FROM Payments WHERE B_ID = %s", (0,)),
+    'provider_payments': ("SELECT SUM(Amount) FROM Payments WHERE ProviderID = %s AND PaymentStatus = 'Success'", (0,)),
+    'unread_notifications': ("SELECT COUNT(*) FROM Notifications WHERE U_ID = %s AND N_ID > %s AND IsRead = 0", (0, 0)),
+    'user_notifications': ("SELECT * FROM Notifications WHERE U_ID = %s ORDER BY Timestamp DESC", (0,)),
+    'booking_invoices': ("SELECT * FROM Invoices WHERE B_ID = %s", (0,)),
+    'pending_providers': ("SELECT * FROM ServiceProvider WHERE Status = 'Pending'", ()),
+    'user_by_email': ("SELECT * FROM User WHERE Email = %s", ('',)),
+}
+
+def auto_increment_column(cursor, table):
+    """Name of the table's AUTO_INCREMENT column, or None"""
+    cursor.execute('''
+        SELECT COLUMN_NAME AS name FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND EXTRA LIKE %s
+    ''', (table, '%auto_increment%'))
+    row = cursor.fetchone()
+    return row['name'] if row else None
+
+_id_columns = {}
+
+def table_id_column(cursor, table):
+    """auto_increment_column(), remembered for the life of the process"""
+    if table not in _id_columns:
+        _id_columns[table] = auto_increment_column(cursor, table)
+    return _id_columns[table]
+
+def create_index_if_missing(cursor, table, name, columns, unique=False):
+    """Create an index unless one with the same name already exists"""
+    cursor.execute('''
+        SELECT COUNT(*) AS count FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    ''', (table, name))
+    if cursor.fetchone()['count'] == 0:
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        cursor.execute(f"CREATE {kind} `{name}` ON `{table}` ({', '.join(f'`{c}`' for c in columns)})")
+        print(f"Created index {name} on {table}({', '.join(columns)})")
+        return True
+    return False
+
+def explain_hot_queries(cursor):
+    """Run EXPLAIN on each hot query and return the plan rows by query name"""
+    plans = {}
+    for name, (query, params) in HOT_QUERIES.items():
+        try:
+            cursor.execute('EXPLAIN ' + query, params)
+            plans[name] = [
+                {key: row.get(key) for key in ('table', 'type', 'key', 'rows', 'Extra')}
+                for row in cursor.fetchall()
+            ]
+        except mysql.connector.Error as err:
+            plans[name] = [{'error': str(err)}]
+    return plans
+
+def format_explain_report(before, after=None):
+    """Render EXPLAIN plans as text, side by side when both are given"""
+    def describe(plan):
+        return '; '.join(
+            row.get('error') or f"{row['table']}: type={row['type']} key={row['key']} rows={row['rows']}"
+            for row in plan
+        )
+
+    lines = []
+    for name in HOT_QUERIES:
+        if after is None:
+            lines.append(f"{name}: {describe(before.get(name, []))}")
+        else:
+            lines.append(f"{name}:")
+            lines.append(f"    before: {describe(before.get(name, []))}")
+            lines.append(f"    after:  {describe(after.get(name, []))}")
+    return '\n'.join(lines)
+
+def migrate_hot_indexes(db, cursor):
+    """Create the composite indexes in HOT_INDEXES and report plans before and after"""
+    before = explain_hot_queries(cursor)
+    for table, name, columns in HOT_INDEXES:
+        create_index_if_missing(cursor, table, name, columns)
+    after = explain_hot_queries(cursor)
+    print("EXPLAIN plans for hot queries:")
+    print(format_explain_report(before, after))
+
+def migrate_payment_constraints(db, cursor):
+    """Allow one payment per booking and store idempotency keys for payment submissions"""
+    cursor.execute("SHOW COLUMNS FROM Payments LIKE 'IdempotencyKey'")
+    if not cursor.fetchone():
+        cursor.execute("ALTER TABLE Payments ADD COLUMN IdempotencyKey VARCHAR(64) DEFAULT NULL")
+        print("Added IdempotencyKey column to Payments table")
+
+    cursor.execute('''
+        SELECT COUNT(*) AS count FROM (
+            SELECT B_ID FROM Payments WHERE B_ID IS NOT NULL GROUP BY B_ID HAVING COUNT(*) > 1
+        ) duplicates
+    ''')
+    duplicate_count = cursor.fetchone()['count']
+    if duplicate_count:
+        raise mysql.connector.Error(
+            f"{duplicate_count} bookings have more than one payment. "
+            f"Remove the duplicate Payments rows before applying this migration.")
+
+    create_index_if_missing(cursor, 'Payments', 'uq_payments_booking', ['B_ID'], unique=True)
+    create_index_if_missing(cursor, 'Payments', 'uq_payments_idempotency_key', ['IdempotencyKey'], unique=True)
+
+def migrate_notification_watermarks(db, cursor):
+    """Store a per-user read-up-to notification ID instead of flagging every row"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS NotificationReadState (
+            U_ID INT PRIMARY KEY,
+            ReadUpTo INT NOT NULL DEFAULT 0,
+            UpdatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    ''')
+    # Unread counts scan only the rows above the watermark
+    create_index_if_missing(cursor, 'Notifications', 'idx_notifications_user_id', ['U_ID', 'N_ID'])
+
+def migrate_notification_archive(db, cursor):
+    """Create the archive table that the retention job moves old read notifications into"""
+    cursor.execute("CREATE TABLE IF NOT EXISTS NotificationsArchive LIKE Notifications")
+    cursor.execute("SHOW COLUMNS FROM NotificationsArchive LIKE 'ArchivedAt'")
+    if not cursor.fetchone():
+        cursor.execute("ALTER TABLE NotificationsArchive ADD COLUMN ArchivedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
+        print("Created NotificationsArchive table")
+    create_index_if_missing(cursor, 'Notifications', 'idx_notifications_timestamp', ['Timestamp'])
+
+def migrate_earnings_rollup(db, cursor):
+    """Create the per-provider, per-day earnings rollup and fill it from Payments"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ProviderEarningsDaily (
+            ProviderID INT NOT NULL,
+            Day DATE NOT NULL,
+            Amount DECIMAL(12,2) NOT NULL DEFAULT 0,
+            PaymentCount INT NOT NULL DEFAULT 0,
+            Refunds DECIMAL(12,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (ProviderID, Day)
+        )
+    ''')
+    backfill_earnings_rollup(db, cursor)
+
+def migrate_analytics_tables(db, cursor):
+    """Create the platform analytics summary tables and their refresh watermarks"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS PlatformDailyStats (
+            Day DATE PRIMARY KEY,
+            Bookings INT NOT NULL DEFAULT 0,
+            Cancellations INT NOT NULL DEFAULT 0,
+            GMV DECIMAL(14,2) NOT NULL DEFAULT 0,
+            PaymentCount INT NOT NULL DEFAULT 0,
+            Refunds DECIMAL(14,2) NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ServiceDailyStats (
+            S_ID INT NOT NULL,
+            Day DATE NOT NULL,
+            Bookings INT NOT NULL DEFAULT 0,
+            Revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (S_ID, Day)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS AnalyticsWatermark (
+            Source VARCHAR(32) PRIMARY KEY,
+            LastID INT NOT NULL DEFAULT 0,
+            RefreshedAt TIMESTAMP NULL DEFAULT NULL
+        )
+    ''')
+    # The refresh walks Cancellation by an increasing ID; add one if the table has none
+    if not auto_increment_column(cursor, 'Cancellation'):
+        cursor.execute("ALTER TABLE Cancellation ADD COLUMN C_ID INT NOT NULL AUTO_INCREMENT UNIQUE")
+        print("Added C_ID column to Cancellation table")
+
+def migrate_provider_ratings(db, cursor):
+    """Create the per-provider rating summary and fill it from Reviews"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ProviderRatingSummary (
+            ProviderID INT PRIMARY KEY,
+            ReviewCount INT NOT NULL DEFAULT 0,
+            RatingSum INT NOT NULL DEFAULT 0,
+            Stars1 INT NOT NULL DEFAULT 0,
+            Stars2 INT NOT NULL DEFAULT 0,
+            Stars3 INT NOT NULL DEFAULT 0,
+            Stars4 INT NOT NULL DEFAULT 0,
+            Stars5 INT NOT NULL DEFAULT 0
+        )
+    ''')
+    # Review pages are keyed by an increasing ID; add one if the table has none
+    if not auto_increment_column(cursor, 'Reviews'):
+        cursor.execute("ALTER TABLE Reviews ADD COLUMN R_ID INT NOT NULL AUTO_INCREMENT UNIQUE")
+        print("Added R_ID column to Reviews table")
+    create_index_if_missing(cursor, 'Reviews', 'idx_reviews_provider', ['ProviderID', 'Timestamp'])
+
+    cursor.execute('DELETE FROM ProviderRatingSummary')
+    cursor.execute('''
+        INSERT INTO ProviderRatingSummary
+            (ProviderID, ReviewCount, RatingSum, Stars1, Stars2, Stars3, Stars4, Stars5)
+        SELECT ProviderID, COUNT(*), SUM(Rating),
+               SUM(Rating = 1), SUM(Rating = 2), SUM(Rating = 3), SUM(Rating = 4), SUM(Rating = 5)
+        FROM Reviews
+        WHERE ProviderID IS NOT NULL AND Rating BETWEEN 1 AND 5
+        GROUP BY ProviderID
+    ''')
+    db.commit()
+
+def migrate_cancellation_index(db, cursor):
+    """Index Cancellation.B_ID for the per-booking is_cancelled lookups"""
+    cursor.execute('''
+        SELECT COUNT(*) AS count FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'Cancellation'
+          AND COLUMN_NAME = 'B_ID' AND SEQ_IN_INDEX = 1
+    ''')
+    # A foreign key on B_ID already comes with a usable index
+    if cursor.fetchone()['count'] == 0:
+        create_index_if_missing(cursor, 'Cancellation', 'idx_cancellation_booking', ['B_ID'])
+    db.commit()
+
+def migrate_analytics_settle(db, cursor):
+    """Track the pending analytics upper bound and when it was observed"""
+    cursor.execute("SHOW COLUMNS FROM AnalyticsWatermark LIKE 'PendingID'")
+    if not cursor.fetchone():
+        cursor.execute('''
+            ALTER TABLE AnalyticsWatermark
+                ADD COLUMN PendingID INT NOT NULL DEFAULT 0,
+                ADD COLUMN PendingAt TIMESTAMP NULL DEFAULT NULL
+        ''')
+        print("Added PendingID and PendingAt columns to AnalyticsWatermark table")
+    db.commit()
+
+def migrate_cancellation_unique(db, cursor):
+    """Allow one cancellation record per booking"""
+    cursor.execute('''
+        SELECT COUNT(*) AS count FROM (
+            SELECT B_ID FROM Cancellation WHERE B_ID IS NOT NULL GROUP BY B_ID HAVING COUNT(*) > 1
+        ) duplicates
+    ''')
+    duplicate_count = cursor.fetchone()['count']
+    if duplicate_count:
+        raise mysql.connector.Error(
+            f"{duplicate_count} bookings have more than one cancellation. "
+            f"Remove the duplicate Cancellation rows (and their refunds in ProviderEarningsDaily) "
+            f"before applying this migration.")
+    create_index_if_missing(cursor, 'Cancellation', 'uq_cancellation_booking', ['B_ID'], unique=True)
+    db.commit()
+
+# Ordered schema migrations: (version, description, function(db, cursor))
+MIGRATIONS = [
+    (1, 'Baseline columns and default values', migrate_baseline_schema),
+    (2, 'Indexes for hot lookup columns', migrate_hot_indexes),
+    (3, 'Unique payment per booking and idempotency keys', migrate_payment_constraints),
+    (4, 'Notification read watermarks', migrate_notification_watermarks),
+    (5, 'Notification archive table', migrate_notification_archive),
+    (6, 'Provider earnings rollup', migrate_earnings_rollup),
+    (7, 'Platform analytics summary tables', migrate_analytics_tables),
+    (8, 'Provider rating summary', migrate_provider_ratings),
+    (9, 'Cancellation booking index', migrate_cancellation_index),
+    (10, 'Analytics settle watermark', migrate_analytics_settle),
+    (11, 'Unique cancellation per booking', migrate_cancellation_unique),
+]
+
+LATEST_SCHEMA_VERSION = max(version for version, _, _ in MIGRATIONS)
+
+def run_migrations(db):
+    """Apply pending migrations in order, recording each version in SchemaVersion"""
+    cursor = db.cursor(dictionary=True)
+
+    # Serialize concurrent runners (e.g. several deploy hooks) on a named lock
+    cursor.execute("SELECT GET_LOCK('BookingSystem.migrations', 60) AS acquired")
+    if not cursor.fetchone()['acquired']:
+        cursor.close()
+        raise mysql.connector.Error("Timed out waiting for the migration lock")
+
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS SchemaVersion (
+                Version INT PRIMARY KEY,
+                Description VARCHAR(255),
+                AppliedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('SELECT Version FROM SchemaVersion')
+        applied_versions = {row['Version'] for row in cursor.fetchall()}
+
+        applied = []
+        for version, description, migrate in MIGRATIONS:
+            if version in applied_versions:
+                continue
+            print(f"Applying migration {version}: {description}")
+            migrate(db, cursor)
+            cursor.execute('INSERT INTO SchemaVersion (Version, Description) VALUES (%s, %s)',
+                           (version, description))
+            db.commit()
+            applied.append(version)
+        return applied
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK('BookingSystem.migrations')")
+        cursor.fetchall()
+        cursor.close()
+
+def get_schema_version(db):
+    """Get the highest applied migration version, or 0 if none are recorded"""
+    cursor = db.cursor()
+    try:
+        cursor.execute('SELECT MAX(Version) FROM SchemaVersion')
+        row = cursor.fetchone()
+        return row[0] or 0
+    except mysql.connector.errors.ProgrammingError:
+        # SchemaVersion does not exist yet
+        return 0
+    finally:
+        cursor.close()
+
+def setup_database():
+    """Setup database by applying any pending schema migrations.
+
+    Errors propagate, so a failed or refused migration is never mistaken
+    for success; later migrations are left unapplied.
+    """
+    print("Setting up database...")
+    db = get_db()
+    try:
+        applied = run_migrations(db)
+    finally:
+        db.close()
+    if applied:
+        print(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+    print("Database setup completed successfully")
+
+def check_schema_version():
+    """Warn at startup if the database is behind the code's schema version.
+
+    This is a single primary-key lookup; workers never run DDL themselves.
+    """
+    try:
+        db = get_db()
+        version = get_schema_version(db)
+        if version < LATEST_SCHEMA_VERSION:
+            app.logger.warning("Database schema is at version %s, expected %s. "
+                               "Run 'flask --app app migrate' to apply pending migrations.",
+                               version, LATEST_SCHEMA_VERSION)
+    except mysql.connector.Error as err:
+        app.logger.warning("Schema version check failed: %s", err)
+    finally:
+        if 'db' in locals():
+            db.close()
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending database schema migrations."""
+    try:
+        setup_database()
+    except mysql.connector.Error as err:
+        raise click.ClickException(f"Database setup error: {err}")
+
+@app.cli.command('explain-hot-queries')
+def explain_hot_queries_command():
+    """Print the EXPLAIN plan of each hot query."""
+    db = get_db()
+    try:
+        cursor = db.cursor(dictionary=True)
+        print(format_explain_report(explain_hot_queries(cursor)))
+        cursor.close()
+    finally:
+        db.close()
+
+_schema_checked_pid = None
+
+@app.before_request
+def check_schema_version_once():
+    """Run check_schema_version() on each worker process's first request.
+
+    Checking at import would check a connection out in the master process
+    of a preforking server, and CLI commands have no use for the warning.
+    """
+    global _schema_checked_pid
+    if _schema_checked_pid != os.getpid():
+        _schema_checked_pid = os.getpid()
+        check_schema_version()
+        # Build this worker's search index before its first search needs it
+        search_index.warm()
+        analytics_refresher.ensure_running()
+
+# =====================================================
+# KEYSET PAGINATION
+# =====================================================
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+class QueryArgumentError(ValueError):
+    """A malformed list query parameter (limit, after or sort); answered with 400"""
+
+def encode_cursor(values):
+    """Encode the sort-key values of the last row on a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise QueryArgumentError('Invalid pagination cursor')
+    if not isinstance(values, list) or not all(
+            value is None or isinstance(value, (str, int, float)) for value in values):
+        raise QueryArgumentError('Invalid pagination cursor')
+    return values
+
+def get_page_args():
+    """Read `limit`/`after` from the query string.
+
+    Returns None when the client did not ask for pagination, so list
+    endpoints keep returning a plain array to existing callers.
+    """
+    if 'limit' not in request.args and 'after' not in request.args:
+        return None
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise QueryArgumentError('limit must be an integer')
+    after = request.args.get('after')
+    return {
+        'limit': max(1, min(limit, MAX_PAGE_SIZE)),
+        'after': decode_cursor(after) if after else None,
+    }
+
+# Sort value of a NULL date in keyset pages: before any TIMESTAMP, so last when newest first
+NULL_DATETIME_FLOOR = '1970-01-01 00:00:00'
+
+def paged_query(query, params, keys, page, descending=True, columns='', nullable=()):
+    """Wrap a listing query so it returns one keyset page ordered by `keys`.
+
+    `keys` must be output columns of the query that together form a unique,
+    stable sort key (for example the primary key). One extra row is fetched
+    to tell whether another page follows. `columns` are extra expressions
+    selected over the paged rows (aliased `page`).
+
+    Keys listed in `nullable` are date columns that may be NULL. A NULL
+    compares neither below nor above the cursor, so the listing would stop
+    at the first one; they sort and compare as NULL_DATETIME_FLOOR instead.
+    """
+    if page is None:
+        return query, params
+
+    def sort_key(key):
+        if key in nullable:
+            return f"COALESCE(page.{key}, TIMESTAMP '{NULL_DATETIME_FLOOR}')"
+        return f'page.{key}'
+
+    direction = 'DESC' if descending else 'ASC'
+    where, where_params = '', []
+    if page['after'] is not None:
+        if len(page['after']) != len(keys):
+            raise QueryArgumentError('Invalid pagination cursor')
+        after = [NULL_DATETIME_FLOOR if value is None and key in nullable else value
+                 for key, value in zip(keys, page['after'])]
+        # (k1 < v1) OR (k1 = v1 AND k2 < v2) OR ...
+        op = '<' if descending else '>'
+        terms = []
+        for i, key in enumerate(keys):
+            conditions = [f'{sort_key(k)} = %s' for k in keys[:i]] + [f'{sort_key(key)} {op} %s']
+            terms.append('(' + ' AND '.join(conditions) + ')')
+            where_params.extend(after[:i + 1])
+        where = 'WHERE ' + ' OR '.join(terms)
+
+    order = ', '.join(f'{sort_key(k)} {direction}' for k in keys)
+    return (
+        f"SELECT page.*{', ' + columns if columns else ''} FROM ({query}) AS page {where} ORDER BY {order} LIMIT %s",
+        tuple(params) + tuple(where_params) + (page['limit'] + 1,)
+    )
+
+def split_page(rows, keys, page):
+    """Trim the look-ahead row and build the cursor for the next page"""
+    if page is None or len(rows) <= page['limit']:
+        return rows, None
+    rows = rows[:page['limit']]
+    return rows, encode_cursor([rows[-1][k] for k in keys])
+
+def page_body(items, next_cursor, page):
+    """Response body for a list endpoint: a plain list, or an envelope when paginating"""
+    if page is None:
+        return items
+    return {'items': items, 'next_cursor': next_cursor}
+
+# =====================================================
+# COMPACT ROW RECORDS
+# =====================================================
+
+class Record:
+    """Base for per-query row classes generated by record_class().
+
+    A record keeps one row's values in slots, so a listing of N rows costs
+    N small objects instead of N dicts that each repeat every column name.
+    Records support the mapping access the listing helpers use (row[key],
+    row.get(key), row[key] = value), and orjson serializes them as JSON
+    objects directly since they are dataclasses.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+# The stdlib encoder has no dataclass support
+JSON_CONVERTERS[Record] = Record.as_dict
+
+_record_classes = {}
+
+def record_class(columns, extra=()):
+    """Return the (cached) record class for a query's column names.
+
+    `extra` names fields the caller fills in later, such as display
+    defaults for columns the query may not return. Returns None when the
+    columns cannot be slot names (duplicates or non-identifiers).
+    """
+    fields = tuple(columns) + tuple(name for name in extra if name not in columns)
+    key = (fields, len(columns))
+    if key not in _record_classes:
+        try:
+            _record_classes[key] = dataclasses.make_dataclass(
+                'Row', list(columns) + [(name, object, None) for name in fields[len(columns):]],
+                bases=(Record,), slots=True, eq=False)
+        except (TypeError, ValueError):
+            _record_classes[key] = None
+    return _record_classes[key]
+
+def fetch_records(cursor, extra=()):
+    """Fetch the rows of a tuple cursor as compact records.
+
+    Falls back to dicts when the columns cannot be used as slot names.
+    """
+    columns = cursor.column_names
+    rows = cursor.fetchall()
+    cls = record_class(columns, extra)
+    if cls is None:
+        return [dict(zip(columns, row)) for row in rows]
+    return [cls(*row) for row in rows]
+
+# =====================================================
+# STREAMING EXPORTS
+# =====================================================
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+def generate_export(query, params, fmt):
+    """Yield an export of a query's rows in constant memory.
+
+    Rows are read through an unbuffered cursor, so the server streams them
+    and only EXPORT_BATCH_SIZE rows are held in Python at a time.
+    """
+    db = get_db()
+    cursor = db.cursor(buffered=False)
+    try:
+        cursor.execute(query, params)
+        columns = cursor.column_names
+
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+        elif fmt == 'json':
+            yield '['
+
+        record = record_class(columns)
+        first = True
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            if fmt == 'csv':
+                writer.writerows(
+                    [value if value is None or isinstance(value, (str, int, float)) else json_default(value)
+                     for value in row]
+                    for row in rows
+                )
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                continue
+
+            records = [record(*row) if record else dict(zip(columns, row)) for row in rows]
+            if fmt == 'ndjson':
+                yield '\n'.join(app.json.dumps(item) for item in records) + '\n'
+            else:
+                # One encoder call per batch, without the array brackets
+                yield ('' if first else ',') + app.json.dumps(records)[1:-1]
+            first = False
+
+        if fmt == 'json':
+            yield ']'
+    finally:
+        cursor.close()
+
+def export_response(query, params, fmt, filename):
+    """Stream an export as a chunked response in the requested format"""
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unsupported format '{fmt}'. Use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    response = Response(stream_with_context(generate_export(query, params, fmt)),
+                        mimetype=EXPORT_FORMATS[fmt])
+    if fmt == 'csv':
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}.csv'
+    return response
+
+# =====================================================
+# BOOKING LISTING QUERIES
+# =====================================================
+
+# Display values for listing fields that are NULL
+BOOKING_DEFAULTS = {
+    'Status': 'Pending',
+    'PaymentStatus': 'Not Paid',
+    'BookingDate': 'Not specified',
+    'BookingTime': 'Not specified',
+}
+ADMIN_BOOKING_DEFAULTS = {
+    'Status': 'Pending',
+    'BookingDate': 'Not specified',
+    'BookingTime': 'Not specified',
+}
+PAYMENT_DEFAULTS = {
+    'PaymentStatus': 'Pending',
+    'PaymentDate': 'Not specified',
+    'BookingDate': 'Not specified',
+    'BookingTime': 'Not specified',
+}
+INVOICE_DEFAULTS = {
+    'InvoiceDate': 'Not specified',
+    'BookingDate': 'Not specified',
+}
+
+def booking_flags(alias='b'):
+    """payment_made/is_cancelled (0 or 1) for the booking rows aliased `alias`.
+
+    Each flag is one indexed EXISTS probe per returned row, so the cost
+    follows the number of rows returned, not the size of Payments or
+    Cancellation.
+    """
+    return f'''
+        EXISTS (SELECT 1 FROM Payments pay WHERE pay.B_ID = {alias}.B_ID) AS payment_made,
+        EXISTS (SELECT 1 FROM Cancellation can WHERE can.B_ID = {alias}.B_ID) AS is_cancelled
+    '''
+
+def booking_list_sql(columns='', joins='', where='', flags=True):
+    """Build a booking listing query that carries payment_made/is_cancelled flags"""
+    return f'''
+        SELECT b.*{', ' + columns if columns else ''}{', ' + booking_flags() if flags else ''}
+        FROM Bookings b
+        {joins}
+        {'WHERE ' + where if where else ''}
+    '''
+
+def paged_booking_query(params, page, columns='', joins='', where=''):
+    """A booking_list_sql() listing as one keyset page, newest first.
+
+    The flags are selected by the outer paging query, so they are only
+    looked up for the rows of the page and the inner query stays free of
+    select-list subqueries, which would keep MySQL from merging it.
+    """
+    if page is None:
+        return booking_list_sql(columns, joins, where), params
+    return paged_query(booking_list_sql(columns, joins, where, flags=False), params,
+                       ['B_ID'], page, columns=booking_flags('page'))
+
+# =====================================================
+# SERVICE CATALOG CACHE
+# =====================================================
+
+# Approved services of approved providers: what customers and visitors see
+PUBLIC_CATALOG_SQL = '''
+    SELECT s.*, u.Name as provider_name,
+           ROUND(rs.RatingSum / rs.ReviewCount, 2) as provider_rating,
+           COALESCE(rs.ReviewCount, 0) as provider_review_count
+    FROM Services s
+    JOIN User u ON s.ProviderID = u.U_ID
+    JOIN ServiceProvider sp ON s.ProviderID = sp.U_ID
+    LEFT JOIN ProviderRatingSummary rs ON rs.ProviderID = s.ProviderID
+    WHERE sp.Status = 'Approved' AND (s.is_approved = 1 OR s.is_approved IS NULL)
+'''
+
+CATALOG_SORTS = ('id', 'rating')
+
+class CatalogCache:
+    """The public service catalog, loaded once and kept serialized with its ETag.
+
+    Writers that change what the catalog shows call invalidate(), which bumps
+    the version so the next read reloads it. Other worker processes pick up
+    the change when their copy expires after the TTL.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.version = 0
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        entry = self._entry
+        if entry is None or entry['version'] != self.version or time.monotonic() >= entry['expires_at']:
+            with self._lock:
+                entry = self._entry
+                if entry is None or entry['version'] != self.version or time.monotonic() >= entry['expires_at']:
+                    entry = self._load()
+                    self._entry = entry
+        return entry
+
+    def _load(self):
+        version = self.version
+        db = get_db()
+        cursor = db.cursor(dictionary=True)
+        cursor.execute(PUBLIC_CATALOG_SQL + ' ORDER BY s.S_ID')
+        services = cursor.fetchall()
+        cursor.close()
+        db.close()
+
+        # Ratings are cursor keys, and cursors round-trip through JSON as floats
+        for service in services:
+            if service.get('provider_rating') is not None:
+                service['provider_rating'] = float(service['provider_rating'])
+
+        # Best-rated providers first; unrated services last, then by ID
+        by_rating = sorted(services, key=lambda service: (-(service['provider_rating'] or 0), service['S_ID']))
+
+        body = app.json.dumps(services).encode()
+        return {
+            'version': version,
+            'services': services,
+            'ids': [service['S_ID'] for service in services],
+            'by_rating': by_rating,
+            'rating_keys': [(-(service['provider_rating'] or 0), service['S_ID']) for service in by_rating],
+            'body': body,
+            'etag': hashlib.sha256(body).hexdigest(),
+            'expires_at': time.monotonic() + self.ttl,
+        }
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+
+app.config['CATALOG_CACHE_TTL'] = int(os.environ.get('CATALOG_CACHE_TTL', 60))
+catalog_cache = CatalogCache(ttl=app.config['CATALOG_CACHE_TTL'])
+
+def catalog_response(page, sort='id'):
+    """Serve the public catalog from the cache, answering If-None-Match with 304.
+
+    sort='rating' orders services by their provider's average rating,
+    read from the rating summary joined into the cached rows.
+    """
+    if sort not in CATALOG_SORTS:
+        raise QueryArgumentError(f"sort must be one of: {', '.join(CATALOG_SORTS)}")
+    entry = catalog_cache.get()
+    if page is None and sort == 'id':
+        etag = entry['etag']
+    else:
+        etag = hashlib.sha256(f"{entry['etag']}:{request.query_string.decode()}".encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(catalog_body(entry, page, sort), mimetype='application/json')
+    # Clients may keep the body but must revalidate it with the ETag
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(etag)
+    return response
+
+def catalog_body(entry, page, sort='id'):
+    """The cached catalog body, or one sorted and/or keyset page of it built in memory"""
+    if sort == 'rating':
+        services, keys = entry['by_rating'], entry['rating_keys']
+        if page is None:
+            return app.json.dumps(services).encode()
+        start = 0
+        if page['after'] is not None:
+            if len(page['after']) != 2:
+                raise QueryArgumentError('Invalid pagination cursor')
+            start = bisect.bisect_right(keys, (-(page['after'][0] or 0), page['after'][1]))
+        rows = services[start:start + page['limit'] + 1]
+        services, next_cursor = split_page(rows, ['provider_rating', 'S_ID'], page)
+        return app.json.dumps(page_body(services, next_cursor, page)).encode()
+
+    if page is None:
+        return entry['body']
+    start = 0
+    if page['after'] is not None:
+        if len(page['after']) != 1:
+            raise QueryArgumentError('Invalid pagination cursor')
+        start = bisect.bisect_right(entry['ids'], page['after'][0])
+    rows = entry['services'][start:start + page['limit'] + 1]
+    services, next_cursor = split_page(rows, ['S_ID'], page)
+    return app.json.dumps(page_body(services, next_cursor, page)).encode()
+
+# =====================================================
+# SERVICE SEARCH
+# =====================================================
+
+# Same visibility rules as PUBLIC_CATALOG_SQL, plus the provider's specialization
+SERVICE_SEARCH_SQL = '''
+    SELECT s.*, u.Name as provider_name, sp.Specialization as provider_specialization
+    FROM Services s
+    JOIN User u ON s.ProviderID = u.U_ID
+    JOIN ServiceProvider sp ON s.ProviderID = sp.U_ID
+    WHERE sp.Status = 'Approved' AND (s.is_approved = 1 OR s.is_approved IS NULL)
+'''
+
+SEARCH_TOKEN_RE = re.compile(r'\w+')
+MAX_PREFIX_EXPANSIONS = 50
+# Postings scored per query, shared among its terms; a longer list contributes its highest weights
+SEARCH_POSTINGS_BUDGET = 5000
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+def search_tokens(text):
+    return SEARCH_TOKEN_RE.findall((text or '').lower())
+
+class ServiceSearchIndex:
+    """In-process BM25 inverted index over service name, description and provider specialization.
+
+    The index is built from the database on first use (or by warm(), which
+    each worker calls on its first request) and kept current by the routes
+    that change services, which call refresh_service(), refresh_provider()
+    or remove(). Other worker processes rebuild theirs after the TTL. A
+    rebuild loads and indexes outside the lock in a background thread and
+    then swaps the new index in, so searches keep using the old one until
+    it is ready; changes made meanwhile are replayed onto the new index.
+    The last query term also matches as a prefix, so results appear while
+    the user is still typing.
+
+    Postings store each document's BM25 term weight, computed when the
+    document is added, so a query only multiplies by the term's IDF and sums.
+    Weights of documents added incrementally use the average document length
+    at that time; the periodic rebuild recomputes them all.
+
+    A query scores at most SEARCH_POSTINGS_BUDGET postings. A term whose list
+    is longer than its share contributes only its highest-weight postings,
+    kept sorted per term and updated along with the postings. Broad queries then
+    cost the same as selective ones, at the price of skipping services that
+    match a common term only weakly: they rank below the cut anyway unless
+    other terms lift them, and the total counts only the scored matches.
+    """
+
+    def __init__(self, ttl=300, k1=1.2, b=0.75):
+        self.ttl = ttl
+        self.k1 = k1
+        self.b = b
+        self._clear()
+        self._built = False
+        self._expires_at = 0.0
+        self._reset_locks()
+        os.register_at_fork(after_in_child=self._reset_locks)
+
+    def _clear(self):
+        self._docs = {}        # S_ID -> {'service', 'terms', 'length'}
+        self._facets = {}      # S_ID -> (price, duration), for filtering
+        self._postings = {}    # term -> {S_ID: BM25 term weight}
+        self._terms = []       # sorted vocabulary, for prefix lookups
+        self._impacts = {}     # term -> its top postings [(S_ID, weight)] by weight descending
+        self._total_length = 0
+
+    def _reset_locks(self):
+        # A rebuild running in the parent does not exist in a forked child
+        self._lock = threading.RLock()      # guards the index and _changes
+        self._build_lock = threading.Lock() # one rebuild at a time
+        self._building = False
+        self._changes = None   # (documents, stale_ids) applied during a rebuild
+
+    def _load(self, where='', params=()):
+        db = get_db()
+        cursor = db.cursor(dictionary=True)
+        cursor.execute(SERVICE_SEARCH_SQL + where, params)
+        services = cursor.fetchall()
+        cursor.close()
+        db.close()
+        for service in services:
+            if 'Price' in service:
+                service['Price'] = float(service['Price'])
+        return services
+
+    @staticmethod
+    def _term_frequencies(service):
+        terms = {}
+        for field in ('Name', 'Description', 'provider_specialization'):
+            for token in search_tokens(service.get(field)):
+                terms[token] = terms.get(token, 0) + 1
+        return terms
+
+    def _add(self, service, terms, average_length):
+        length = sum(terms.values())
+        norm = self.k1 * (1 - self.b + self.b * length / (average_length or length or 1))
+        service_id = service['S_ID']
+        self._docs[service_id] = {'service': service, 'terms': terms, 'length': length}
+        self._facets[service_id] = (service.get('Price') or 0, service.get('Duration') or DEFAULT_SERVICE_DURATION)
+        self._total_length += length
+        for term, frequency in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._terms, term)
+            weight = postings[service_id] = frequency * (self.k1 + 1) / (frequency + norm)
+            impacts = self._impacts.get(term)
+            if impacts and weight >= impacts[-1][1]:
+                bisect.insort(impacts, (service_id, weight), key=lambda posting: -posting[1])
+                if len(impacts) > SEARCH_POSTINGS_BUDGET:
+                    impacts.pop()
+
+    def _remove(self, service_id):
+        doc = self._docs.pop(service_id, None)
+        if doc is None:
+            return
+        del self._facets[service_id]
+        self._total_length -= doc['length']
+        for term in doc['terms']:
+            postings = self._postings[term]
+            posting = (service_id, postings.pop(service_id))
+            impacts = self._impacts.get(term)
+            if impacts and posting[1] >= impacts[-1][1] and posting in impacts:
+                impacts.remove(posting)
+            if not postings:
+                self._impacts.pop(term, None)
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def _ensure_built(self):
+        if not self._built:
+            # Nothing to serve yet: build now, or wait for the build in progress
+            with self._build_lock:
+                if not self._built:
+                    self._rebuild()
+        elif time.monotonic() >= self._expires_at:
+            # Keep serving the current index while a fresh one is built
+            self.warm()
+
+    def warm(self):
+        """Rebuild in a background thread if the index is missing or stale"""
+        with self._lock:
+            if self._building or time.monotonic() < self._expires_at:
+                return
+            self._building = True
+        threading.Thread(target=self._rebuild_in_background, name='search-index-rebuild', daemon=True).start()
+
+    def _rebuild_in_background(self):
+        try:
+            with self._build_lock:
+                self._rebuild()
+        except Exception as e:
+            app.logger.error("Error rebuilding search index: %s", e)
+            with self._lock:
+                # Retry on a later search rather than on every one
+                self._expires_at = time.monotonic() + min(self.ttl, 30)
+        finally:
+            with self._lock:
+                self._building = False
+
+    def _rebuild(self):
+        """Build a fresh index outside the lock, then swap it in"""
+        with self._lock:
+            self._changes = []
+        try:
+            documents = [(service, self._term_frequencies(service)) for service in self._load()]
+            total_length = sum(sum(terms.values()) for _, terms in documents)
+            average_length = total_length / len(documents) if documents else 0
+            fresh = object.__new__(type(self))
+            fresh.k1, fresh.b = self.k1, self.b
+            fresh._clear()
+            for service, terms in documents:
+                fresh._add(service, terms, average_length)
+            with self._lock:
+                self._docs, self._facets, self._postings = fresh._docs, fresh._facets, fresh._postings
+                self._terms, self._total_length = fresh._terms, fresh._total_length
+                self._impacts = fresh._impacts
+                for change in self._changes:
+                    self._apply(*change)
+                self._built = True
+                self._expires_at = time.monotonic() + self.ttl
+        finally:
+            with self._lock:
+                self._changes = None
+
+    def _apply(self, documents, stale_ids):
+        for service_id in stale_ids:
+            self._remove(service_id)
+        for service, terms in documents:
+            self._remove(service['S_ID'])
+            average_length = self._total_length / len(self._docs) if self._docs else 0
+            self._add(service, terms, average_length)
+
+    def _replace(self, services, stale_ids):
+        documents = [(service, self._term_frequencies(service)) for service in services]
+        with self._lock:
+            self._apply(documents, stale_ids)
+            if self._changes is not None:
+                # The rebuild in progress may have loaded the service before this change
+                self._changes.append((documents, stale_ids))
+
+    def _tracking(self):
+        # Before the first build starts there is nothing to update: it will load the change
+        return self._built or self._changes is not None
+
+    def refresh_service(self, service_id):
+        """Re-read one service after it was added or edited"""
+        if self._tracking():
+            self._refresh(' AND s.S_ID = %s', service_id, [service_id])
+
+    def refresh_provider(self, provider_id):
+        """Re-read all of a provider's services, e.g. after approval or a profile edit"""
+        if self._tracking():
+            with self._lock:
+                stale_ids = [service_id for service_id, doc in self._docs.items()
+                             if doc['service'].get('ProviderID') == provider_id]
+            self._refresh(' AND s.ProviderID = %s', provider_id, stale_ids)
+
+    def _refresh(self, where, value, stale_ids):
+        # Called after the write committed, so a failure here must not fail the request
+        try:
+            self._replace(self._load(where, (value,)), stale_ids)
+        except Exception as e:
+            app.logger.error("Error updating search index: %s", e)
+            self.invalidate()
+
+    def remove(self, service_id):
+        with self._lock:
+            self._apply([], [service_id])
+            if self._changes is not None:
+                self._changes.append(([], [service_id]))
+
+    def invalidate(self):
+        """Rebuild from the database on the next search, serving the current index until then"""
+        with self._lock:
+            self._expires_at = 0.0
+
+    def _query_terms(self, tokens):
+        """Index terms to score: each token exactly, the last one also as a prefix"""
+        terms = [token for token in tokens[:-1] if token in self._postings]
+        last = tokens[-1]
+        start = bisect.bisect_left(self._terms, last)
+        for term in self._terms[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(last):
+                break
+            terms.append(term)
+        return terms
+
+    def _top_postings(self, term, count):
+        # Updates keep the list exactly the term's top postings, but removals can shorten it
+        impacts = self._impacts.get(term)
+        if impacts is None or len(impacts) < count:
+            impacts = self._impacts[term] = heapq.nlargest(
+                SEARCH_POSTINGS_BUDGET, self._postings[term].items(), key=lambda posting: posting[1])
+        return impacts[:count]
+
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT, min_price=None, max_price=None,
+               min_duration=None, max_duration=None):
+        """Rank matching services by BM25; returns (total matches, top `limit` services with scores)"""
+        tokens = search_tokens(query)
+        if not tokens:
+            return 0, []
+        self._ensure_built()
+
+        with self._lock:
+            doc_count = len(self._docs)
+            scores = {}
+            terms = self._query_terms(tokens)
+            share = SEARCH_POSTINGS_BUDGET // max(len(terms), 1)
+            for term in terms:
+                postings = self._postings[term]
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                if len(postings) > share:
+                    postings = self._top_postings(term, share)
+                else:
+                    postings = postings.items()
+                if not scores:
+                    scores = {service_id: idf * weight for service_id, weight in postings}
+                    continue
+                get_score = scores.get
+                for service_id, weight in postings:
+                    scores[service_id] = get_score(service_id, 0.0) + idf * weight
+
+            hits = scores.items()
+            if any(bound is not None for bound in (min_price, max_price, min_duration, max_duration)):
+                facets = self._facets
+                price_range = (min_price if min_price is not None else -math.inf,
+                               max_price if max_price is not None else math.inf)
+                duration_range = (min_duration if min_duration is not None else -math.inf,
+                                  max_duration if max_duration is not None else math.inf)
+                hits = [
+                    (service_id, score) for service_id, score in hits
+                    if price_range[0] <= facets[service_id][0] <= price_range[1]
+                    and duration_range[0] <= facets[service_id][1] <= duration_range[1]
+                ]
+            top = heapq.nlargest(limit, hits, key=lambda hit: hit[1])
+            return len(hits), [dict(self._docs[service_id]['service'], score=round(score, 4))
+                               for service_id, score in top]
+
+app.config['SEARCH_INDEX_TTL'] = int(os.environ.get('SEARCH_INDEX_TTL', 300))
+search_index = ServiceSearchIndex(ttl=app.config['SEARCH_INDEX_TTL'])
+
+# =====================================================
+# UNREAD NOTIFICATION COUNTERS
+# =====================================================
+
+def get_read_watermark(cursor, user_id):
+    """ID of the newest notification the user has marked read in bulk (0 if none).
+
+    A notification is unread when its N_ID is above the watermark and its
+    IsRead flag, used for individually marked notifications, is still 0.
+    """
+    cursor.execute('SELECT ReadUpTo FROM NotificationReadState WHERE U_ID = %s', (user_id,))
+    row = cursor.fetchone()
+    if not row:
+        return 0
+    return row['ReadUpTo'] if isinstance(row, dict) else row[0]
+
+class LRUCounterBackend:
+    """In-process counter store: bounded LRU of integers that expire after a TTL"""
+
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (int(value), time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def incr(self, key, amount=1):
+        """Add to a cached counter; a missing counter stays missing"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0] + amount, entry[1])
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+# INCRBY only a counter that exists; a missing one is left for the next read to rebuild
+INCR_IF_EXISTS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return nil
+"""
+
+class RedisCounterBackend:
+    """Counter store on any client with Redis' get/set(ex=)/delete and register_script"""
+
+    def __init__(self, client, ttl=300, prefix='unread:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self._incr_if_exists = client.register_script(INCR_IF_EXISTS_SCRIPT)
+
+    def get(self, key):
+        value = self.client.get(self.prefix + str(key))
+        return int(value) if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + str(key), int(value), ex=self.ttl)
+
+    def incr(self, key, amount=1):
+        # One script, so a concurrent set() or expiry cannot land between the check and the INCRBY
+        self._incr_if_exists(keys=[self.prefix + str(key)], args=[amount])
+
+    def delete(self, key):
+        self.client.delete(self.prefix + str(key))
+
+
+class UnreadCounter:
+    """Per-user unread notification counts, rebuilt from the DB on a miss"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def count(self, user_id):
+        try:
+            count = self.backend.get(user_id)
+        except Exception as e:
+            app.logger.error("Error reading unread counter: %s", e)
+            count = None
+        if count is not None:
+            return count
+
+        db = get_db()
+        cursor = db.cursor(dictionary=True)
+        cursor.execute('''
+            SELECT COUNT(*) as count FROM Notifications 
+            WHERE U_ID = %s AND N_ID > %s AND IsRead = 0
+        ''', (user_id, get_read_watermark(cursor, user_id)))
+        result = cursor.fetchone()
+        count = result['count'] if result and 'count' in result else 0
+        cursor.close()
+        db.close()
+
+        self._call('set', user_id, count)
+        return count
+
+    def added(self, user_id, amount=1):
+        self._call('incr', user_id, amount)
+
+    def reset(self, user_id):
+        self._call('set', user_id, 0)
+
+    def invalidate(self, user_id):
+        self._call('delete', user_id)
+
+    def _call(self, method, *args):
+        # The DB stays the source of truth, so a failing cache only costs a rebuild
+        try:
+            getattr(self.backend, method)(*args)
+        except Exception as e:
+            app.logger.error("Error updating unread counter: %s", e)
+
+
+def create_counter_backend():
+    """Use Redis when UNREAD_CACHE_URL is set and redis-py is installed"""
+    ttl = app.config['UNREAD_CACHE_TTL']
+    url = app.config['UNREAD_CACHE_URL']
+    if url:
+        try:
+            import redis
+            return RedisCounterBackend(redis.Redis.from_url(url), ttl=ttl)
+        except ImportError:
+            app.logger.warning("UNREAD_CACHE_URL is set but redis is not installed; using the in-process cache")
+    if int(os.environ.get('WEB_CONCURRENCY', 1)) > 1:
+        # Each worker would cache its own counts and miss the others' updates
+        app.logger.warning("Running %s workers with the in-process unread cache; set UNREAD_CACHE_URL to share "
+                           "counts, or counts may be stale for up to %s seconds", os.environ['WEB_CONCURRENCY'], ttl)
+    return LRUCounterBackend(max_entries=app.config['UNREAD_CACHE_SIZE'], ttl=ttl)
+
+app.config['UNREAD_CACHE_URL'] = os.environ.get('UNREAD_CACHE_URL')
+app.config['UNREAD_CACHE_TTL'] = int(os.environ.get('UNREAD_CACHE_TTL', 300))
+app.config['UNREAD_CACHE_SIZE'] = int(os.environ.get('UNREAD_CACHE_SIZE', 10000))
+unread_counter = UnreadCounter(create_counter_backend())
+
+# =====================================================
+# NOTIFICATION EVENTS
+# =====================================================
+
+SSE_KEEPALIVE_SECONDS = 25
+# Each process checks Notifications for other processes' writes this often
+# while it has open streams (see NotificationPoller)
+app.config['SSE_POLL_SECONDS'] = float(os.environ.get('SSE_POLL_SECONDS', 5))
+# Streams end after this long and the browser reconnects with Last-Event-ID,
+# so a stream never holds a worker indefinitely
+app.config['SSE_MAX_SECONDS'] = float(os.environ.get('SSE_MAX_SECONDS', 300))
+SSE_BATCH_SIZE = 100
+
+class NotificationBus:
+    """In-process pub/sub of new notifications, keyed by user ID.
+
+    Each open event stream holds a bounded queue. Publishing never blocks:
+    if a slow client's queue is full, the event is dropped for that
+    client. Events only reach streams connected to this worker process,
+    so streams use them only as a wake-up; the rows themselves are read
+    from Notifications (see fetch_notifications_after). Writes made by
+    other processes are published here by NotificationPoller.
+    """
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        events = queue.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(events)
+        return events
+
+    def unsubscribe(self, user_id, events):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers:
+                subscribers.discard(events)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for events in subscribers:
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                pass
+
+notification_bus = NotificationBus()
+
+class NotificationPoller:
+    """One thread per process that wakes streams for notifications written by any process.
+
+    While the process has open streams, it asks every `interval` seconds
+    which users have notifications above the highest N_ID it has seen
+    (one range scan of the primary key, however many streams are open)
+    and publishes a wake-up for each of them on the bus. Streams read their
+    rows only after a wake-up, so an idle stream costs no queries.
+
+    Like NotificationDispatcher's writer, the thread is started on first
+    use in each process, so forking servers get one per worker.
+    """
+
+    def __init__(self, bus, interval=5):
+        self.bus = bus
+        self.interval = interval
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def ensure_running(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name='notification-poller', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        last_id = None
+        while True:
+            time.sleep(self.interval)
+            if not self.bus.has_subscribers():
+                # Start again from the newest row once a stream connects
+                last_id = None
+                continue
+            try:
+                last_id = self.poll(last_id)
+            except Exception as e:
+                app.logger.error("Error polling notifications: %s", e)
+
+    def poll(self, last_id):
+        """Wake the streams of users with notifications above last_id; returns the new high mark"""
+        db = get_pool().acquire()
+        try:
+            cursor = db.cursor(dictionary=True)
+            if last_id is None:
+                cursor.execute('SELECT COALESCE(MAX(N_ID), 0) AS last_id FROM Notifications')
+                last_id = cursor.fetchone()['last_id']
+            else:
+                cursor.execute('''
+                    SELECT U_ID, MAX(N_ID) AS last_id FROM Notifications
+                    WHERE N_ID > %s
+                    GROUP BY U_ID
+                ''', (last_id,))
+                for row in cursor.fetchall():
+                    self.bus.publish(row['U_ID'], {'N_ID': row['last_id']})
+                    last_id = max(last_id, row['last_id'])
+            cursor.close()
+        finally:
+            db.close()
+        return last_id
+
+notification_poller = NotificationPoller(notification_bus, interval=app.config['SSE_POLL_SECONDS'])
+
+def fetch_notifications_after(user_id, last_id):
+    """Return the user's notifications with N_ID > last_id, oldest first.
+
+    Uses its own short-lived pool connection, so an open event stream does
+    not keep a connection checked out between polls.
+    """
+    db = get_pool().acquire()
+    try:
+        cursor = db.cursor(dictionary=True)
+        if last_id is None:
+            cursor.execute('SELECT COALESCE(MAX(N_ID), 0) AS last_id FROM Notifications WHERE U_ID = %s',
+                           (user_id,))
+            last_id = cursor.fetchone()['last_id']
+            rows = []
+        else:
+            cursor.execute('''
+                SELECT N_ID, Message, Timestamp FROM Notifications
+                WHERE U_ID = %s AND N_ID > %s
+                ORDER BY N_ID
+                LIMIT %s
+            ''', (user_id, last_id, SSE_BATCH_SIZE))
+            rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        db.close()
+    return (rows[-1]['N_ID'] if rows else last_id), rows
+
+def publish_notifications(notifications):
+    """Count committed (user_id, message) notifications as unread and push them to open event streams"""
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    for user_id, message in notifications:
+        if user_id:
+            unread_counter.added(user_id)
+            notification_bus.publish(user_id, {'Message': message, 'Timestamp': timestamp})
+
+INSERT_NOTIFICATIONS_SQL = 'INSERT INTO Notifications (U_ID, Message) VALUES (%s, %s)'
+
+class NotificationDispatcher:
+    """Writes fan-outs of (user_id, message) notifications with one multi-row INSERT.
+
+    Routes call stage() inside their transaction and committed() after
+    db.commit(). Synchronously, stage() writes the rows with the
+    transaction and committed() publishes them. In background mode,
+    stage() writes nothing and committed() queues the rows for a writer
+    thread that batches them into its own transactions, keeping the
+    inserts off the request's critical path. If the queue is full, the
+    rows are written inline instead.
+
+    The writer thread is started by the first committed() in each process,
+    so servers that fork workers after importing the app get a writer in
+    every worker rather than one stranded in the parent.
+    """
+
+    def __init__(self, max_queue_size=1000, batch_size=500, flush_interval=0.5, background=False):
+        self.background = background
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._atexit_registered = False
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # A forked child inherits neither the parent's thread nor its queued rows
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def stage(self, cursor, notifications):
+        notifications = [(user_id, message) for user_id, message in notifications if user_id]
+        if notifications and not self.background:
+            cursor.executemany(INSERT_NOTIFICATIONS_SQL, notifications)
+        return notifications
+
+    def committed(self, notifications):
+        if not self.background:
+            publish_notifications(notifications)
+            return
+        self._ensure_writer()
+        for notification in notifications:
+            try:
+                self._queue.put_nowait(notification)
+            except queue.Full:
+                self._write([notification])
+
+    def _ensure_writer(self):
+        """Start this process' writer thread if it is not running yet"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='notification-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            if not self._atexit_registered:
+                # Inherited by forked children, where stop() flushes their own queue
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def stop(self, timeout=10):
+        """Stop this process' background writer after flushing everything queued"""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        self._stopping.set()
+        thread.join(timeout)
+        self._thread = None
+        self._pid = None
+        self._flush()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _flush(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+    def _write(self, notifications):
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            cursor.executemany(INSERT_NOTIFICATIONS_SQL, notifications)
+            db.commit()
+            cursor.close()
+            db.close()
+            publish_notifications(notifications)
+        except Exception as e:
+            app.logger.error("Error writing %d notifications: %s", len(notifications), e)
+
+app.config['NOTIFICATION_ASYNC'] = os.environ.get('NOTIFICATION_ASYNC', '0') == '1'
+app.config['NOTIFICATION_QUEUE_SIZE'] = int(os.environ.get('NOTIFICATION_QUEUE_SIZE', 1000))
+notification_dispatcher = NotificationDispatcher(max_queue_size=app.config['NOTIFICATION_QUEUE_SIZE'],
+                                                 background=app.config['NOTIFICATION_ASYNC'])
+
+# =====================================================
+# NOTIFICATION RETENTION
+# =====================================================
+
+# Notifications carry no type column, so they are classified by message text.
+# The first matching type wins; anything unmatched is 'other'.
+NOTIFICATION_TYPES = [
+    ('payment', ['%payment%', '%invoice%']),
+    ('booking', ['%booking%']),
+    ('account', ['%service provider%', '%service has been%']),
+]
+
+# Days a read notification of each type is kept before it is archived
+DEFAULT_NOTIFICATION_RETENTION_DAYS = {'payment': 365, 'booking': 180, 'account': 90, 'other': 90}
+
+def parse_retention_days(value):
+    """Parse overrides such as 'payment=730,other=30' on top of the defaults"""
+    retention = dict(DEFAULT_NOTIFICATION_RETENTION_DAYS)
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        name, _, days = item.partition('=')
+        if name.strip() not in retention or not days.strip().isdigit():
+            raise ValueError(f"Invalid notification retention setting: {item}")
+        retention[name.strip()] = int(days)
+    return retention
+
+app.config['NOTIFICATION_RETENTION_DAYS'] = parse_retention_days(os.environ.get('NOTIFICATION_RETENTION_DAYS'))
+
+def notification_type_condition(type_name):
+    """SQL condition (and params) matching the notifications of one type"""
+    clauses = []
+    params = []
+    for name, patterns in NOTIFICATION_TYPES:
+        matches = '(' + ' OR '.join(['n.Message LIKE %s'] * len(patterns)) + ')'
+        if name == type_name:
+            return ' AND '.join(clauses + [matches]), params + patterns
+        # Exclude rows already claimed by an earlier type
+        clauses.append(f'NOT {matches}')
+        params.extend(patterns)
+    return ' AND '.join(clauses), params
+
+def archive_notifications(db, retention_days, batch_size=1000, pause=0.1, dry_run=False):
+    """Move read notifications older than their type's retention into NotificationsArchive.
+
+    Rows move in primary-key order, in batches of batch_size. Each batch is
+    its own short transaction, followed by a pause so other writers are not
+    starved of row locks. Returns {type: (rows, seconds)}.
+    """
+    cursor = db.cursor(dictionary=True)
+    results = {}
+    try:
+        for type_name, days in retention_days.items():
+            condition, params = notification_type_condition(type_name)
+            cutoff = datetime.now() - timedelta(days=days)
+            moved = 0
+            last_id = 0
+            started = time.monotonic()
+            while True:
+                cursor.execute(f'''
+                    SELECT n.N_ID FROM Notifications n
+                    LEFT JOIN NotificationReadState r ON r.U_ID = n.U_ID
+                    WHERE n.N_ID > %s AND n.Timestamp < %s
+                        AND (n.IsRead = 1 OR n.N_ID <= COALESCE(r.ReadUpTo, 0))
+                        AND {condition}
+                    ORDER BY n.N_ID
+                    LIMIT %s
+                ''', (last_id, cutoff, *params, batch_size))
+                ids = [row['N_ID'] for row in cursor.fetchall()]
+                if not ids:
+                    break
+                last_id = ids[-1]
+
+                if not dry_run:
+                    placeholders = ', '.join(['%s'] * len(ids))
+                    cursor.execute(f'''
+                        INSERT IGNORE INTO NotificationsArchive
+                        SELECT n.*, NOW() FROM Notifications n WHERE n.N_ID IN ({placeholders})
+                    ''', ids)
+                    cursor.execute(f'DELETE FROM Notifications WHERE N_ID IN ({placeholders})', ids)
+                    db.commit()
+                moved += len(ids)
+
+                if len(ids) < batch_size:
+                    break
+                if pause:
+                    time.sleep(pause)
+            results[type_name] = (moved, time.monotonic() - started)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    return results
+
+@app.cli.command('archive-notifications')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows moved per transaction.')
+@click.option('--pause', default=0.1, show_default=True, help='Seconds to sleep between batches.')
+@click.option('--dry-run', is_flag=True, help='Count the rows that would move without moving them.')
+def archive_notifications_command(batch_size, pause, dry_run):
+    """Archive old read notifications according to NOTIFICATION_RETENTION_DAYS."""
+    retention_days = app.config['NOTIFICATION_RETENTION_DAYS']
+    db = get_db()
+    try:
+        results = archive_notifications(db, retention_days, batch_size=batch_size, pause=pause, dry_run=dry_run)
+    finally:
+        db.close()
+
+    verb = 'Would archive' if dry_run else 'Archived'
+    total_rows = 0
+    total_seconds = 0.0
+    for type_name, (rows, seconds) in results.items():
+        rate = rows / seconds if seconds else 0.0
+        print(f"{verb} {rows} '{type_name}' notifications older than "
+              f"{retention_days[type_name]} days in {seconds:.2f}s ({rate:.0f} rows/s)")
+        total_rows += rows
+        total_seconds += seconds
+    rate = total_rows / total_seconds if total_seconds else 0.0
+    print(f"{verb} {total_rows} notifications in {total_seconds:.2f}s ({rate:.0f} rows/s)")
+
+# =====================================================
+# SLOT RESERVATION
+# =====================================================
+
+DEFAULT_SERVICE_DURATION = 60  # minutes, matches the Services.Duration column default
+
+class SlotUnavailableError(Exception):
+    """Raised when a booking cannot be placed in the requested slot"""
+
+    def __init__(self, message, status_code=409):
+        super().__init__(message)
+        self.status_code = status_code
+
+def parse_time_of_day(value):
+    """Parse 'HH:MM' or 'HH:MM:SS' into a timedelta since midnight"""
+    for fmt in ('%H:%M', '%H:%M:%S'):
+        try:
+            parsed = datetime.strptime(value, fmt)
+            return timedelta(hours=parsed.hour, minutes=parsed.minute, seconds=parsed.second)
+        except (TypeError, ValueError):
+            continue
+    raise SlotUnavailableError(f"Invalid time '{value}'", status_code=400)
+
+def parse_booking_date(value):
+    """Parse a 'YYYY-MM-DD' booking date"""
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise SlotUnavailableError(f"Invalid date '{value}', expected YYYY-MM-DD", status_code=400)
+
+def reserve_booking_slot(cursor, customer_id, service_id, booking_date, booking_time):
+    """Insert a Pending booking if the service's provider is free for the whole slot.
+
+    Must run inside the caller's transaction. The provider's ServiceProvider
+    row is locked first, so concurrent reservations for one provider are
+    serialized. The overlap check is a locking read, so it sees bookings
+    committed by whoever held the lock before us. Returns (booking_id,
+    provider_id).
+    """
+    start = parse_time_of_day(booking_time)
+
+    cursor.execute('''
+        SELECT S_ID, ProviderID, COALESCE(Duration, %s) AS Duration
+        FROM Services
+        WHERE S_ID = %s
+    ''', (DEFAULT_SERVICE_DURATION, service_id))
+    service = cursor.fetchone()
+    if not service:
+        raise SlotUnavailableError('Service not found', status_code=404)
+    if not service['ProviderID']:
+        raise SlotUnavailableError('No service providers available', status_code=400)
+
+    cursor.execute('''
+        SELECT Status FROM ServiceProvider WHERE U_ID = %s FOR UPDATE
+    ''', (service['ProviderID'],))
+    provider = cursor.fetchone()
+    if not provider or provider['Status'] != 'Approved':
+        raise SlotUnavailableError('No service providers available', status_code=400)
+
+    end = start + timedelta(minutes=int(service['Duration']))
+    cursor.execute('''
+        SELECT b.B_ID
+        FROM Bookings b
+        JOIN Services s ON b.S_ID = s.S_ID
+        WHERE b.ProviderID = %s
+          AND b.BookingDate = %s
+          AND b.Status != 'Cancelled'
+          AND b.BookingTime < %s
+          AND ADDTIME(b.BookingTime, SEC_TO_TIME(COALESCE(s.Duration, %s) * 60)) > %s
+        LIMIT 1
+        FOR UPDATE
+    ''', (service['ProviderID'], booking_date, end, DEFAULT_SERVICE_DURATION, start))
+    if cursor.fetchone():
+        raise SlotUnavailableError('This time slot is already booked. Please choose another time.')
+
+    cursor.execute('''
+        INSERT INTO Bookings (CustomerID, ProviderID, S_ID, BookingDate, BookingTime, Status)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    ''', (customer_id, service['ProviderID'], service_id, booking_date, start, 'Pending'))
+    return cursor.lastrowid, service['ProviderID']
+
+# =====================================================
+# PROVIDER AVAILABILITY
+# =====================================================
+
+# Working hours used to derive free slots, in minutes since midnight
+app.config['AVAILABILITY_DAY_START'] = int(os.environ.get('AVAILABILITY_DAY_START', 9 * 60))
+app.config['AVAILABILITY_DAY_END'] = int(os.environ.get('AVAILABILITY_DAY_END', 18 * 60))
+app.config['AVAILABILITY_CACHE_TTL'] = int(os.environ.get('AVAILABILITY_CACHE_TTL', 60))
+MAX_AVAILABILITY_DAYS = 60
+
+class AvailabilityCache:
+    """Busy intervals per (provider, day), kept as sorted, merged lists.
+
+    Each entry is a list of disjoint (start, end) minute pairs sorted by
+    start, so a slot check is one bisect. Entries are loaded from Bookings
+    in one range query per miss and dropped when a booking for that
+    provider and day is created or cancelled. The TTL bounds staleness
+    from writes made by other worker processes.
+    """
+
+    def __init__(self, ttl=60, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _merge(intervals):
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def _load(self, provider_id, first_day, last_day):
+        db = get_db()
+        cursor = db.cursor()
+        cursor.execute('''
+            SELECT b.BookingDate, b.BookingTime, COALESCE(s.Duration, %s)
+            FROM Bookings b
+            JOIN Services s ON b.S_ID = s.S_ID
+            WHERE b.ProviderID = %s
+              AND b.BookingDate BETWEEN %s AND %s
+              AND b.Status != 'Cancelled'
+        ''', (DEFAULT_SERVICE_DURATION, provider_id, first_day, last_day))
+        by_day = {}
+        for booking_date, booking_time, duration in cursor.fetchall():
+            if booking_time is None:
+                continue
+            start = int(booking_time.total_seconds() // 60)
+            by_day.setdefault(booking_date, []).append((start, start + int(duration)))
+        cursor.close()
+        db.close()
+        return by_day
+
+    def busy(self, provider_id, days):
+        """Return {day: merged busy intervals} for the given days"""
+        now = time.monotonic()
+        result, missing = {}, []
+        with self._lock:
+            for day in days:
+                entry = self._entries.get((provider_id, day))
+                if entry and now - entry[1] < self.ttl:
+                    self._entries.move_to_end((provider_id, day))
+                    result[day] = entry[0]
+                else:
+                    missing.append(day)
+
+        if missing:
+            loaded = self._load(provider_id, min(missing), max(missing))
+            with self._lock:
+                for day in missing:
+                    intervals = self._merge(loaded.get(day, []))
+                    self._entries[(provider_id, day)] = (intervals, now)
+                    result[day] = intervals
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return result
+
+    def invalidate(self, provider_id, day):
+        if isinstance(day, str):
+            day = date.fromisoformat(day)
+        elif isinstance(day, datetime):
+            day = day.date()
+        with self._lock:
+            self._entries.pop((provider_id, day), None)
+
+availability_cache = AvailabilityCache(ttl=app.config['AVAILABILITY_CACHE_TTL'])
+
+def is_slot_free(busy, start, end):
+    """Check [start, end) against merged, sorted busy intervals"""
+    i = bisect.bisect_left(busy, (end,))
+    return i == 0 or busy[i - 1][1] <= start
+
+def free_intervals(busy, day_start, day_end):
+    """Gaps between busy intervals within working hours"""
+    free, cursor_at = [], day_start
+    for start, end in busy:
+        if start > cursor_at:
+            free.append((cursor_at, min(start, day_end)))
+        cursor_at = max(cursor_at, end)
+        if cursor_at >= day_end:
+            break
+    if cursor_at < day_end:
+        free.append((cursor_at, day_end))
+    return [(start, end) for start, end in free if end > start]
+
+def format_minutes(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+# =====================================================
+# EARNINGS ROLLUP
+# =====================================================
+
+# ProviderEarningsDaily holds, per provider and day, the sum and count of
+# successful payments (attributed through Bookings.ProviderID, like the
+# earnings endpoints always have) and the refunds granted on cancellation.
+# Writers update it in the same transaction as the Payments/Cancellation row.
+
+def add_provider_earnings(cursor, provider_id, day, amount=0, payment_count=0, refunds=0):
+    """Add to (or, with negative values, subtract from) one provider's rollup row for a day"""
+    if not provider_id or not day:
+        return
+    cursor.execute('''
+        INSERT INTO ProviderEarningsDaily (ProviderID, Day, Amount, PaymentCount, Refunds)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            Amount = Amount + VALUES(Amount),
+            PaymentCount = PaymentCount + VALUES(PaymentCount),
+            Refunds = Refunds + VALUES(Refunds)
+    ''', (provider_id, day, amount, payment_count, refunds))
+
+# Raw per-provider, per-day sums the rollup must match
+RAW_EARNINGS_SQL = '''
+    SELECT b.ProviderID, p.PaymentDate AS Day, SUM(p.Amount) AS Amount, COUNT(*) AS PaymentCount, 0 AS Refunds
+    FROM Payments p
+    JOIN Bookings b ON p.B_ID = b.B_ID
+    WHERE p.PaymentStatus = 'Success' AND b.ProviderID IS NOT NULL AND p.PaymentDate IS NOT NULL
+    GROUP BY b.ProviderID, p.PaymentDate
+'''
+RAW_REFUNDS_SQL = '''
+    SELECT b.ProviderID, DATE(c.Date) AS Day, 0 AS Amount, 0 AS PaymentCount, SUM(c.RefundAmount) AS Refunds
+    FROM Cancellation c
+    JOIN Bookings b ON c.B_ID = b.B_ID
+    WHERE c.RefundAmount > 0 AND b.ProviderID IS NOT NULL AND c.Date IS NOT NULL
+    GROUP BY b.ProviderID, DATE(c.Date)
+'''
+
+def backfill_earnings_rollup(db, cursor):
+    """Rebuild ProviderEarningsDaily from Payments and Cancellation in one transaction"""
+    cursor.execute('DELETE FROM ProviderEarningsDaily')
+    cursor.execute('''
+        INSERT INTO ProviderEarningsDaily (ProviderID, Day, Amount, PaymentCount, Refunds)
+    ''' + RAW_EARNINGS_SQL)
+    cursor.execute('''
+        INSERT INTO ProviderEarningsDaily (ProviderID, Day, Amount, PaymentCount, Refunds)
+        SELECT * FROM (''' + RAW_REFUNDS_SQL + ''') AS refunds
+        ON DUPLICATE KEY UPDATE Refunds = VALUES(Refunds)
+    ''')
+    db.commit()
+    cursor.execute('SELECT COUNT(*) AS count FROM ProviderEarningsDaily')
+    print(f"Rebuilt earnings rollup: {cursor.fetchone()['count']} provider-days")
+
+def find_earnings_mismatches(cursor):
+    """Compare the rollup with raw Payments/Cancellation; returns the differing provider-days"""
+    expected = {}
+    for query in (RAW_EARNINGS_SQL, RAW_REFUNDS_SQL):
+        cursor.execute(query)
+        for row in cursor.fetchall():
+            totals = expected.setdefault((row['ProviderID'], row['Day']), [Decimal('0'), 0, Decimal('0')])
+            totals[0] += Decimal(row['Amount'])
+            totals[1] += int(row['PaymentCount'])
+            totals[2] += Decimal(row['Refunds'])
+
+    cursor.execute('SELECT ProviderID, Day, Amount, PaymentCount, Refunds FROM ProviderEarningsDaily')
+    actual = {
+        (row['ProviderID'], row['Day']): [Decimal(row['Amount']), int(row['PaymentCount']), Decimal(row['Refunds'])]
+        for row in cursor.fetchall()
+    }
+
+    mismatches = []
+    zero = [Decimal('0'), 0, Decimal('0')]
+    for key in sorted(set(expected) | set(actual), key=lambda k: (k[0], str(k[1]))):
+        if expected.get(key, zero) != actual.get(key, zero):
+            mismatches.append({'provider_id': key[0], 'day': key[1],
+                               'expected': expected.get(key, zero), 'actual': actual.get(key, zero)})
+    return mismatches
+
+@app.cli.command('backfill-earnings')
+def backfill_earnings_command():
+    """Rebuild the provider earnings rollup from Payments and Cancellation."""
+    db = get_db()
+    try:
+        cursor = db.cursor(dictionary=True)
+        backfill_earnings_rollup(db, cursor)
+        cursor.close()
+    finally:
+        db.close()
+
+@app.cli.command('check-earnings')
+def check_earnings_command():
+    """Compare the provider earnings rollup with raw Payments; exits 1 on mismatch."""
+    db = get_db()
+    try:
+        cursor = db.cursor(dictionary=True)
+        mismatches = find_earnings_mismatches(cursor)
+        cursor.close()
+    finally:
+        db.close()
+
+    for mismatch in mismatches:
+        amount, count, refunds = mismatch['expected']
+        rollup_amount, rollup_count, rollup_refunds = mismatch['actual']
+        print(f"Provider {mismatch['provider_id']} on {mismatch['day']}: "
+              f"payments {amount} ({count}) vs rollup {rollup_amount} ({rollup_count}), "
+              f"refunds {refunds} vs rollup {rollup_refunds}")
+    if mismatches:
+        print(f"{len(mismatches)} provider-days differ; run 'flask --app app backfill-earnings' to rebuild")
+        sys.exit(1)
+    print("Earnings rollup matches Payments")
+
+# Where earnings summaries come from: the daily rollup, or raw Payments
+app.config['EARNINGS_SOURCE'] = os.environ.get('EARNINGS_SOURCE', 'rollup')
+
+def provider_earnings_summary(cursor, provider_id, pending_status=None, recent_limit=0):
+    """Total, current-month and pending earnings for a provider in a single query.
+
+    Pending is the price of the provider's unpaid, non-cancelled bookings,
+    or only those with `pending_status` when given. With recent_limit, the
+    provider's latest payments are fetched too, as 'recent_payments'.
+    """
+    current_month = datetime.now().strftime('%Y-%m-01')
+    pending_condition = "b.Status = %s" if pending_status else "b.Status != 'Cancelled'"
+    pending_params = (pending_status,) if pending_status else ()
+
+    if app.config['EARNINGS_SOURCE'] == 'payments':
+        # One pass over the provider's bookings with their (at most one) payment
+        cursor.execute(f'''
+            SELECT COALESCE(SUM(CASE WHEN p.PaymentStatus = 'Success' THEN p.Amount END), 0) AS total_earnings,
+                   COALESCE(SUM(CASE WHEN p.PaymentStatus = 'Success' AND p.PaymentDate >= %s
+                                     THEN p.Amount END), 0) AS month_earnings,
+                   COALESCE(SUM(CASE WHEN b.PaymentStatus = 'Not Paid' AND {pending_condition}
+                                     THEN s.Price END), 0) AS pending_amount
+            FROM Bookings b
+            LEFT JOIN Services s ON b.S_ID = s.S_ID
+            LEFT JOIN Payments p ON p.B_ID = b.B_ID
+            WHERE b.ProviderID = %s
+        ''', (current_month, *pending_params, provider_id))
+    else:
+        cursor.execute(f'''
+            SELECT COALESCE(SUM(e.Amount), 0) AS total_earnings,
+                   COALESCE(SUM(CASE WHEN e.Day >= %s THEN e.Amount END), 0) AS month_earnings,
+                   (SELECT COALESCE(SUM(s.Price), 0)
+                    FROM Bookings b
+                    JOIN Services s ON b.S_ID = s.S_ID
+                    WHERE b.ProviderID = %s AND b.PaymentStatus = 'Not Paid' AND {pending_condition}
+                   ) AS pending_amount
+            FROM ProviderEarningsDaily e
+            WHERE e.ProviderID = %s
+        ''', (current_month, provider_id, *pending_params, provider_id))
+
+    row = cursor.fetchone() or {}
+    summary = {
+        'total_earnings': float(row.get('total_earnings') or 0),
+        'month_earnings': float(row.get('month_earnings') or 0),
+        'pending_amount': float(row.get('pending_amount') or 0),
+    }
+
+    if recent_limit:
+        cursor.execute('''
+            SELECT p.P_ID, p.Amount, p.PaymentDate, p.PaymentMethod, p.PaymentStatus,
+                   b.B_ID, s.Name as service_name, c.Name as customer_name
+            FROM Payments p
+            JOIN Bookings b ON p.B_ID = b.B_ID
+            JOIN Services s ON b.S_ID = s.S_ID
+            JOIN User c ON b.CustomerID = c.U_ID
+            WHERE b.ProviderID = %s
+            ORDER BY p.PaymentDate DESC
+            LIMIT %s
+        ''', (provider_id, recent_limit))
+        summary['recent_payments'] = cursor.fetchall()
+
+    return summary
+
+# =====================================================
+# EARNINGS SERIES
+# =====================================================
+
+SERIES_GRANULARITIES = ('day', 'week', 'month')
+MAX_SERIES_BUCKETS = 3700
+MAX_MOVING_AVERAGE = 365
+
+def series_bucket_starts(start, end, granularity):
+    """First day of every bucket covering start..end; weeks start on Monday"""
+    if granularity == 'day':
+        first, step = start, timedelta(days=1)
+    elif granularity == 'week':
+        first, step = start - timedelta(days=start.weekday()), timedelta(days=7)
+    else:
+        starts = []
+        year, month = start.year, start.month
+        while date(year, month, 1) <= end:
+            starts.append(date(year, month, 1))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return starts
+    return [first + step * n for n in range((end - first) // step + 1)]
+
+def bucket_totals(days, amounts, bucket_starts):
+    """Sum amounts into the buckets that start at bucket_starts (sorted)"""
+    if np is not None:
+        edges = np.array(bucket_starts, dtype='datetime64[D]')
+        index = np.searchsorted(edges, np.array(days, dtype='datetime64[D]'), side='right') - 1
+        return np.bincount(index, weights=np.array(amounts, dtype=float), minlength=len(edges)).tolist()
+
+    totals = [0.0] * len(bucket_starts)
+    for day, amount in zip(days, amounts):
+        totals[bisect.bisect_right(bucket_starts, day) - 1] += float(amount)
+    return totals
+
+def moving_average(values, window):
+    """Trailing mean over `window` buckets; None until a full window is available"""
+    if window <= 1 or not values:
+        return list(values)
+    if window > len(values):
+        return [None] * len(values)
+    if np is not None:
+        means = np.convolve(values, np.ones(window) / window, mode='valid').tolist()
+    else:
+        means = []
+        running = sum(values[:window - 1])
+        for n in range(window - 1, len(values)):
+            running += values[n]
+            means.append(running / window)
+            running -= values[n - window + 1]
+    return [None] * (len(values) - len(means)) + means
+
+def parse_series_args(args):
+    """Read start/end/granularity/moving_average query parameters, raising ValueError"""
+    end = date.fromisoformat(args['end']) if args.get('end') else date.today()
+    start = date.fromisoformat(args['start']) if args.get('start') else end - timedelta(days=89)
+    granularity = args.get('granularity', 'day')
+    window = args.get('moving_average', 1, type=int)
+    if start > end:
+        raise ValueError('start must not be after end')
+    if granularity not in SERIES_GRANULARITIES:
+        raise ValueError(f"granularity must be one of: {', '.join(SERIES_GRANULARITIES)}")
+    if not 1 <= window <= MAX_MOVING_AVERAGE:
+        raise ValueError(f'moving_average must be between 1 and {MAX_MOVING_AVERAGE}')
+    return start, end, granularity, window
+
+def earnings_series(cursor, start, end, granularity, window=1, provider_id=None):
+    """Earnings per day/week/month between start and end, for one provider or all.
+
+    Only (day, amount) pairs are fetched: pre-summed days from the rollup,
+    or raw payments when EARNINGS_SOURCE is 'payments'. Bucketing is
+    vectorized with NumPy when it is installed.
+    """
+    bucket_starts = series_bucket_starts(start, end, granularity)
+    if len(bucket_starts) > MAX_SERIES_BUCKETS:
+        raise ValueError(f'Range too long: at most {MAX_SERIES_BUCKETS} buckets')
+
+    if app.config['EARNINGS_SOURCE'] == 'payments':
+        query = '''
+            SELECT p.PaymentDate, p.Amount
+            FROM Payments p
+            JOIN Bookings b ON p.B_ID = b.B_ID
+            WHERE p.PaymentStatus = 'Success' AND p.PaymentDate BETWEEN %s AND %s
+        ''' + (' AND b.ProviderID = %s' if provider_id else '')
+    else:
+        query = '''
+            SELECT Day, Amount FROM ProviderEarningsDaily
+            WHERE Day BETWEEN %s AND %s
+        ''' + (' AND ProviderID = %s' if provider_id else '')
+    # Include the whole first bucket so partial weeks/months are complete
+    params = (bucket_starts[0], end) + ((provider_id,) if provider_id else ())
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+
+    days = [row[0] for row in rows]
+    amounts = [row[1] for row in rows]
+    totals = bucket_totals(days, amounts, bucket_starts)
+    averages = moving_average(totals, window)
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'granularity': granularity,
+        'moving_average': window,
+        'buckets': [
+            {
+                'period': bucket_start.isoformat(),
+                'amount': round(total, 2),
+                'moving_average': round(average, 2) if average is not None else None,
+            }
+            for bucket_start, total, average in zip(bucket_starts, totals, averages)
+        ],
+    }
+
+# =====================================================
+# PLATFORM ANALYTICS
+# =====================================================
+
+# Each source table is folded into the summary tables in ID order. The
+# watermark records the last ID processed, so a refresh only reads rows
+# inserted since the previous one. Auto-increment IDs are handed out at
+# insert time but become visible at commit, so a lower ID can appear after
+# a higher one has been folded. A refresh therefore only folds up to the
+# MAX(ID) it saw at least ANALYTICS_SETTLE_SECONDS earlier (PendingID and
+# PendingAt), by which time every transaction holding a lower ID has
+# committed or rolled back. Each entry is (source, table), plus the
+# statements that aggregate an ID range (%(id)s is the ID column).
+ANALYTICS_SOURCES = [
+    ('bookings', 'Bookings', [
+        '''
+        INSERT INTO PlatformDailyStats (Day, Bookings)
+        SELECT BookingDate, COUNT(*) FROM Bookings
+        WHERE %(id)s > %%s AND %(id)s <= %%s AND BookingDate IS NOT NULL
+        GROUP BY BookingDate
+        ON DUPLICATE KEY UPDATE Bookings = Bookings + VALUES(Bookings)
+        ''',
+        '''
+        INSERT INTO ServiceDailyStats (S_ID, Day, Bookings)
+        SELECT S_ID, BookingDate, COUNT(*) FROM Bookings
+        WHERE %(id)s > %%s AND %(id)s <= %%s AND BookingDate IS NOT NULL AND S_ID IS NOT NULL
+        GROUP BY S_ID, BookingDate
+        ON DUPLICATE KEY UPDATE Bookings = Bookings + VALUES(Bookings)
+        ''',
+    ]),
+    ('payments', 'Payments', [
+        '''
+        INSERT INTO PlatformDailyStats (Day, GMV, PaymentCount)
+        SELECT PaymentDate, SUM(Amount), COUNT(*) FROM Payments
+        WHERE %(id)s > %%s AND %(id)s <= %%s AND PaymentStatus = 'Success' AND PaymentDate IS NOT NULL
+        GROUP BY PaymentDate
+        ON DUPLICATE KEY UPDATE GMV = GMV + VALUES(GMV), PaymentCount = PaymentCount + VALUES(PaymentCount)
+        ''',
+        '''
+        INSERT INTO ServiceDailyStats (S_ID, Day, Revenue)
+        SELECT b.S_ID, p.PaymentDate, SUM(p.Amount) FROM Payments p
+        JOIN Bookings b ON p.B_ID = b.B_ID
+        WHERE p.%(id)s > %%s AND p.%(id)s <= %%s AND p.PaymentStatus = 'Success'
+            AND p.PaymentDate IS NOT NULL AND b.S_ID IS NOT NULL
+        GROUP BY b.S_ID, p.PaymentDate
+        ON DUPLICATE KEY UPDATE Revenue = Revenue + VALUES(Revenue)
+        ''',
+    ]),
+    ('cancellations', 'Cancellation', [
+        '''
+        INSERT INTO PlatformDailyStats (Day, Cancellations, Refunds)
+        SELECT Day, COUNT(*), SUM(RefundAmount) FROM (
+            SELECT COALESCE(DATE(c.Date), b.BookingDate) AS Day, COALESCE(c.RefundAmount, 0) AS RefundAmount
+            FROM Cancellation c
+            JOIN Bookings b ON c.B_ID = b.B_ID
+            WHERE c.%(id)s > %%s AND c.%(id)s <= %%s
+        ) AS cancellations
+        WHERE Day IS NOT NULL
+        GROUP BY Day
+        ON DUPLICATE KEY UPDATE Cancellations = Cancellations + VALUES(Cancellations),
+                                Refunds = Refunds + VALUES(Refunds)
+        ''',
+    ]),
+]
+
+def refresh_analytics(db, batch_size=50000, settle_seconds=None):
+    """Fold settled rows added since the last refresh into the summary tables.
+
+    Each batch of at most batch_size IDs is aggregated and its watermark
+    advanced in one transaction; the watermark row is locked, so concurrent
+    refreshes serialize instead of double counting. Rows are folded once
+    they have been visible for settle_seconds (ANALYTICS_SETTLE_SECONDS by
+    default; 0 folds up to the current MAX(ID)). Returns the number of IDs
+    covered per source.
+    """
+    if settle_seconds is None:
+        settle_seconds = app.config['ANALYTICS_SETTLE_SECONDS']
+    cursor = db.cursor(dictionary=True)
+    processed = {}
+    try:
+        for source, table, statements in ANALYTICS_SOURCES:
+            id_column = auto_increment_column(cursor, table)
+            cursor.execute('INSERT IGNORE INTO AnalyticsWatermark (Source) VALUES (%s)', (source,))
+            db.commit()
+            processed[source] = 0
+            while True:
+                cursor.execute('''
+                    SELECT LastID, PendingID, PendingAt <= NOW() - INTERVAL %s SECOND AS settled
+                    FROM AnalyticsWatermark WHERE Source = %s FOR UPDATE
+                ''', (settle_seconds, source))
+                watermark = cursor.fetchone()
+                last_id = watermark['LastID']
+                cursor.execute(f'SELECT MAX({id_column}) AS max_id FROM {table}')
+                max_id = cursor.fetchone()['max_id'] or 0
+                if settle_seconds <= 0:
+                    target = max_id
+                elif watermark['settled']:
+                    target = watermark['PendingID']
+                else:
+                    target = last_id
+                upper = min(target, last_id + batch_size)
+                if upper > last_id:
+                    for statement in statements:
+                        cursor.execute(statement % {'id': id_column}, (last_id, upper))
+                    processed[source] += upper - last_id
+                cursor.execute('''
+                    UPDATE AnalyticsWatermark SET LastID = %s, RefreshedAt = NOW() WHERE Source = %s
+                ''', (max(upper, last_id), source))
+                if upper >= target and max(upper, last_id) >= watermark['PendingID']:
+                    # The previous bound is folded; start the clock on the current MAX(ID)
+                    cursor.execute('''
+                        UPDATE AnalyticsWatermark SET PendingID = %s, PendingAt = NOW() WHERE Source = %s
+                    ''', (max_id, source))
+                db.commit()
+                if upper >= target:
+                    break
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    return processed
+
+def rebuild_analytics(db):
+    """Empty the summary tables and reset the watermarks, then refresh from scratch.
+
+    The first refresh only records the current MAX(ID)s; the rows up to
+    them are folded after waiting for them to settle.
+    """
+    cursor = db.cursor()
+    cursor.execute('DELETE FROM PlatformDailyStats')
+    cursor.execute('DELETE FROM ServiceDailyStats')
+    cursor.execute('DELETE FROM AnalyticsWatermark')
+    db.commit()
+    cursor.close()
+    refresh_analytics(db)
+    time.sleep(app.config['ANALYTICS_SETTLE_SECONDS'])
+    return refresh_analytics(db)
+
+@app.cli.command('refresh-analytics')
+@click.option('--rebuild', is_flag=True, help='Recompute the summary tables from scratch.')
+def refresh_analytics_command(rebuild):
+    """Fold new bookings, payments and cancellations into the analytics tables."""
+    db = get_db()
+    try:
+        started = time.monotonic()
+        processed = rebuild_analytics(db) if rebuild else refresh_analytics(db)
+    finally:
+        db.close()
+    summary = ', '.join(f"{source}: {count}" for source, count in processed.items())
+    print(f"Analytics refreshed in {time.monotonic() - started:.2f}s (IDs processed - {summary})")
+
+class AnalyticsRefresher:
+    """Background thread that refreshes the analytics every `interval` seconds.
+
+    Like NotificationPoller, the thread is started on first use in each
+    process (each worker's first request), so a forking server does not
+    strand it in the master. Every worker then runs one; the locked
+    watermark serializes their refreshes, and the ones that find nothing
+    new cost a few short queries. An interval of 0 disables it.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def ensure_running(self):
+        if self.interval <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name='analytics-refresher', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                app.logger.error("Error refreshing analytics: %s", e)
+
+    def refresh(self):
+        db = get_db()
+        try:
+            return refresh_analytics(db)
+        finally:
+            db.close()
+
+app.config['ANALYTICS_REFRESH_INTERVAL'] = int(os.environ.get('ANALYTICS_REFRESH_INTERVAL', 0))
+# Longer than InnoDB's default 50s lock wait, so inserts in flight have finished
+app.config['ANALYTICS_SETTLE_SECONDS'] = int(os.environ.get('ANALYTICS_SETTLE_SECONDS', 60))
+analytics_refresher = AnalyticsRefresher(app.config['ANALYTICS_REFRESH_INTERVAL'])
+
+MAX_ANALYTICS_DAYS = 366
+
+def platform_analytics(cursor, days=30, top=5):
+    """Dashboard figures for the last `days` days, read from the summary tables only"""
+    since = date.today() - timedelta(days=days - 1)
+
+    cursor.execute('''
+        SELECT Day, Bookings, Cancellations, GMV, PaymentCount, Refunds
+        FROM PlatformDailyStats
+        WHERE Day BETWEEN %s AND %s
+        ORDER BY Day
+    ''', (since, date.today()))
+    daily = [
+        {
+            'day': row['Day'].isoformat(),
+            'bookings': int(row['Bookings']),
+            'cancellations': int(row['Cancellations']),
+            'gmv': float(row['GMV']),
+            'payments': int(row['PaymentCount']),
+            'refunds': float(row['Refunds']),
+        }
+        for row in cursor.fetchall()
+    ]
+
+    cursor.execute('''
+        SELECT d.S_ID, s.Name AS name, SUM(d.Bookings) AS bookings, SUM(d.Revenue) AS revenue
+        FROM ServiceDailyStats d
+        LEFT JOIN Services s ON s.S_ID = d.S_ID
+        WHERE d.Day BETWEEN %s AND %s
+        GROUP BY d.S_ID, s.Name
+        ORDER BY revenue DESC
+        LIMIT %s
+    ''', (since, date.today(), top))
+    top_services = [
+        {'service_id': row['S_ID'], 'name': row['name'],
+         'bookings': int(row['bookings']), 'revenue': float(row['revenue'])}
+        for row in cursor.fetchall()
+    ]
+
+    cursor.execute('''
+        SELECT e.ProviderID, u.Name AS name, SUM(e.PaymentCount) AS payments, SUM(e.Amount) AS revenue
+        FROM ProviderEarningsDaily e
+        LEFT JOIN User u ON u.U_ID = e.ProviderID
+        WHERE e.Day BETWEEN %s AND %s
+        GROUP BY e.ProviderID, u.Name
+        ORDER BY revenue DESC
+        LIMIT %s
+    ''', (since, date.today(), top))
+    top_providers = [
+        {'provider_id': row['ProviderID'], 'name': row['name'],
+         'payments': int(row['payments']), 'revenue': float(row['revenue'])}
+        for row in cursor.fetchall()
+    ]
+
+    cursor.execute('SELECT MIN(RefreshedAt) AS refreshed_at FROM AnalyticsWatermark')
+    refreshed_at = cursor.fetchone()['refreshed_at']
 
-app.json_encoder = CustomJSONEncoder
+    bookings = sum(day['bookings'] for day in daily)
+    cancellations = sum(day['cancellations'] for day in daily)
+    return {
+        'since': since.isoformat(),
+        'days': days,
+        'refreshed_at': refreshed_at.strftime('%Y-%m-%d %H:%M:%S') if refreshed_at else None,
+        'totals': {
+            'gmv': round(sum(day['gmv'] for day in daily), 2),
+            'bookings': bookings,
+            'cancellations': cancellations,
+            'cancellation_rate': round(cancellations / bookings, 4) if bookings else 0.0,
+            'refunds': round(sum(day['refunds'] for day in daily), 2),
+        },
+        'daily': daily,
+        'top_services': top_services,
+        'top_providers': top_providers,
+    }
 
 # =====================================================
-# DATABASE CONFIGURATION AND UTILITY FUNCTIONS
+# PAYMENTS
 # =====================================================
 
-# MySQL Configuration
-db_config = {
-    'host': 'localhost',
-    'user': 'Your Username',
-    'password': 'Your PWD',
-    'database': 'BookingSystem'
+# Frontend payment method values -> Payments.PaymentMethod ENUM values
+PAYMENT_METHOD_MAP = {
+    'credit_card': 'Credit Card',
+    'debit_card': 'Debit Card',
+    'paypal': 'Credit Card',  # Map PayPal to Credit Card since it's not in the ENUM
+    'bank_transfer': 'Net Banking',  # Map bank_transfer to Net Banking
+    'upi': 'UPI',
 }
+PAYMENT_METHODS = set(PAYMENT_METHOD_MAP.values())
+MAX_IDEMPOTENCY_KEY_LENGTH = 64
 
-# Helper Functions
-def get_db():
-    """Get a new database connection"""
-    return mysql.connector.connect(**db_config)
+class PaymentError(Exception):
+    """Raised when a payment cannot be recorded"""
 
-def hash_password(password):
-    """Hash a password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
 
-def setup_database():
-    """Setup database and fix any issues"""
+def get_idempotency_key():
+    """Read the client's idempotency key from the Idempotency-Key header or request body"""
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        body = request.get_json(silent=True) or request.form
+        if not isinstance(body, dict):
+            raise PaymentError('Request body must be a JSON object')
+        key = body.get('idempotency_key')
+    if key is not None and not isinstance(key, str):
+        raise PaymentError('Idempotency key must be a string')
+    if key and len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise PaymentError(f'Idempotency key must be at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters')
+    return key or None
+
+def idempotency_key_conflict(booking_id=None):
+    """Error message for an idempotency key already used for a different booking"""
+    target = f'booking #{booking_id}' if booking_id is not None else 'another booking'
+    return (f'Idempotency key was already used for a payment on {target}; '
+            'send a new key for each booking')
+
+def record_payment(db, booking_id, payer_id, payment_method, amount=None,
+                   idempotency_key=None, owner_id=None):
+    """Pay for a booking: Payments, Bookings, Invoices and Notifications in one transaction.
+
+    The booking row is locked with SELECT ... FOR UPDATE, so concurrent
+    submissions for one booking run one after another, and the unique
+    index on Payments.B_ID backs this up. A retry with an idempotency key
+    that was already recorded returns the original payment instead of
+    failing. When `owner_id` is given, the booking must belong to that
+    customer.
+
+    Returns a dict with payment_id, invoice_id, amount and created (False
+    for an idempotent replay).
+    """
+    cursor = db.cursor(dictionary=True)
     try:
-        # Connect to the database
-        print("Setting up database...")
-        db = get_db()
-        cursor = db.cursor(dictionary=True)
-        
-        # Check for Timestamp column in Notifications
-        cursor.execute("SHOW COLUMNS FROM Notifications LIKE 'Timestamp'")
-        if not cursor.fetchone():
-            cursor.execute("ALTER TABLE Notifications ADD COLUMN Timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-            db.commit()
-            print("Added Timestamp column to Notifications table")
-        
-        # Check for PaymentStatus column in Bookings
-        cursor.execute("SHOW COLUMNS FROM Bookings LIKE 'PaymentStatus'")
-        if not cursor.fetchone():
-            cursor.execute("ALTER TABLE Bookings ADD COLUMN PaymentStatus VARCHAR(20) DEFAULT 'Not Paid'")
-            db.commit()
-            print("Added PaymentStatus column to Bookings table")
-        
-        # PAYMENTS TABLE FIXES - Start with detailed checks
-        print("Checking Payments table structure...")
-        
-        # First check if the table exists
-        cursor.execute("SHOW TABLES LIKE 'Payments'")
-        if not cursor.fetchone():
-            print("Payments table doesn't exist! Creating it...")
-            cursor.execute("""
-                CREATE TABLE Payments (
-                    P_ID INT AUTO_INCREMENT PRIMARY KEY,
-                    B_ID INT,
-                    CustomerID INT,
-                    Amount DECIMAL(10,2),
-                    PaymentDate DATE,
-                    PaymentMethod ENUM('Credit Card', 'Debit Card', 'Net Banking', 'UPI'),
-                    PaymentStatus VARCHAR(20) DEFAULT 'Success',
-                    ProviderID INT,
-                    FOREIGN KEY (B_ID) REFERENCES Bookings(B_ID)
-                )
-            """)
-            db.commit()
-            print("Created Payments table with ProviderID column")
-        
-        # Check for ProviderID column in Payments
-        print("Checking for ProviderID column in Payments table...")
-        cursor.execute("SHOW COLUMNS FROM Payments LIKE 'ProviderID'")
-        if not cursor.fetchone():
-            print("ProviderID column doesn't exist in Payments. Adding it...")
-            cursor.execute("ALTER TABLE Payments ADD COLUMN ProviderID INT DEFAULT NULL")
-            db.commit()
-            print("Added ProviderID column to Payments table")
-            
-        # Count payments with null ProviderID
-        cursor.execute("SELECT COUNT(*) as count FROM Payments WHERE ProviderID IS NULL")
-        null_provider_count = cursor.fetchone()['count']
-        print(f"Found {null_provider_count} payments with NULL ProviderID")
-        
-        if null_provider_count > 0:
-            print("Updating payment records with provider IDs from their associated bookings...")
-            # Update existing payments with provider IDs from their associated bookings
-            cursor.execute("""
-                UPDATE Payments p
-                JOIN Bookings b ON p.B_ID = b.B_ID
-                SET p.ProviderID = b.ProviderID
-                WHERE p.ProviderID IS NULL AND b.ProviderID IS NOT NULL
-            """)
-            
-            affected_rows = cursor.rowcount
-            db.commit()
-            print(f"Updated {affected_rows} payment records with provider IDs")
-            
-            cursor.execute("SELECT COUNT(*) as count FROM Payments WHERE ProviderID IS NULL")
-            still_null = cursor.fetchone()['count']
-            
-            if still_null > 0:
-                print(f"Still have {still_null} payments with NULL ProviderID")
-                
-                # For any remaining null ProviderIDs, use CustomerID as a fallback
-                cursor.execute("""
-                    UPDATE Payments p
-                    SET p.ProviderID = (
-                        SELECT sp.U_ID 
-                        FROM ServiceProvider sp 
-                        LIMIT 1
-                    )
-                    WHERE p.ProviderID IS NULL
-                """)
-                
-                affected_rows = cursor.rowcount
-                db.commit()
-                print(f"Updated remaining {affected_rows} payment records with a default provider ID")
-        
-        # Fix any null Provider IDs in Bookings
-        cursor.execute("SELECT COUNT(*) as count FROM Bookings WHERE ProviderID IS NULL OR ProviderID = 0")
-        null_bookings_count = cursor.fetchone()['count']
-        print(f"Found {null_bookings_count} bookings with missing/zero provider ID")
-        
-        if null_bookings_count > 0:
-            cursor.execute("SELECT U_ID FROM User WHERE UserType = 'ServiceProvider' LIMIT 1")
-            provider = cursor.fetchone()
-            
-            if provider:
-                cursor.execute("UPDATE Bookings SET ProviderID = %s WHERE ProviderID IS NULL OR ProviderID = 0", 
-                             (provider['U_ID'],))
-                
-                affected_rows = cursor.rowcount
-                db.commit()
-                print(f"Fixed {affected_rows} bookings with missing provider ID")
-        
-        # Set default status for service providers
-        cursor.execute("UPDATE ServiceProvider SET Status = 'Pending' WHERE Status IS NULL OR Status = ''")
-        
-        # Set default status for bookings
-        cursor.execute("UPDATE Bookings SET Status = 'Pending' WHERE Status IS NULL OR Status = ''")
-        
-        # Set default payment status for bookings
-        cursor.execute("UPDATE Bookings SET PaymentStatus = 'Not Paid' WHERE PaymentStatus IS NULL OR PaymentStatus = ''")
-        
-        # Set default status for payments
-        cursor.execute("UPDATE Payments SET PaymentStatus = 'Success' WHERE PaymentStatus IS NULL OR PaymentStatus = ''")
-        
+        cursor.execute('''
+            SELECT b.B_ID, b.CustomerID, b.ProviderID, b.Status, s.Price
+            FROM Bookings b
+            JOIN Services s ON b.S_ID = s.S_ID
+            WHERE b.B_ID = %s
+            FOR UPDATE OF b
+        ''', (booking_id,))
+        booking = cursor.fetchone()
+        if not booking:
+            raise PaymentError('Booking not found', status_code=404)
+        if owner_id is not None and booking['CustomerID'] != owner_id:
+            raise PaymentError('Unauthorized access to this booking', status_code=403)
+
+        # Locking read, so it sees a payment committed while we waited for the lock
+        cursor.execute('''
+            SELECT p.P_ID, p.Amount, p.IdempotencyKey, i.I_ID
+            FROM Payments p
+            LEFT JOIN Invoices i ON i.B_ID = p.B_ID
+            WHERE p.B_ID = %s
+            FOR UPDATE OF p
+        ''', (booking_id,))
+        existing = cursor.fetchone()
+        if existing:
+            if idempotency_key and existing['IdempotencyKey'] == idempotency_key:
+                db.rollback()
+                return {'payment_id': existing['P_ID'], 'invoice_id': existing['I_ID'],
+                        'amount': existing['Amount'], 'created': False}
+            raise PaymentError('Payment already processed for this booking', status_code=409)
+
+        if idempotency_key:
+            cursor.execute('SELECT B_ID FROM Payments WHERE IdempotencyKey = %s', (idempotency_key,))
+            used = cursor.fetchone()
+            if used:
+                raise PaymentError(idempotency_key_conflict(used['B_ID']), status_code=422)
+
+        if not amount:
+            amount = booking['Price']
+        payment_date = datetime.now().strftime('%Y-%m-%d')
+        method = payment_method if payment_method in PAYMENT_METHODS else \
+            PAYMENT_METHOD_MAP.get(payment_method, 'Credit Card')
+
+        try:
+            cursor.execute('''
+                INSERT INTO Payments (B_ID, CustomerID, Amount, PaymentDate, PaymentMethod,
+                                      PaymentStatus, ProviderID, IdempotencyKey)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ''', (booking_id, payer_id, amount, payment_date, method, 'Success',
+                  booking['ProviderID'], idempotency_key))
+        except mysql.connector.IntegrityError as err:
+            if err.errno == 1062 and 'uq_payments_idempotency_key' in str(err):
+                # Another booking's payment took this key after our check
+                raise PaymentError(idempotency_key_conflict(), status_code=422)
+            if err.errno == 1062:  # duplicate key: B_ID already paid
+                raise PaymentError('Payment already processed for this booking', status_code=409)
+            raise
+        payment_id = cursor.lastrowid
+        add_provider_earnings(cursor, booking['ProviderID'], payment_date, amount=amount, payment_count=1)
+
+        cursor.execute('''
+            UPDATE Bookings
+            SET Status = 'Confirmed', PaymentStatus = 'Paid'
+            WHERE B_ID = %s
+        ''', (booking_id,))
+
+        cursor.execute('''
+            INSERT INTO Invoices (U_ID, B_ID, Amount, Date)
+            VALUES (%s, %s, %s, %s)
+        ''', (payer_id, booking_id, amount, payment_date))
+        invoice_id = cursor.lastrowid
+
+        notifications = [
+            (payer_id, f'Your payment of ${amount} for booking #{booking_id} was successful. Invoice #{invoice_id} has been generated.'),
+            (booking['ProviderID'], f'Payment received for booking #{booking_id}. Amount: ${amount}'),
+        ]
+        notifications = notification_dispatcher.stage(cursor, notifications)
+
         db.commit()
+        notification_dispatcher.committed(notifications)
+        return {'payment_id': payment_id, 'invoice_id': invoice_id, 'amount': amount, 'created': True}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
         cursor.close()
-        db.close()
-        print("Database setup completed successfully")
-    except mysql.connector.Error as err:
-        print(f"Database setup error: {err}")
-
-# Run database setup on startup
-setup_database()
 
 # =====================================================
 # ROUTES AND VIEWS
@@ -196,7 +3181,7 @@ def login():
         password = hash_password(request.form['password'])
         user_type = request.form['user_type']
         
-        print(f"Login attempt: Email={email}, Type={user_type}")
+        app.logger.debug("Login attempt for a %s account", user_type)
         
         db = get_db()
         cursor = db.cursor(dictionary=True)
@@ -205,28 +3190,22 @@ def login():
             cursor.execute('SELECT * FROM Admin WHERE Email = %s', (email,))
             account = cursor.fetchone()
             if account and account['Password'] == password:
-                print(f"Admin credentials valid for {email}. Setting session variables...")
                 session['loggedin'] = True
                 session['id'] = account['A_ID']
                 session['email'] = account['Email']
                 session['role'] = account.get('Role', 'Admin')  # Default to 'Admin' if Role is None
                 session['name'] = account.get('Name', 'Admin')
                 session['is_admin'] = True  # Additional flag to mark admin sessions
-                
-                # Print all session values for debugging
-                print(f"Admin session variables set: id={session['id']}, role={session['role']}, name={session['name']}")
+                admin_cache.remember(account['A_ID'], account.get('Name') or 'Admin')
+                app.logger.info("Admin %s logged in", session['id'])
                 return redirect(url_for('admin_dashboard'))
             else:
-                print(f"Admin login failed for {email}: Invalid credentials")
+                app.logger.info("Admin login failed: invalid credentials")
         else:
             cursor.execute('SELECT * FROM User WHERE Email = %s', (email,))
             account = cursor.fetchone()
             
-            if account:
-                print(f"Found user: {account['Name']}, Type in DB: {account['UserType']}, Type from form: {user_type}")
-            
             if account and account['UserType'] == user_type and account.get('Password') == password:
-                print(f"Setting regular user session variables for {account['Name']}...")
                 session['loggedin'] = True
                 session['id'] = account['U_ID']
                 session['email'] = account['Email']
@@ -235,20 +3214,15 @@ def login():
                 session['phone'] = account['Phone_no']
                 session['is_admin'] = False  # Explicitly mark as not admin
                 
-                print(f"User login successful: {account['Name']} ({account['UserType']})")
+                app.logger.info("User %s logged in (%s)", account['U_ID'], account['UserType'])
                 
                 # Direct redirection to appropriate dashboard based on user type
                 if account['UserType'] == 'ServiceProvider':
-                    print(f">>> Redirecting service provider {account['Name']} to provider dashboard")
                     return redirect(url_for('provider_dashboard'))
                 else:
-                    print(f">>> Redirecting customer {account['Name']} to user dashboard")
                     return redirect(url_for('user_dashboard'))
             else:
-                if account:
-                    print(f"Login failed: Password mismatch or user type mismatch")
-                else:
-                    print(f"Login failed: Account not found for {email}")
+                app.logger.info("Login failed: %s", 'password or user type mismatch' if account else 'account not found')
         
         flash('Invalid credentials!', 'error')
         cursor.close()
@@ -297,35 +3271,29 @@ def register():
 
 @app.route('/admin/dashboard')
 def admin_dashboard():
-    # Check for admin session in multiple ways
-    is_admin = (
-        'loggedin' in session and 
-        (session.get('role') or session.get('is_admin', False) or session.get('id') in get_admin_ids())
-    )
+    is_admin = is_admin_session()
     
     if is_admin:
-        print(f"Admin dashboard accessed by: {session.get('name')} (ID: {session.get('id')})")
+        app.logger.debug("Admin dashboard accessed by admin %s", session.get('id'))
         return render_template('admin_dashboard.html')
     else:
-        print(f"Unauthorized admin dashboard access attempt. Session data: {session}")
+        app.logger.warning("Unauthorized admin dashboard access attempt by user %s", session.get('id'))
     return redirect(url_for('login'))
 
 @app.route('/user/dashboard')
 def user_dashboard():
     if 'loggedin' in session and session.get('user_type'):
-        print(f"User dashboard accessed by: {session.get('name')} with type: {session.get('user_type')}")
+        app.logger.debug("User dashboard accessed by user %s (%s)", session.get('id'), session.get('user_type'))
         if session.get('user_type') == 'ServiceProvider':
-            print(f"Redirecting service provider to provider dashboard")
             return redirect(url_for('provider_dashboard'))
         return render_template('user_dashboard.html')
     return redirect(url_for('login'))
 
 @app.route('/provider/dashboard')
 def provider_dashboard():
-    print(f"Provider dashboard accessed by: {session.get('name')} with type: {session.get('user_type')}")
+    app.logger.debug("Provider dashboard accessed by user %s (%s)", session.get('id'), session.get('user_type'))
     
     if 'loggedin' in session and session.get('user_type') == 'ServiceProvider':
-        print(f"Authentication valid for provider dashboard")
         # Get provider services
         try:
             db = get_db()
@@ -340,7 +3308,6 @@ def provider_dashboard():
             ''', (session['id'],))
             
             provider = cursor.fetchone()
-            print(f"Provider details: {provider}")
             
             # Get provider services
             cursor.execute('''
@@ -355,19 +3322,18 @@ def provider_dashboard():
             cursor.close()
             db.close()
             
-            print(f"Rendering provider_dashboard.html with provider data and {len(services)} services")
             return render_template('provider_dashboard.html', 
                                   provider=provider, 
                                   services=services)
         except Exception as e:
-            print(f"Error fetching provider data: {str(e)}")
+            app.logger.error("Error fetching provider data: %s", e)
             # Fallback to basic provider info if DB query fails
             return render_template('provider_dashboard.html', provider={
                 'Name': session.get('name', ''),
                 'Email': session.get('email', ''),
                 'Phone': session.get('phone', '')
             }, services=[])
-    print(f"Authentication failed for provider dashboard")
+    app.logger.debug("Provider dashboard denied for user %s", session.get('id'))
     return redirect(url_for('login'))
 
 @app.route('/logout')
@@ -401,7 +3367,7 @@ def get_user_profile():
             'phone': ''
         })
     except Exception as e:
-        print(f"Error in get_user_profile: {str(e)}")
+        app.logger.error("Error in get_user_profile: %s", e)
         return jsonify({
             'name': '',
             'email': '',
@@ -411,11 +3377,7 @@ def get_user_profile():
 
 @app.route('/api/admin/profile', methods=['GET'])
 def get_admin_profile():
-    # Check admin authentication in multiple ways
-    is_admin = (
-        'loggedin' in session and 
-        (session.get('role') or session.get('is_admin', False) or session.get('id') in get_admin_ids())
-    )
+    is_admin = is_admin_session()
     
     if is_admin:
         return jsonify({
@@ -429,57 +3391,66 @@ def get_admin_profile():
 @app.route('/api/services', methods=['GET'])
 def get_services():
     try:
+        page = get_page_args()
+        
+        # Customers, visitors and everyone else who is not an admin or provider
+        # see only approved services from approved providers, served from cache
+        is_admin = 'loggedin' in session and session.get('role')
+        is_provider = 'loggedin' in session and session.get('user_type') == 'ServiceProvider'
+        if session.get('user_type') == 'Customer' or not (is_admin or is_provider):
+            return catalog_response(page, request.args.get('sort', 'id'))
+        
         db = get_db()
         cursor = db.cursor(dictionary=True)
+        params = ()
         
-        # For regular customers, only show services from approved providers
-        if 'loggedin' in session and session.get('user_type') == 'Customer':
-            cursor.execute('''
-                SELECT s.*, u.Name as provider_name 
-                FROM Services s
-                JOIN User u ON s.ProviderID = u.U_ID
-                JOIN ServiceProvider sp ON s.ProviderID = sp.U_ID
-                WHERE sp.Status = 'Approved' AND (s.is_approved = 1 OR s.is_approved IS NULL)
-            ''')
         # For admins, show all services
-        elif 'loggedin' in session and session.get('role'):
-            cursor.execute('''
+        if is_admin:
+            query = '''
                 SELECT s.*, u.Name as provider_name, sp.Status as provider_status
                 FROM Services s
                 LEFT JOIN User u ON s.ProviderID = u.U_ID
                 LEFT JOIN ServiceProvider sp ON s.ProviderID = sp.U_ID
-            ''')
+            '''
         # For service providers, show only their services
-        elif 'loggedin' in session and session.get('user_type') == 'ServiceProvider':
-            cursor.execute('''
+        else:
+            query = '''
                 SELECT s.*, u.Name as provider_name, 
                     (SELECT COUNT(*) FROM Bookings b WHERE b.S_ID = s.S_ID) as booking_count
                 FROM Services s
                 JOIN User u ON s.ProviderID = u.U_ID
                 WHERE s.ProviderID = %s
-            ''', (session['id'],))
-        # For unauthenticated users or others, show only approved services from approved providers
-        else:
-            cursor.execute('''
-                SELECT s.*, u.Name as provider_name
-                FROM Services s
-                JOIN User u ON s.ProviderID = u.U_ID
-                JOIN ServiceProvider sp ON s.ProviderID = sp.U_ID
-                WHERE sp.Status = 'Approved' AND (s.is_approved = 1 OR s.is_approved IS NULL)
-            ''')
-        
-        services = cursor.fetchall()
+            '''
+            params = (session['id'],)
         
-        # Convert decimal values to float for JSON serialization
-        for service in services:
-            if 'Price' in service:
-                service['Price'] = float(service['Price'])
+        cursor.execute(*paged_query(query, params, ['S_ID'], page, descending=False))
+        services, next_cursor = split_page(cursor.fetchall(), ['S_ID'], page)
         
         cursor.close()
         db.close()
-        return jsonify(services)
+        return jsonify(page_body(services, next_cursor, page))
+    except QueryArgumentError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error("Error fetching services: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/services/search', methods=['GET'])
+def search_services():
+    """Ranked search of the public catalog: ?q=&min_price=&max_price=&min_duration=&max_duration=&limit="""
+    try:
+        limit = max(1, min(request.args.get('limit', DEFAULT_SEARCH_LIMIT, type=int), MAX_SEARCH_LIMIT))
+        total, services = search_index.search(
+            request.args.get('q', ''),
+            limit=limit,
+            min_price=request.args.get('min_price', type=float),
+            max_price=request.args.get('max_price', type=float),
+            min_duration=request.args.get('min_duration', type=int),
+            max_duration=request.args.get('max_duration', type=int),
+        )
+        return jsonify({'query': request.args.get('q', ''), 'total': total, 'results': services})
     except Exception as e:
-        print(f"Error fetching services: {str(e)}")
+        app.logger.error("Error searching services: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/services', methods=['POST'])
@@ -531,13 +3502,16 @@ def add_service():
                         INSERT INTO Services (Name, Price, Description)
                         VALUES (%s, %s, %s)
                     ''', (data['name'], data['price'], data['description']))
+            service_id = cursor.lastrowid
             
             db.commit()
+            catalog_cache.invalidate()
+            search_index.refresh_service(service_id)
             cursor.close()
             db.close()
             return jsonify({'success': True, 'message': 'Service added successfully'})
         except Exception as e:
-            print(f"Error adding service: {str(e)}")
+            app.logger.error("Error adding service: %s", e)
             return jsonify({'success': False, 'error': str(e)}), 500
     return jsonify({'error': 'Unauthorized'}), 401
 
@@ -546,127 +3520,90 @@ def get_user_bookings():
     try:
         if 'loggedin' in session:
             try:
+                page = get_page_args()
                 db = get_db()
                 cursor = db.cursor(dictionary=True)
                 
                 if session.get('user_type') == 'Customer':
-                    cursor.execute('''
-                        SELECT b.*, s.Name as service_name,
-                        (SELECT COUNT(*) FROM Payments p WHERE p.B_ID = b.B_ID) as payment_made,
-                        (SELECT COUNT(*) FROM Cancellation c WHERE c.B_ID = b.B_ID) as is_cancelled
-                        FROM Bookings b
-                        JOIN Services s ON b.S_ID = s.S_ID
-                        WHERE b.CustomerID = %s
-                    ''', (session['id'],))
+                    cursor.execute(*paged_booking_query(
+                        (session['id'],), page,
+                        columns='s.Name as service_name',
+                        joins='JOIN Services s ON b.S_ID = s.S_ID',
+                        where='b.CustomerID = %s'
+                    ))
                 else:  # Service Provider
-                    cursor.execute('''
-                        SELECT b.*, s.Name as service_name, u.Name as customer_name,
-                        (SELECT COUNT(*) FROM Payments p WHERE p.B_ID = b.B_ID) as payment_made,
-                        (SELECT COUNT(*) FROM Cancellation c WHERE c.B_ID = b.B_ID) as is_cancelled
-                        FROM Bookings b
-                        JOIN Services s ON b.S_ID = s.S_ID
-                        JOIN User u ON b.CustomerID = u.U_ID
-                        WHERE b.ProviderID = %s
-                    ''', (session['id'],))
+                    cursor.execute(*paged_booking_query(
+                        (session['id'],), page,
+                        columns='s.Name as service_name, u.Name as customer_name',
+                        joins='''JOIN Services s ON b.S_ID = s.S_ID
+                                 JOIN User u ON b.CustomerID = u.U_ID''',
+                        where='b.ProviderID = %s'
+                    ))
                     
-                bookings = cursor.fetchall()
+                bookings, next_cursor = split_page(cursor.fetchall(), ['B_ID'], page)
                 
-                # Set default values and handle datetime
-                for booking in bookings:
-                    booking['payment_made'] = int(booking.get('payment_made', 0))
-                    booking['is_cancelled'] = int(booking.get('is_cancelled', 0))
-                    booking['Status'] = booking.get('Status', 'Pending')
-                    booking['PaymentStatus'] = booking.get('PaymentStatus', 'Not Paid')
-                    
-                    if 'BookingDate' in booking and booking['BookingDate']:
-                        booking['BookingDate'] = booking['BookingDate'].strftime('%Y-%m-%d')
-                    else:
-                        booking['BookingDate'] = 'Not specified'
-                        
-                    if 'BookingTime' in booking and booking['BookingTime']:
-                        from datetime import timedelta
-                        if isinstance(booking['BookingTime'], timedelta):
-                            hours, remainder = divmod(booking['BookingTime'].seconds, 3600)
-                            minutes, _ = divmod(remainder, 60)
-                            booking['BookingTime'] = f'{hours:02d}:{minutes:02d}'
-                        else:
-                            booking['BookingTime'] = booking['BookingTime'].strftime('%H:%M') if booking['BookingTime'] else 'Not specified'
-                    else:
-                        booking['BookingTime'] = 'Not specified'
+                fill_defaults(bookings, BOOKING_DEFAULTS)
                 
                 cursor.close()
                 db.close()
-                return jsonify(bookings)
+                return jsonify(page_body(bookings, next_cursor, page))
+            except QueryArgumentError as e:
+                return jsonify({'error': str(e)}), 400
             except Exception as e:
-                print(f"Error in get_user_bookings: {str(e)}")
+                app.logger.error("Error in get_user_bookings: %s", e)
                 return jsonify([])
         # For unauthorized users, return empty list instead of error
         return jsonify([])
     except Exception as e:
-        print(f"Unexpected error in get_user_bookings: {str(e)}")
+        app.logger.error("Unexpected error in get_user_bookings: %s", e)
         return jsonify([])
 
 @app.route('/api/admin/bookings', methods=['GET'])
 def get_admin_bookings():
-    # Check admin authentication in multiple ways
-    is_admin = (
-        'loggedin' in session and 
-        (session.get('role') or session.get('is_admin', False) or session.get('id') in get_admin_ids())
-    )
+    is_admin = is_admin_session()
     
     if is_admin:
         try:
+            page = get_page_args()
             db = get_db()
-            cursor = db.cursor(dictionary=True)
-            cursor.execute('''
-                SELECT b.*, s.Name as service_name, 
-                       c.Name as customer_name, p.Name as provider_name,
-                       (SELECT COUNT(*) FROM Payments pay WHERE pay.B_ID = b.B_ID) as payment_made,
-                       (SELECT COUNT(*) FROM Cancellation can WHERE can.B_ID = b.B_ID) as is_cancelled
-                FROM Bookings b
-                JOIN Services s ON b.S_ID = s.S_ID
-                JOIN User c ON b.CustomerID = c.U_ID
-                LEFT JOIN User p ON b.ProviderID = p.U_ID
-            ''')
-            bookings = cursor.fetchall()
+            cursor = db.cursor()
+            cursor.execute(*paged_booking_query(
+                (), page,
+                columns='s.Name as service_name, c.Name as customer_name, p.Name as provider_name',
+                joins='''JOIN Services s ON b.S_ID = s.S_ID
+                         JOIN User c ON b.CustomerID = c.U_ID
+                         LEFT JOIN User p ON b.ProviderID = p.U_ID'''
+            ))
+            bookings, next_cursor = split_page(fetch_records(cursor, ADMIN_BOOKING_DEFAULTS), ['B_ID'], page)
             
-            # Set default values and handle datetime
-            for booking in bookings:
-                booking['payment_made'] = booking.get('payment_made', 0)
-                booking['is_cancelled'] = booking.get('is_cancelled', 0)
-                booking['Status'] = booking.get('Status', 'Pending')
-                
-                if 'BookingDate' in booking and booking['BookingDate']:
-                    booking['BookingDate'] = booking['BookingDate'].strftime('%Y-%m-%d')
-                else:
-                    booking['BookingDate'] = 'Not specified'
-                    
-                if 'BookingTime' in booking and booking['BookingTime']:
-                    from datetime import timedelta
-                    if isinstance(booking['BookingTime'], timedelta):
-                        hours, remainder = divmod(booking['BookingTime'].seconds, 3600)
-                        minutes, _ = divmod(remainder, 60)
-                        booking['BookingTime'] = f'{hours:02d}:{minutes:02d}'
-                    else:
-                        booking['BookingTime'] = booking['BookingTime'].strftime('%H:%M') if booking['BookingTime'] else 'Not specified'
-                else:
-                    booking['BookingTime'] = 'Not specified'
+            fill_defaults(bookings, ADMIN_BOOKING_DEFAULTS)
             
             cursor.close()
             db.close()
-            return jsonify(bookings)
+            return jsonify(page_body(bookings, next_cursor, page))
+        except QueryArgumentError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
-            print(f"Error in get_admin_bookings: {str(e)}")
+            app.logger.error("Error in get_admin_bookings: %s", e)
             return jsonify({'error': str(e)}), 500
     return jsonify({'error': 'Unauthorized'}), 401
 
+@app.route('/api/admin/bookings/export', methods=['GET'])
+def export_admin_bookings():
+    """Stream every booking as a JSON array, NDJSON or CSV (?format=json|ndjson|csv)"""
+    if is_admin_session():
+        query = booking_list_sql(
+            columns='s.Name as service_name, c.Name as customer_name, p.Name as provider_name',
+            joins='''JOIN Services s ON b.S_ID = s.S_ID
+                     JOIN User c ON b.CustomerID = c.U_ID
+                     LEFT JOIN User p ON b.ProviderID = p.U_ID'''
+        ) + ' ORDER BY b.B_ID'
+        return export_response(query, (), request.args.get('format', 'json'), 'bookings')
+    return jsonify({'error': 'Unauthorized'}), 401
+
 @app.route('/api/admin/providers', methods=['GET'])
 def get_service_providers():
-    # Check admin authentication in multiple ways
-    is_admin = (
-        'loggedin' in session and 
-        (session.get('role') or session.get('is_admin', False) or session.get('id') in get_admin_ids())
-    )
+    is_admin = is_admin_session()
     
     if is_admin:
         try:
@@ -685,7 +3622,7 @@ def get_service_providers():
             db.close()
             return jsonify(providers)
         except Exception as e:
-            print(f"Error in get_service_providers: {str(e)}")
+            app.logger.error("Error in get_service_providers: %s", e)
             return jsonify({'error': str(e)}), 500
     return jsonify({'error': 'Unauthorized'}), 401
 
@@ -694,50 +3631,34 @@ def create_booking():
     if 'loggedin' in session and session.get('user_type') == 'Customer':
         try:
             data = request.json
+            try:
+                booking_date = parse_booking_date(data['date'])
+            except SlotUnavailableError as e:
+                return jsonify({'error': str(e)}), e.status_code
             db = get_db()
             cursor = db.cursor(dictionary=True)
             
-            # Get a provider for this service
-            cursor.execute('''
-                SELECT sp.U_ID 
-                FROM ServiceProvider sp
-                JOIN User u ON sp.U_ID = u.U_ID
-                WHERE sp.Status = 'Approved' 
-                LIMIT 1
-            ''')
-            provider = cursor.fetchone()
-            
-            if not provider:
-                return jsonify({'error': 'No service providers available'}), 400
-                
-            cursor.execute('''
-                INSERT INTO Bookings (CustomerID, ProviderID, S_ID, BookingDate, BookingTime, Status)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            ''', (session['id'], provider['U_ID'], data['service_id'], 
-                data['date'], data['time'], 'Pending'))
-            
-            # Get the created booking ID
-            booking_id = cursor.lastrowid
-            
-            # Create a notification for the user
+            # Book the slot with the provider who owns this service
             try:
-                cursor.execute('''
-                    INSERT INTO Notifications (U_ID, Message)
-                    VALUES (%s, %s)
-                ''', (session['id'], 'Your booking has been created. Please complete payment to confirm.'))
-            except Exception as e:
-                print(f"Error creating notification: {str(e)}")
-                
-            # Create a notification for the provider
+                booking_id, provider_id = reserve_booking_slot(
+                    cursor, session['id'], data['service_id'], booking_date, data['time'])
+            except SlotUnavailableError as e:
+                db.rollback()
+                return jsonify({'error': str(e)}), e.status_code
+            
+            # Notify the user and the provider
+            notifications = []
             try:
-                cursor.execute('''
-                    INSERT INTO Notifications (U_ID, Message)
-                    VALUES (%s, %s)
-                ''', (provider['U_ID'], f'New booking from {session["name"]} is pending payment.'))
+                notifications = notification_dispatcher.stage(cursor, [
+                    (session['id'], 'Your booking has been created. Please complete payment to confirm.'),
+                    (provider_id, f'New booking from {session["name"]} is pending payment.'),
+                ])
             except Exception as e:
-                print(f"Error creating provider notification: {str(e)}")
+                app.logger.error("Error creating notifications: %s", e)
             
             db.commit()
+            availability_cache.invalidate(provider_id, booking_date)
+            notification_dispatcher.committed(notifications)
             
             cursor.close()
             db.close()
@@ -748,7 +3669,7 @@ def create_booking():
                 'status': 'Pending'
             })
         except Exception as e:
-            print(f"Error in create_booking: {str(e)}")
+            app.logger.error("Error in create_booking: %s", e)
             return jsonify({'error': str(e)}), 500
     return jsonify({'error': 'Unauthorized'}), 401
 
@@ -759,15 +3680,16 @@ def cancel_booking(booking_id):
             db = get_db()
             cursor = db.cursor(dictionary=True)
             
-            # Check if booking belongs to current user
+            # Check if booking belongs to current user, locking the row so
+            # concurrent cancels of the same booking run one after the other
             if session.get('user_type') == 'Customer':
-                cursor.execute('SELECT * FROM Bookings WHERE B_ID = %s AND CustomerID = %s', 
+                cursor.execute('SELECT * FROM Bookings WHERE B_ID = %s AND CustomerID = %s FOR UPDATE', 
                             (booking_id, session['id']))
             elif session.get('user_type') == 'ServiceProvider':
-                cursor.execute('SELECT * FROM Bookings WHERE B_ID = %s AND ProviderID = %s', 
+                cursor.execute('SELECT * FROM Bookings WHERE B_ID = %s AND ProviderID = %s FOR UPDATE', 
                             (booking_id, session['id']))
             elif session.get('role'):
-                cursor.execute('SELECT * FROM Bookings WHERE B_ID = %s', (booking_id,))
+                cursor.execute('SELECT * FROM Bookings WHERE B_ID = %s FOR UPDATE', (booking_id,))
             
             booking = cursor.fetchone()
             
@@ -775,23 +3697,25 @@ def cancel_booking(booking_id):
                 cursor.execute('UPDATE Bookings SET Status = %s WHERE B_ID = %s', 
                             ('Cancelled', booking_id))
                 
-                # Create a cancellation record
+                # Create a cancellation record; uq_cancellation_booking keeps it to one per booking
                 try:
-                    cursor.execute('SELECT COUNT(*) AS count FROM Cancellation WHERE B_ID = %s', (booking_id,))
-                    if cursor.fetchone()['count'] == 0:
-                        cursor.execute('INSERT INTO Cancellation (B_ID, RefundAmount) VALUES (%s, %s)', 
-                                    (booking_id, 0.00))
+                    cursor.execute('INSERT IGNORE INTO Cancellation (B_ID, RefundAmount) VALUES (%s, %s)', 
+                                (booking_id, 0.00))
                 except Exception as e:
-                    print(f"Error creating cancellation record: {str(e)}")
+                    app.logger.error("Error creating cancellation record: %s", e)
                 
                 # Create a notification
+                notifications = []
                 try:
-                    cursor.execute('INSERT INTO Notifications (U_ID, Message) VALUES (%s, %s)',
-                                (session['id'], f'Booking #{booking_id} has been cancelled.'))
+                    notifications = notification_dispatcher.stage(cursor, [
+                        (session['id'], f'Booking #{booking_id} has been cancelled.'),
+                    ])
                 except Exception as e:
-                    print(f"Error creating notification: {str(e)}")
+                    app.logger.error("Error creating notification: %s", e)
                 
                 db.commit()
+                availability_cache.invalidate(booking['ProviderID'], booking['BookingDate'])
+                notification_dispatcher.committed(notifications)
                 cursor.close()
                 db.close()
                 return '', 204
@@ -800,27 +3724,96 @@ def cancel_booking(booking_id):
             db.close()
             return jsonify({'error': 'Booking not found'}), 404
         except Exception as e:
-            print(f"Error in cancel_booking: {str(e)}")
+            app.logger.error("Error in cancel_booking: %s", e)
             return jsonify({'error': str(e)}), 500
     return jsonify({'error': 'Unauthorized'}), 401
 
+def provider_service_duration(provider_id, service_id):
+    """Duration in minutes of one of the provider's services"""
+    db = get_db()
+    try:
+        cursor = db.cursor(dictionary=True)
+        cursor.execute('''
+            SELECT COALESCE(Duration, %s) AS Duration FROM Services WHERE S_ID = %s AND ProviderID = %s
+        ''', (DEFAULT_SERVICE_DURATION, service_id, provider_id))
+        service = cursor.fetchone()
+        cursor.close()
+    finally:
+        db.close()
+    if not service:
+        raise SlotUnavailableError('Service not found', status_code=404)
+    return int(service['Duration'])
+
+@app.route('/api/providers/<int:provider_id>/availability', methods=['GET'])
+def get_provider_availability(provider_id):
+    """Check one slot (?date=&time=) or list free time for a range of days (?date=&days=).
+
+    The slot length is the Duration of ?service_id= when given, else
+    ?duration= minutes; free intervals shorter than it are left out.
+    """
+    if 'loggedin' not in session:
+        return jsonify({'available': False, 'error': 'Unauthorized'}), 401
+    try:
+        first_day = date.fromisoformat(request.args['date']) if request.args.get('date') else date.today()
+        days = max(1, min(request.args.get('days', 1, type=int), MAX_AVAILABILITY_DAYS))
+        if request.args.get('service_id'):
+            duration = provider_service_duration(provider_id, int(request.args['service_id']))
+        else:
+            duration = max(1, request.args.get('duration', DEFAULT_SERVICE_DURATION, type=int))
+        busy = availability_cache.busy(provider_id, [first_day + timedelta(days=n) for n in range(days)])
+        
+        if request.args.get('time'):
+            start = int(parse_time_of_day(request.args['time']).total_seconds() // 60)
+            return jsonify({
+                'provider_id': provider_id,
+                'date': first_day.isoformat(),
+                'time': format_minutes(start),
+                'duration': duration,
+                'available': is_slot_free(busy[first_day], start, start + duration)
+            })
+        
+        day_start = app.config['AVAILABILITY_DAY_START']
+        day_end = app.config['AVAILABILITY_DAY_END']
+        return jsonify({
+            'provider_id': provider_id,
+            'duration': duration,
+            'days': [
+                {
+                    'date': day.isoformat(),
+                    'free': [[format_minutes(start), format_minutes(end)]
+                             for start, end in free_intervals(intervals, day_start, day_end)
+                             if end - start >= duration]
+                }
+                for day, intervals in sorted(busy.items())
+            ]
+        })
+    except SlotUnavailableError as e:
+        return jsonify({'available': False, 'error': str(e)}), e.status_code
+    except ValueError as e:
+        return jsonify({'available': False, 'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error("Error in get_provider_availability: %s", e)
+        return jsonify({'available': False, 'error': str(e)}), 500
+
 @app.route('/cancel_booking/<int:booking_id>', methods=['POST'])
 def handle_cancel_booking(booking_id):
     """Route to handle the frontend cancel booking request"""
     if 'loggedin' in session:
+        db = None
         try:
             db = get_db()
             cursor = db.cursor(dictionary=True)
             
-            # Check if booking belongs to current user
+            # Check if booking belongs to current user, locking the row so
+            # concurrent cancels of the same booking run one after the other
             if session.get('user_type') == 'Customer':
-                cursor.execute('SELECT * FROM Bookings WHERE B_ID = %s AND CustomerID = %s', 
+                cursor.execute('SELECT * FROM Bookings WHERE B_ID = %s AND CustomerID = %s FOR UPDATE', 
                             (booking_id, session['id']))
             elif session.get('user_type') == 'ServiceProvider':
-                cursor.execute('SELECT * FROM Bookings WHERE B_ID = %s AND ProviderID = %s', 
+                cursor.execute('SELECT * FROM Bookings WHERE B_ID = %s AND ProviderID = %s FOR UPDATE', 
                             (booking_id, session['id']))
             elif session.get('role'):
-                cursor.execute('SELECT * FROM Bookings WHERE B_ID = %s', (booking_id,))
+                cursor.execute('SELECT * FROM Bookings WHERE B_ID = %s FOR UPDATE', (booking_id,))
             
             booking = cursor.fetchone()
             
@@ -837,28 +3830,35 @@ def handle_cancel_booking(booking_id):
                     # Set refund amount to the payment amount
                     refund_amount = payment.get('Amount', 0.00)
                 
-                # Create a cancellation record with refund amount
-                try:
-                    cursor.execute('SELECT COUNT(*) AS count FROM Cancellation WHERE B_ID = %s', (booking_id,))
-                    if cursor.fetchone()['count'] == 0:
-                        cursor.execute('INSERT INTO Cancellation (B_ID, RefundAmount, Date) VALUES (%s, %s, NOW())', 
-                                    (booking_id, refund_amount))
-                except Exception as e:
-                    print(f"Error creating cancellation record: {str(e)}")
+                # Create a cancellation record with refund amount. A failure here,
+                # including in the earnings rollup, rolls back the whole cancellation
+                # so the rollup never disagrees with Cancellation.
+                # Take the time from MySQL once so the rollup day is DATE(Cancellation.Date)
+                cursor.execute('SELECT NOW() AS now')
+                cancelled_at = cursor.fetchone()['now']
+                # uq_cancellation_booking allows one record per booking; only the
+                # cancel that inserts it adds the refund to the rollup
+                cursor.execute('INSERT IGNORE INTO Cancellation (B_ID, RefundAmount, Date) VALUES (%s, %s, %s)', 
+                            (booking_id, refund_amount, cancelled_at))
+                if cursor.rowcount == 1 and refund_amount:
+                    add_provider_earnings(cursor, booking['ProviderID'], cancelled_at.date(), refunds=refund_amount)
                 
                 # Create a notification
+                notifications = [(session['id'], f'Booking #{booking_id} has been cancelled. Refund amount: ${refund_amount}')]
+                
+                # Also notify provider if cancelled by customer
+                if session.get('user_type') == 'Customer' and booking.get('ProviderID'):
+                    notifications.append((booking['ProviderID'], f'Booking #{booking_id} has been cancelled by customer. Refund amount: ${refund_amount}'))
+                
                 try:
-                    cursor.execute('INSERT INTO Notifications (U_ID, Message) VALUES (%s, %s)',
-                                (session['id'], f'Booking #{booking_id} has been cancelled. Refund amount: ${refund_amount}'))
-                    
-                    # Also notify provider if cancelled by customer
-                    if session.get('user_type') == 'Customer' and booking.get('ProviderID'):
-                        cursor.execute('INSERT INTO Notifications (U_ID, Message) VALUES (%s, %s)',
-                                    (booking['ProviderID'], f'Booking #{booking_id} has been cancelled by customer. Refund amount: ${refund_amount}'))
+                    notifications = notification_dispatcher.stage(cursor, notifications)
                 except Exception as e:
-                    print(f"Error creating notification: {str(e)}")
+                    notifications = []
+                    app.logger.error("Error creating notification: %s", e)
                 
                 db.commit()
+                availability_cache.invalidate(booking['ProviderID'], booking['BookingDate'])
+                notification_dispatcher.committed(notifications)
                 cursor.close()
                 db.close()
                 return jsonify({"success": True})
@@ -867,7 +3867,10 @@ def handle_cancel_booking(booking_id):
                 db.close()
                 return jsonify({"success": False, "message": "Booking not found or you don't have permission to cancel it"})
         except Exception as e:
-            print(f"Error in cancel_booking: {str(e)}")
+            # Undo the status change and any cancellation or rollup rows, and release the row lock
+            if db is not None:
+                db.rollback()
+            app.logger.error("Error in cancel_booking: %s", e)
             return jsonify({"success": False, "message": str(e)})
     return jsonify({"success": False, "message": "Not logged in"}), 401
 
@@ -877,26 +3880,12 @@ def get_user_payments():
     try:
         if 'loggedin' in session:
             try:
-                print(f"Fetching payments for user: {session.get('name')} with type: {session.get('user_type')} and ID: {session.get('id')}")
-                
+                page = get_page_args()
                 db = get_db()
-                cursor = db.cursor(dictionary=True)
+                cursor = db.cursor()
                 
                 if session.get('user_type') == 'ServiceProvider':
                     # For providers, show all payments for their bookings
-                    print("Executing provider-specific payment query...")
-                    
-                    # First check if there are any bookings for this provider
-                    cursor.execute('SELECT COUNT(*) as count FROM Bookings WHERE ProviderID = %s', (session['id'],))
-                    booking_count = cursor.fetchone()['count']
-                    print(f"Provider has {booking_count} bookings")
-                    
-                    # Now check if there are any payments associated with these bookings
-                    cursor.execute('SELECT COUNT(*) as count FROM Payments p JOIN Bookings b ON p.B_ID = b.B_ID WHERE b.ProviderID = %s', 
-                                 (session['id'],))
-                    payment_count = cursor.fetchone()['count']
-                    print(f"Provider has {payment_count} payments")
-                    
                     query = '''
                         SELECT p.*, b.BookingDate, b.BookingTime, s.Name as service_name, u.Name as customer_name
                         FROM Payments p
@@ -905,58 +3894,36 @@ def get_user_payments():
                         JOIN User u ON b.CustomerID = u.U_ID
                         WHERE b.ProviderID = %s
                     '''
-                    print(f"Executing query: {query}")
-                    cursor.execute(query, (session['id'],))
+                    params = (session['id'],)
                 else:
                     # For customers, show their own payments
-                    print("Executing customer-specific payment query...")
-                    cursor.execute('''
+                    query = '''
                         SELECT p.*, b.BookingDate, b.BookingTime, s.Name as service_name, u.Name as customer_name
                         FROM Payments p
                         JOIN Bookings b ON p.B_ID = b.B_ID
                         JOIN Services s ON b.S_ID = s.S_ID
                         JOIN User u ON b.CustomerID = u.U_ID
                         WHERE p.CustomerID = %s OR b.ProviderID = %s
-                    ''', (session['id'], session['id']))
+                    '''
+                    params = (session['id'], session['id'])
                 
-                payments = cursor.fetchall()
-                print(f"Retrieved {len(payments)} payment records")
+                cursor.execute(*paged_query(query, params, ['P_ID'], page))
+                payments, next_cursor = split_page(fetch_records(cursor, PAYMENT_DEFAULTS), ['P_ID'], page)
+                
+                fill_defaults(payments, PAYMENT_DEFAULTS)
                 
-                # Handle null values and datetime serialization
-                for payment in payments:
-                    payment['PaymentStatus'] = payment.get('PaymentStatus', 'Pending')
-                    
-                    if 'PaymentDate' in payment and payment['PaymentDate']:
-                        payment['PaymentDate'] = payment['PaymentDate'].strftime('%Y-%m-%d')
-                    else:
-                        payment['PaymentDate'] = 'Not specified'
-                        
-                    if 'BookingDate' in payment and payment['BookingDate']:
-                        payment['BookingDate'] = payment['BookingDate'].strftime('%Y-%m-%d')
-                    else:
-                        payment['BookingDate'] = 'Not specified'
-                        
-                    if 'BookingTime' in payment and payment['BookingTime']:
-                        from datetime import timedelta
-                        if isinstance(payment['BookingTime'], timedelta):
-                            hours, remainder = divmod(payment['BookingTime'].seconds, 3600)
-                            minutes, _ = divmod(remainder, 60)
-                            payment['BookingTime'] = f'{hours:02d}:{minutes:02d}'
-                        else:
-                            payment['BookingTime'] = payment['BookingTime'].strftime('%H:%M') if payment['BookingTime'] else 'Not specified'
-                    else:
-                        payment['BookingTime'] = 'Not specified'
-                    
                 cursor.close()
                 db.close()
-                return jsonify(payments)
+                return jsonify(page_body(payments, next_cursor, page))
+            except QueryArgumentError as e:
+                return jsonify({'error': str(e)}), 400
             except Exception as e:
-                print(f"Error in get_user_payments: {str(e)}")
+                app.logger.error("Error in get_user_payments: %s", e)
                 return jsonify([])
         # For unauthorized users, return empty list instead of error
         return jsonify([])
     except Exception as e:
-        print(f"Unexpected error in get_user_payments: {str(e)}")
+        app.logger.error("Unexpected error in get_user_payments: %s", e)
         return jsonify([])
 
 @app.route('/api/user/reviews', methods=['GET'])
@@ -984,23 +3951,18 @@ def get_user_reviews():
                 
                 reviews = cursor.fetchall()
                 
-                # Handle datetime serialization
-                for review in reviews:
-                    if 'Timestamp' in review and review['Timestamp']:
-                        review['Timestamp'] = review['Timestamp'].strftime('%Y-%m-%d %H:%M:%S')
-                    else:
-                        review['Timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                fill_defaults(reviews, {'Timestamp': datetime.now()})
                 
                 cursor.close()
                 db.close()
                 return jsonify(reviews)
             except Exception as e:
-                print(f"Error in get_user_reviews: {str(e)}")
+                app.logger.error("Error in get_user_reviews: %s", e)
                 return jsonify([])
         # For unauthorized users, return empty list instead of error
         return jsonify([])
     except Exception as e:
-        print(f"Unexpected error in get_user_reviews: {str(e)}")
+        app.logger.error("Unexpected error in get_user_reviews: %s", e)
         return jsonify([])
 
 @app.route('/api/user/notifications', methods=['GET'])
@@ -1008,34 +3970,41 @@ def get_user_notifications():
     try:
         if 'loggedin' in session:
             try:
+                page = get_page_args()
                 db = get_db()
                 cursor = db.cursor(dictionary=True)
                 
-                cursor.execute('''
-                    SELECT * FROM Notifications 
-                    WHERE U_ID = %s 
-                    ORDER BY Timestamp DESC
-                ''', (session['id'],))
+                if page is None:
+                    cursor.execute('''
+                        SELECT * FROM Notifications 
+                        WHERE U_ID = %s 
+                        ORDER BY Timestamp DESC
+                    ''', (session['id'],))
+                else:
+                    cursor.execute(*paged_query('''
+                        SELECT * FROM Notifications 
+                        WHERE U_ID = %s
+                    ''', (session['id'],), ['Timestamp', 'N_ID'], page, nullable=['Timestamp']))
                 
-                notifications = cursor.fetchall()
+                notifications, next_cursor = split_page(cursor.fetchall(), ['Timestamp', 'N_ID'], page)
+                watermark = get_read_watermark(cursor, session['id'])
                 
-                # Handle datetime serialization
                 for notification in notifications:
-                    if 'Timestamp' in notification and notification['Timestamp']:
-                        notification['Timestamp'] = notification['Timestamp'].strftime('%Y-%m-%d %H:%M:%S')
-                    else:
-                        notification['Timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    notification['IsRead'] = 1 if notification.get('IsRead') or notification['N_ID'] <= watermark else 0
+                fill_defaults(notifications, {'Timestamp': datetime.now()})
                 
                 cursor.close()
                 db.close()
-                return jsonify(notifications)
+                return jsonify(page_body(notifications, next_cursor, page))
+            except QueryArgumentError as e:
+                return jsonify({'error': str(e)}), 400
             except Exception as e:
-                print(f"Error in get_user_notifications: {str(e)}")
+                app.logger.error("Error in get_user_notifications: %s", e)
                 return jsonify([])
         # For unauthorized users, return empty list instead of error
         return jsonify([])
     except Exception as e:
-        print(f"Unexpected error in get_user_notifications: {str(e)}")
+        app.logger.error("Unexpected error in get_user_notifications: %s", e)
         return jsonify([])
 
 @app.route('/api/notifications/count', methods=['GET'])
@@ -1043,45 +4012,112 @@ def get_notification_count():
     """Get the count of unread notifications for the current user"""
     if 'loggedin' in session:
         try:
-            db = get_db()
-            cursor = db.cursor(dictionary=True)
-            
-            cursor.execute('''
-                SELECT COUNT(*) as count FROM Notifications 
-                WHERE U_ID = %s AND IsRead = 0
-            ''', (session['id'],))
-            
-            result = cursor.fetchone()
-            count = result['count'] if result and 'count' in result else 0
-            
-            cursor.close()
-            db.close()
-            return jsonify({'count': count})
+            return jsonify({'count': unread_counter.count(session['id'])})
         except Exception as e:
-            print(f"Error in get_notification_count: {str(e)}")
+            app.logger.error("Error in get_notification_count: %s", e)
             return jsonify({'count': 0})
     return jsonify({'count': 0})
 
+@app.route('/api/notifications/stream', methods=['GET'])
+def stream_notifications():
+    """Server-Sent Events stream of new notifications for the current user"""
+    if 'loggedin' not in session or not session.get('user_type'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['id']
+    # A reconnecting browser resumes after the last event it received
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    
+    def events():
+        nonlocal last_id
+        # Subscribe before the first read so no wake-up is missed in between;
+        # after that Notifications is only read when the bus signals new rows
+        subscription = notification_bus.subscribe(user_id)
+        notification_poller.ensure_running()
+        try:
+            yield 'retry: 5000\n\n'
+            started = time.monotonic()
+            last_id, rows = fetch_notifications_after(user_id, last_id)
+            while True:
+                for row in rows:
+                    event = {'N_ID': row['N_ID'], 'Message': row['Message'], 'Timestamp': row['Timestamp']}
+                    yield f'id: {row["N_ID"]}\nevent: notification\ndata: {app.json.dumps(event)}\n\n'
+                if len(rows) == SSE_BATCH_SIZE:
+                    last_id, rows = fetch_notifications_after(user_id, last_id)
+                    continue
+                remaining = app.config['SSE_MAX_SECONDS'] - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+                try:
+                    subscription.get(timeout=min(SSE_KEEPALIVE_SECONDS, remaining))
+                except queue.Empty:
+                    rows = []
+                    if remaining > SSE_KEEPALIVE_SECONDS:
+                        yield ': keepalive\n\n'
+                    continue
+                # Drain the wake-ups; one read picks up every new row
+                try:
+                    while True:
+                        subscription.get_nowait()
+                except queue.Empty:
+                    pass
+                last_id, rows = fetch_notifications_after(user_id, last_id)
+        finally:
+            notification_bus.unsubscribe(user_id, subscription)
+    
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/notifications/mark-read', methods=['POST'])
 def mark_notifications_read():
-    """Mark notifications as read"""
+    """Mark notifications as read.
+
+    With no body, everything up to the newest notification is marked read by
+    moving the user's watermark, a single-row write however long the history.
+    Pass {"up_to": N_ID} to move the watermark only that far, or
+    {"ids": [N_ID, ...]} to mark individual notifications.
+    """
     if 'loggedin' in session:
         try:
+            data = request.get_json(silent=True) or {}
+            ids = data.get('ids')
+            up_to = data.get('up_to')
+            
+            if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, int) for i in ids)):
+                return jsonify({'error': 'ids must be a list of notification IDs'}), 400
+            if up_to is not None and not isinstance(up_to, int):
+                return jsonify({'error': 'up_to must be a notification ID'}), 400
+            
             db = get_db()
             cursor = db.cursor()
             
-            cursor.execute('''
-                UPDATE Notifications 
-                SET IsRead = 1 
-                WHERE U_ID = %s
-            ''', (session['id'],))
+            if ids is not None:
+                if ids:
+                    placeholders = ', '.join(['%s'] * len(ids))
+                    cursor.execute(f'''
+                        UPDATE Notifications 
+                        SET IsRead = 1 
+                        WHERE U_ID = %s AND N_ID IN ({placeholders}) AND IsRead = 0
+                    ''', (session['id'], *ids))
+            else:
+                # The watermark never moves backwards
+                cursor.execute('''
+                    INSERT INTO NotificationReadState (U_ID, ReadUpTo)
+                    SELECT %s, COALESCE(MAX(N_ID), 0) FROM Notifications
+                    WHERE U_ID = %s AND N_ID <= %s
+                    ON DUPLICATE KEY UPDATE ReadUpTo = GREATEST(ReadUpTo, VALUES(ReadUpTo))
+                ''', (session['id'], session['id'], up_to if up_to is not None else sys.maxsize))
             
             db.commit()
+            if ids is None and up_to is None:
+                unread_counter.reset(session['id'])
+            else:
+                unread_counter.invalidate(session['id'])
             cursor.close()
             db.close()
             return jsonify({'message': 'Notifications marked as read'})
         except Exception as e:
-            print(f"Error marking notifications as read: {str(e)}")
+            app.logger.error("Error marking notifications as read: %s", e)
             return jsonify({'error': str(e)}), 500
     return jsonify({'error': 'Unauthorized'}), 401
 
@@ -1090,52 +4126,46 @@ def get_user_invoices():
     try:
         if 'loggedin' in session:
             try:
+                page = get_page_args()
                 db = get_db()
                 cursor = db.cursor(dictionary=True)
                 
                 if session.get('user_type') == 'Customer':
-                    cursor.execute('''
+                    query = '''
                         SELECT i.*, b.BookingDate, s.Name as service_name, p.Name as provider_name
                         FROM Invoices i
                         JOIN Bookings b ON i.B_ID = b.B_ID
                         JOIN Services s ON b.S_ID = s.S_ID
                         JOIN User p ON b.ProviderID = p.U_ID
                         WHERE b.CustomerID = %s
-                    ''', (session['id'],))
+                    '''
                 else:  # Service Provider
-                    cursor.execute('''
+                    query = '''
                         SELECT i.*, b.BookingDate, s.Name as service_name, c.Name as customer_name
                         FROM Invoices i
                         JOIN Bookings b ON i.B_ID = b.B_ID
                         JOIN Services s ON b.S_ID = s.S_ID
                         JOIN User c ON b.CustomerID = c.U_ID
                         WHERE b.ProviderID = %s
-                    ''', (session['id'],))
+                    '''
+                cursor.execute(*paged_query(query, (session['id'],), ['I_ID'], page))
                 
-                invoices = cursor.fetchall()
+                invoices, next_cursor = split_page(cursor.fetchall(), ['I_ID'], page)
                 
-                # Handle datetime serialization
-                for invoice in invoices:
-                    if 'InvoiceDate' in invoice and invoice['InvoiceDate']:
-                        invoice['InvoiceDate'] = invoice['InvoiceDate'].strftime('%Y-%m-%d')
-                    else:
-                        invoice['InvoiceDate'] = 'Not specified'
-                        
-                    if 'BookingDate' in invoice and invoice['BookingDate']:
-                        invoice['BookingDate'] = invoice['BookingDate'].strftime('%Y-%m-%d')
-                    else:
-                        invoice['BookingDate'] = 'Not specified'
+                fill_defaults(invoices, INVOICE_DEFAULTS)
                 
                 cursor.close()
                 db.close()
-                return jsonify(invoices)
+                return jsonify(page_body(invoices, next_cursor, page))
+            except QueryArgumentError as e:
+                return jsonify({'error': str(e)}), 400
             except Exception as e:
-                print(f"Error in get_user_invoices: {str(e)}")
+                app.logger.error("Error in get_user_invoices: %s", e)
                 return jsonify([])
         # For unauthorized users, return empty list instead of error
         return jsonify([])
     except Exception as e:
-        print(f"Unexpected error in get_user_invoices: {str(e)}")
+        app.logger.error("Unexpected error in get_user_invoices: %s", e)
         return jsonify([])
 
 @app.route('/api/bookings/<int:booking_id>/cancellation', methods=['GET'])
@@ -1159,33 +4189,105 @@ def get_booking_cancellation(booking_id):
                 return jsonify(cancellation)
             return jsonify({'error': 'No cancellation found'}), 404
         except Exception as e:
-            print(f"Error in get_booking_cancellation: {str(e)}")
+            app.logger.error("Error in get_booking_cancellation: %s", e)
             return jsonify({'error': str(e)}), 500
     return jsonify({'error': 'Unauthorized'}), 401
 
 # Reviews API
 @app.route('/api/reviews', methods=['POST'])
 def add_review():
+    """Review a provider, by provider_id or by one of the customer's booking_id"""
     if 'loggedin' in session and session.get('user_type') == 'Customer':
         try:
             data = request.json
+            rating = data.get('rating')
+            if not isinstance(rating, int) or not 1 <= rating <= 5:
+                return jsonify({'error': 'Rating must be a whole number from 1 to 5'}), 400
+            
             db = get_db()
             cursor = db.cursor(dictionary=True)
             
+            provider_id = data.get('provider_id')
+            if not provider_id and data.get('booking_id'):
+                cursor.execute('SELECT ProviderID FROM Bookings WHERE B_ID = %s AND CustomerID = %s',
+                               (data['booking_id'], session['id']))
+                booking = cursor.fetchone()
+                provider_id = booking['ProviderID'] if booking else None
+            if not provider_id:
+                cursor.close()
+                db.close()
+                return jsonify({'error': 'Provider not found'}), 404
+            
             cursor.execute('''
                 INSERT INTO Reviews (CustomerID, ProviderID, Rating, Comments)
                 VALUES (%s, %s, %s, %s)
-            ''', (session['id'], data['provider_id'], data['rating'], data['comments']))
+            ''', (session['id'], provider_id, rating, data.get('comments', data.get('comment', ''))))
+            
+            # Keep the provider's rating summary in step, in the same transaction
+            cursor.execute(f'''
+                INSERT INTO ProviderRatingSummary (ProviderID, ReviewCount, RatingSum, Stars{rating})
+                VALUES (%s, 1, %s, 1)
+                ON DUPLICATE KEY UPDATE
+                    ReviewCount = ReviewCount + 1,
+                    RatingSum = RatingSum + VALUES(RatingSum),
+                    Stars{rating} = Stars{rating} + 1
+            ''', (provider_id, rating))
+            
+            cursor.execute('SELECT Name FROM User WHERE U_ID = %s', (provider_id,))
+            provider = cursor.fetchone()
             
             db.commit()
+            catalog_cache.invalidate()
             cursor.close()
             db.close()
-            return jsonify({'message': 'Review added successfully'})
+            return jsonify({
+                'message': 'Review added successfully',
+                'provider': provider['Name'] if provider else None,
+                'rating': rating
+            })
         except Exception as e:
-            print(f"Error in add_review: {str(e)}")
+            app.logger.error("Error in add_review: %s", e)
             return jsonify({'error': str(e)}), 500
     return jsonify({'error': 'Unauthorized'}), 401
 
+@app.route('/api/provider/<int:provider_id>/reviews', methods=['GET'])
+def get_provider_reviews(provider_id):
+    """A provider's rating summary and a page of reviews, newest first (?limit=&after=)"""
+    try:
+        page = get_page_args() or {'limit': DEFAULT_PAGE_SIZE, 'after': None}
+        db = get_db()
+        cursor = db.cursor(dictionary=True)
+        
+        cursor.execute('SELECT * FROM ProviderRatingSummary WHERE ProviderID = %s', (provider_id,))
+        summary = cursor.fetchone() or {}
+        total_reviews = summary.get('ReviewCount', 0)
+        
+        id_column = table_id_column(cursor, 'Reviews')
+        cursor.execute(*paged_query(f'''
+            SELECT r.{id_column} AS review_id, r.Rating, r.Comments AS Comment,
+                   r.Timestamp AS ReviewDate, u.Name AS customer_name
+            FROM Reviews r
+            LEFT JOIN User u ON r.CustomerID = u.U_ID
+            WHERE r.ProviderID = %s
+        ''', (provider_id,), ['ReviewDate', 'review_id'], page, nullable=['ReviewDate']))
+        reviews, next_cursor = split_page(cursor.fetchall(), ['ReviewDate', 'review_id'], page)
+        
+        cursor.close()
+        db.close()
+        return jsonify({
+            'provider_id': provider_id,
+            'average_rating': round(summary['RatingSum'] / total_reviews, 2) if total_reviews else 0,
+            'total_reviews': total_reviews,
+            'histogram': {str(stars): summary.get(f'Stars{stars}', 0) for stars in range(1, 6)},
+            'reviews': reviews,
+            'next_cursor': next_cursor
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error("Error in get_provider_reviews: %s", e)
+        return jsonify({'error': str(e)}), 500
+
 # Payments API
 @app.route('/process_payment/<int:booking_id>', methods=['POST'])
 def process_payment(booking_id):
@@ -1195,114 +4297,20 @@ def process_payment(booking_id):
             payment_method = request.form.get('payment_method', 'Credit Card')
             amount = request.form.get('amount')
             
-            print(f"Processing payment for booking #{booking_id} with method {payment_method}, amount {amount}")
+            app.logger.info("Processing payment for booking #%s with method %s, amount %s", booking_id, payment_method, amount)
             
-            # Map payment method to allowed ENUM values
-            payment_method_map = {
-                'credit_card': 'Credit Card',
-                'debit_card': 'Debit Card',
-                'paypal': 'Credit Card',  # Map PayPal to Credit Card since it's not in the ENUM
-                'bank_transfer': 'Net Banking'  # Map bank_transfer to Net Banking
-            }
-            
-            # Use mapped value or default to Credit Card if not found
-            mapped_payment_method = payment_method_map.get(payment_method, 'Credit Card')
-            
-            db = get_db()
-            cursor = db.cursor(dictionary=True)
-            
-            # Get booking details
-            cursor.execute('''
-                SELECT b.*, s.Name as service_name, s.Price, b.ProviderID
-                FROM Bookings b
-                JOIN Services s ON b.S_ID = s.S_ID
-                WHERE b.B_ID = %s AND b.CustomerID = %s
-            ''', (booking_id, session['id']))
+            result = record_payment(
+                get_db(), booking_id, session['id'], payment_method, amount=amount,
+                idempotency_key=get_idempotency_key(), owner_id=session['id'])
             
-            booking = cursor.fetchone()
-            
-            if not booking:
-                cursor.close()
-                db.close()
+            return jsonify({"success": True, "message": "Payment processed successfully",
+                            "payment_id": result['payment_id'], "invoice_id": result['invoice_id']})
+        except PaymentError as e:
+            if e.status_code in (403, 404):
                 return jsonify({"success": False, "message": "Booking not found or does not belong to you"})
-            
-            # Check if payment already exists
-            cursor.execute('''
-                SELECT * FROM Payments WHERE B_ID = %s
-            ''', (booking_id,))
-            
-            existing_payment = cursor.fetchone()
-            
-            if existing_payment:
-                cursor.close()
-                db.close()
-                return jsonify({"success": False, "message": "Payment already processed for this booking"})
-            
-            # Process payment - use booking price if no amount provided
-            if not amount:
-                amount = booking['Price']
-            payment_date = datetime.now().strftime('%Y-%m-%d')
-            
-            # Insert payment with ProviderID for easier earnings calculations
-            cursor.execute('''
-                INSERT INTO Payments (B_ID, CustomerID, Amount, PaymentDate, PaymentMethod, PaymentStatus, ProviderID)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ''', (booking_id, session['id'], amount, payment_date, mapped_payment_method, 'Success', booking['ProviderID']))
-            
-            payment_id = cursor.lastrowid
-            
-            # Update booking status to Confirmed and make sure PaymentStatus is Paid
-            cursor.execute('''
-                UPDATE Bookings
-                SET Status = 'Confirmed', PaymentStatus = 'Paid'
-                WHERE B_ID = %s
-            ''', (booking_id,))
-            
-            # Verify the update was successful by reading back the record
-            cursor.execute('''
-                SELECT Status, PaymentStatus FROM Bookings WHERE B_ID = %s
-            ''', (booking_id,))
-            updated_booking = cursor.fetchone()
-            print(f"Updated booking status: {updated_booking}")
-            
-            # Create invoice - use U_ID and B_ID instead of P_ID
-            try:
-                cursor.execute('''
-                    INSERT INTO Invoices (U_ID, B_ID, Amount, Date)
-                    VALUES (%s, %s, %s, %s)
-                ''', (session['id'], booking_id, amount, payment_date))
-                
-                invoice_id = cursor.lastrowid
-                
-                # Create notification for customer
-                cursor.execute('''
-                    INSERT INTO Notifications (U_ID, Message)
-                    VALUES (%s, %s)
-                ''', (session['id'], f'Your payment of ${amount} for booking #{booking_id} was successful. Invoice #{invoice_id} has been generated.'))
-                
-                # Notify provider
-                cursor.execute('''
-                    INSERT INTO Notifications (U_ID, Message)
-                    VALUES (%s, %s)
-                ''', (booking['ProviderID'], f'Payment received for booking #{booking_id}. Amount: ${amount}'))
-                
-                # Make sure to commit all changes
-                db.commit()
-                
-                cursor.close()
-                db.close()
-                
-                return jsonify({"success": True, "message": "Payment processed successfully"})
-            except Exception as e:
-                print(f"Error creating invoice: {str(e)}")
-                # Still return success since payment was processed, even if invoice creation failed
-                db.commit()
-                cursor.close()
-                db.close()
-                return jsonify({"success": True, "message": "Payment processed, but invoice creation failed"})
-                
+            return jsonify({"success": False, "message": str(e)})
         except Exception as e:
-            print(f"Error processing payment: {str(e)}")
+            app.logger.error("Error processing payment: %s", e)
             return jsonify({"success": False, "message": f"Error processing payment: {str(e)}"})
     return jsonify({"success": False, "message": "Unauthorized"}), 401
 
@@ -1348,7 +4356,7 @@ def make_payment(booking_id):
             
             return render_template('payment.html', booking=booking, now=int(time.time()))
         except Exception as e:
-            print(f"Error loading payment page: {str(e)}")
+            app.logger.error("Error loading payment page: %s", e)
             flash('Error loading payment page', 'error')
             return redirect(url_for('user_dashboard'))
     return redirect(url_for('login'))
@@ -1449,7 +4457,7 @@ def view_invoice_by_id(invoice_id):
                               payment=invoice_info,
                               invoice_number=invoice_number)
     except Exception as e:
-        print(f"Error viewing invoice: {str(e)}")
+        app.logger.error("Error viewing invoice: %s", e)
         flash('Error viewing invoice', 'error')
         return redirect(url_for('user_dashboard'))
 
@@ -1464,29 +4472,33 @@ def get_invoices():
     cursor = None
     conn = None
     try:
+        page = get_page_args()
         conn = get_db()
-        cursor = conn.cursor(dictionary=True)
+        cursor = conn.cursor()
         
         if session.get('role'):  # Admin
-            cursor.execute("SELECT * FROM Invoices")
+            query, params = "SELECT * FROM Invoices", ()
         elif user_type == 'ServiceProvider':
-            cursor.execute("""
+            query, params = """
                 SELECT i.* FROM Invoices i 
                 JOIN Bookings b ON i.B_ID = b.B_ID 
                 WHERE b.ProviderID = %s
-            """, (user_id,))
+            """, (user_id,)
         else:  # Customer
-            cursor.execute("""
+            query, params = """
                 SELECT i.* FROM Invoices i 
                 JOIN Bookings b ON i.B_ID = b.B_ID 
                 WHERE b.CustomerID = %s
-            """, (user_id,))
-            
-        invoices = cursor.fetchall()
-        return jsonify(invoices)
+            """, (user_id,)
+        
+        cursor.execute(*paged_query(query, params, ['I_ID'], page))
+        invoices, next_cursor = split_page(fetch_records(cursor), ['I_ID'], page)
+        return jsonify(page_body(invoices, next_cursor, page))
     
+    except QueryArgumentError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"Error retrieving invoices: {str(e)}")
+        app.logger.error("Error retrieving invoices: %s", e)
         return jsonify({"error": "Failed to retrieve invoices"}), 500
     
     finally:
@@ -1495,6 +4507,14 @@ def get_invoices():
         if conn:
             conn.close()
 
+@app.route('/api/admin/invoices/export', methods=['GET'])
+def export_invoices():
+    """Stream every invoice as a JSON array, NDJSON or CSV (?format=json|ndjson|csv)"""
+    if is_admin_session():
+        return export_response('SELECT * FROM Invoices ORDER BY I_ID', (),
+                               request.args.get('format', 'json'), 'invoices')
+    return jsonify({"error": "Authentication required"}), 401
+
 @app.route('/debug/reset_payment/<int:booking_id>', methods=['GET'])
 def debug_reset_payment(booking_id):
     """Debug route to reset a booking's payment status"""
@@ -1510,7 +4530,15 @@ def debug_reset_payment(booking_id):
                 WHERE B_ID = %s
             ''', (booking_id,))
             
-            # Also delete any existing payment records
+            # Take any existing payment records out of the earnings rollup, then delete them
+            cursor.execute('''
+                SELECT b.ProviderID, p.PaymentDate, p.Amount
+                FROM Payments p
+                JOIN Bookings b ON p.B_ID = b.B_ID
+                WHERE p.B_ID = %s AND p.PaymentStatus = 'Success'
+            ''', (booking_id,))
+            for provider_id, payment_date, amount in cursor.fetchall():
+                add_provider_earnings(cursor, provider_id, payment_date, amount=-amount, payment_count=-1)
             cursor.execute('DELETE FROM Payments WHERE B_ID = %s', (booking_id,))
             cursor.execute('DELETE FROM Invoices WHERE B_ID = %s', (booking_id,))
             
@@ -1533,61 +4561,29 @@ def get_booking_status(booking_id):
             
             # Get booking with payment status and service details
             if session.get('user_type') == 'Customer':
-                cursor.execute('''
-                    SELECT b.*, s.Name as service_name, s.Price,
-                           (SELECT COUNT(*) FROM Payments p WHERE p.B_ID = b.B_ID) as payment_made,
-                           (SELECT COUNT(*) FROM Cancellation c WHERE c.B_ID = b.B_ID) as is_cancelled
-                    FROM Bookings b
-                    JOIN Services s ON b.S_ID = s.S_ID
-                    WHERE b.B_ID = %s AND b.CustomerID = %s
-                ''', (booking_id, session['id']))
+                cursor.execute(booking_list_sql(
+                    columns='s.Name as service_name, s.Price',
+                    joins='JOIN Services s ON b.S_ID = s.S_ID',
+                    where='b.B_ID = %s AND b.CustomerID = %s'
+                ), (booking_id, session['id']))
             else:  # Service Provider
-                cursor.execute('''
-                    SELECT b.*, s.Name as service_name, s.Price,
-                           (SELECT COUNT(*) FROM Payments p WHERE p.B_ID = b.B_ID) as payment_made,
-                           (SELECT COUNT(*) FROM Cancellation c WHERE c.B_ID = b.B_ID) as is_cancelled
-                    FROM Bookings b
-                    JOIN Services s ON b.S_ID = s.S_ID
-                    WHERE b.B_ID = %s AND b.ProviderID = %s
-                ''', (booking_id, session['id']))
+                cursor.execute(booking_list_sql(
+                    columns='s.Name as service_name, s.Price',
+                    joins='JOIN Services s ON b.S_ID = s.S_ID',
+                    where='b.B_ID = %s AND b.ProviderID = %s'
+                ), (booking_id, session['id']))
             
             fetched_booking = cursor.fetchone()
             cursor.close()
             db.close()
             
             if fetched_booking:
-                # Create a serializable booking object
-                booking = {}
-                
-                # Process each key/value pair
-                for key, value in fetched_booking.items():
-                    if key == 'BookingTime' and isinstance(value, timedelta):
-                        # Convert timedelta to string
-                        hours, remainder = divmod(value.seconds, 3600)
-                        minutes, _ = divmod(remainder, 60)
-                        booking[key] = f"{hours:02d}:{minutes:02d}"
-                    elif key == 'BookingDate' and isinstance(value, datetime):
-                        # Convert date to string
-                        booking[key] = value.strftime('%Y-%m-%d')
-                    elif key == 'Price' and value is not None:
-                        # Ensure price is a float
-                        booking[key] = float(value)
-                    else:
-                        # Keep other values as-is
-                        booking[key] = value
-                
-                # Add derived fields
-                booking['payment_made'] = int(fetched_booking.get('payment_made', 0))
-                booking['is_cancelled'] = int(fetched_booking.get('is_cancelled', 0))
-                booking['Status'] = fetched_booking.get('Status', 'Pending')
-                booking['PaymentStatus'] = fetched_booking.get('PaymentStatus', 'Not Paid')
-                
-                # Return the serializable booking
-                return jsonify(booking)
+                fill_defaults([fetched_booking], {'Status': 'Pending', 'PaymentStatus': 'Not Paid'})
+                return jsonify(fetched_booking)
             
             return jsonify({'error': 'Booking not found'}), 404
         except Exception as e:
-            print(f"Error in get_booking_status: {str(e)}")
+            app.logger.error("Error in get_booking_status: %s", e)
             return jsonify({'error': str(e)}), 500
     return jsonify({'error': 'Unauthorized'}), 401
 
@@ -1634,7 +4630,7 @@ def force_update_payment(booking_id):
             db.close()
             return jsonify(result)
         except Exception as e:
-            print(f"Error force-updating payment: {str(e)}")
+            app.logger.error("Error force-updating payment: %s", e)
             return jsonify({"success": False, "message": str(e)}), 500
     return jsonify({"success": False, "message": "Unauthorized"}), 401
 
@@ -1644,8 +4640,6 @@ def get_booking(booking_id):
     if 'loggedin' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    print(f"API request for booking ID: {booking_id} by user ID: {session.get('id')}")
-    
     try:
         # Create cursor with get_db instead of mysql.connection
         db = get_db()
@@ -1663,7 +4657,6 @@ def get_booking(booking_id):
                 LEFT JOIN User u ON b.ProviderID = u.U_ID
                 WHERE b.B_ID = %s AND b.CustomerID = %s
             '''
-            print(f"Executing query for customer: {query}")
             cursor.execute(query, (booking_id, session['id']))
             booking = cursor.fetchone()
         # For service providers, return bookings for their services
@@ -1677,13 +4670,12 @@ def get_booking(booking_id):
                 LEFT JOIN User u2 ON b.CustomerID = u2.U_ID
                 WHERE b.B_ID = %s AND b.ProviderID = %s
             '''
-            print(f"Executing query for provider: {query}")
             cursor.execute(query, (booking_id, session['id']))
             booking = cursor.fetchone()
         
         # If no booking was found and we're in development mode, try a generic query
         if not booking and app.debug:
-            print("No booking found with user restrictions, trying generic query in debug mode")
+            app.logger.debug("Booking %s not found for user %s, retrying without restrictions", booking_id, session['id'])
             query = '''
                 SELECT b.B_ID as id, b.BookingDate as booking_date, b.BookingTime as booking_time, 
                        b.Status as status, s.Name as service_name, s.Price as price,
@@ -1697,8 +4689,6 @@ def get_booking(booking_id):
             cursor.execute(query, (booking_id,))
             booking = cursor.fetchone()
         
-        print(f"Query result: {booking}")
-        
         if booking:
             response = {
                 'status': 'success',
@@ -1709,7 +4699,7 @@ def get_booking(booking_id):
         else:
             return jsonify({'status': 'error', 'message': 'Booking not found'}), 404
     except Exception as e:
-        print(f"Error in get_booking: {str(e)}")
+        app.logger.error("Error in get_booking: %s", e)
         return jsonify({'status': 'error', 'message': str(e)}), 500
     finally:
         if 'cursor' in locals():
@@ -1722,7 +4712,12 @@ def create_payment():
     if 'loggedin' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    data = request.json
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({
+            'status': 'error',
+            'message': 'Request body must be a JSON object'
+        }), 400
     booking_id = data.get('booking_id')
     payment_method = data.get('payment_method')
     
@@ -1733,108 +4728,27 @@ def create_payment():
         }), 400
     
     try:
-        # Create cursor with get_db
-        db = get_db()
-        cursor = db.cursor(dictionary=True)
-        
-        # Get booking details
-        cursor.execute('''
-            SELECT b.B_ID, b.CustomerID, b.ProviderID, b.Status, s.Price
-            FROM Bookings b
-            JOIN Services s ON b.S_ID = s.S_ID
-            WHERE b.B_ID = %s
-        ''', (booking_id,))
-        
-        booking = cursor.fetchone()
-        
-        # Check if booking exists and belongs to the user
-        if not booking:
-            return jsonify({
-                'status': 'error',
-                'message': 'Booking not found'
-            }), 404
-        
-        if session['user_type'] == 'Customer' and booking['CustomerID'] != session['id']:
-            return jsonify({
-                'status': 'error',
-                'message': 'Unauthorized access to this booking'
-            }), 403
-        
-        # Map payment method from frontend to database values
-        payment_method_map = {
-            'credit_card': 'Credit Card',
-            'debit_card': 'Debit Card',
-            'paypal': 'Paypal',  # Map PayPal to Credit Card since it's not in the ENUM
-            'bank_transfer': 'Net Banking'  # Map bank_transfer to Net Banking
-        }
-        
-        # Insert payment record
-        payment_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        cursor.execute('''
-            INSERT INTO Payments (B_ID, CustomerID, Amount, PaymentDate, PaymentMethod, PaymentStatus)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (
-            booking_id,
-            session['id'],
-            booking['Price'],
-            payment_date,
-            payment_method_map.get(payment_method, payment_method),
-            'Success'
-        ))
-        
-        payment_id = cursor.lastrowid
-        
-        # Update booking status
-        cursor.execute('''
-            UPDATE Bookings SET Status = %s, PaymentStatus = %s WHERE B_ID = %s
-        ''', (
-            'Confirmed',
-            'Paid',
-            booking_id
-        ))
-        
-        # Create invoice with U_ID and B_ID
-        try:
-            cursor.execute('''
-                INSERT INTO Invoices (U_ID, B_ID, Amount, Date)
-                VALUES (%s, %s, %s, %s)
-            ''', (
-                session['id'],
-                booking_id,
-                booking['Price'],
-                payment_date[:10]  # Only use the date part
-            ))
-        except Exception as invoice_err:
-            print(f"Error creating invoice: {str(invoice_err)}")
-        
-        # Create a notification for the provider
-        cursor.execute('''
-            INSERT INTO Notifications (U_ID, Message)
-            VALUES (%s, %s)
-        ''', (
-            booking['ProviderID'],
-            f'Payment received for booking #{booking_id}. Amount: ${booking["Price"]}'
-        ))
-        
-        db.commit()
+        # Customers may only pay for their own bookings
+        owner_id = session['id'] if session.get('user_type') == 'Customer' else None
+        result = record_payment(
+            get_db(), booking_id, session['id'], payment_method,
+            idempotency_key=get_idempotency_key(), owner_id=owner_id)
         
         return jsonify({
             'status': 'success',
             'message': 'Payment processed successfully',
-            'payment_id': payment_id
+            'payment_id': result['payment_id']
         })
+    except PaymentError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), e.status_code
     except Exception as e:
-        if 'db' in locals():
-            db.rollback()
         return jsonify({
             'status': 'error',
             'message': f'Payment processing failed: {str(e)}'
         }), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'db' in locals():
-            db.close()
 
 # Add route for payments.html
 @app.route('/payments')
@@ -1854,7 +4768,7 @@ def payment(booking_id=None):
     if booking_id is None:
         booking_id = request.args.get('id')
     
-    print(f"Payment page accessed with booking_id: {booking_id}")
+    app.logger.debug("Payment page accessed with booking_id: %s", booking_id)
     
     if not booking_id:
         return redirect(url_for('user_dashboard'))
@@ -1911,8 +4825,8 @@ def get_pending_service_providers():
     # Make authentication check more lenient for admin users
     try:
         # Check authentication in different ways
-        if 'loggedin' in session and (session.get('role') or session.get('id') in get_admin_ids()):
-            print(f"Admin request for pending providers from {session.get('name')}")
+        if is_admin_session():
+            app.logger.debug("Admin %s requested pending providers", session.get('id'))
             db = get_db()
             cursor = db.cursor(dictionary=True)
             
@@ -1929,33 +4843,24 @@ def get_pending_service_providers():
             db.close()
             return jsonify(providers)
         else:
-            print(f"Unauthorized admin API access. Session data: loggedin={session.get('loggedin')}, role={session.get('role')}")
+            app.logger.warning("Unauthorized admin API access by user %s", session.get('id'))
             return jsonify({'error': 'Unauthorized'}), 401
     except Exception as e:
-        print(f"Error in get_pending_service_providers: {str(e)}")
+        app.logger.error("Error in get_pending_service_providers: %s", e)
         return jsonify({'error': str(e)}), 500
 
-# Helper function to get admin IDs from the database
-def get_admin_ids():
-    try:
-        db = get_db()
-        cursor = db.cursor(dictionary=True)
-        cursor.execute('SELECT A_ID FROM Admin')
-        admin_ids = [admin['A_ID'] for admin in cursor.fetchall()]
-        cursor.close()
-        db.close()
-        return admin_ids
-    except Exception as e:
-        print(f"Error getting admin IDs: {str(e)}")
-        return []
+@app.route('/api/admin/db/pool', methods=['GET'])
+def get_db_pool_stats():
+    """Connection pool statistics for monitoring"""
+    is_admin = is_admin_session()
+
+    if is_admin:
+        return jsonify(get_pool().stats())
+    return jsonify({'error': 'Unauthorized'}), 401
 
 @app.route('/api/admin/providers/<int:provider_id>/approve', methods=['POST'])
 def approve_provider(provider_id):
-    # Check admin authentication in multiple ways
-    is_admin = (
-        'loggedin' in session and 
-        (session.get('role') or session.get('is_admin', False) or session.get('id') in get_admin_ids())
-    )
+    is_admin = is_admin_session()
     
     if is_admin:
         try:
@@ -1980,32 +4885,30 @@ def approve_provider(provider_id):
                         WHERE U_ID = %s AND UserType = 'ServiceProvider'
                     ''', (admin_id, provider_id))
             except Exception as e:
-                print(f"Note: ManagedBy column might not exist in User table: {e}")
+                app.logger.warning("Note: ManagedBy column might not exist in User table: %s", e)
             
             # Create notification for the provider with admin name
             admin_name = get_admin_name(admin_id)
-            cursor.execute('''
-                INSERT INTO Notifications (U_ID, Message)
-                VALUES (%s, %s)
-            ''', (provider_id, f'Your service provider account has been approved by {admin_name}. You can now receive booking requests.'))
+            notifications = notification_dispatcher.stage(cursor, [
+                (provider_id, f'Your service provider account has been approved by {admin_name}. You can now receive booking requests.'),
+            ])
             
             db.commit()
+            catalog_cache.invalidate()
+            search_index.refresh_provider(provider_id)
+            notification_dispatcher.committed(notifications)
             cursor.close()
             db.close()
             
             return jsonify({'status': 'success', 'message': 'Service provider approved successfully'})
         except Exception as e:
-            print(f"Error in approve_provider: {str(e)}")
+            app.logger.error("Error in approve_provider: %s", e)
             return jsonify({'status': 'error', 'message': str(e)}), 500
     return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
 
 @app.route('/api/admin/providers/<int:provider_id>/reject', methods=['POST'])
 def reject_provider(provider_id):
-    # Check admin authentication in multiple ways
-    is_admin = (
-        'loggedin' in session and 
-        (session.get('role') or session.get('is_admin', False) or session.get('id') in get_admin_ids())
-    )
+    is_admin = is_admin_session()
     
     if is_admin:
         try:
@@ -2030,22 +4933,24 @@ def reject_provider(provider_id):
                         WHERE U_ID = %s AND UserType = 'ServiceProvider'
                     ''', (admin_id, provider_id))
             except Exception as e:
-                print(f"Note: ManagedBy column might not exist in User table: {e}")
+                app.logger.warning("Note: ManagedBy column might not exist in User table: %s", e)
             
             # Create notification for the provider with admin name
             admin_name = get_admin_name(admin_id)
-            cursor.execute('''
-                INSERT INTO Notifications (U_ID, Message)
-                VALUES (%s, %s)
-            ''', (provider_id, f'Your service provider application has been rejected by {admin_name}. Please contact support for more information.'))
+            notifications = notification_dispatcher.stage(cursor, [
+                (provider_id, f'Your service provider application has been rejected by {admin_name}. Please contact support for more information.'),
+            ])
             
             db.commit()
+            catalog_cache.invalidate()
+            search_index.refresh_provider(provider_id)
+            notification_dispatcher.committed(notifications)
             cursor.close()
             db.close()
             
             return jsonify({'status': 'success', 'message': 'Service provider rejected successfully'})
         except Exception as e:
-            print(f"Error in reject_provider: {str(e)}")
+            app.logger.error("Error in reject_provider: %s", e)
             return jsonify({'status': 'error', 'message': str(e)}), 500
     return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
 
@@ -2070,7 +4975,7 @@ def get_provider_services():
             db.close()
             return jsonify(services)
         except Exception as e:
-            print(f"Error in get_provider_services: {str(e)}")
+            app.logger.error("Error in get_provider_services: %s", e)
             return jsonify({'error': str(e)}), 500
     return jsonify({'error': 'Unauthorized'}), 401
 
@@ -2098,18 +5003,20 @@ def add_provider_service():
             service_id = cursor.lastrowid
             
             # Create a notification for the provider
-            cursor.execute('''
-                INSERT INTO Notifications (U_ID, Message)
-                VALUES (%s, %s)
-            ''', (session['id'], 'Your new service has been successfully added.'))
+            notifications = notification_dispatcher.stage(cursor, [
+                (session['id'], 'Your new service has been successfully added.'),
+            ])
             
             db.commit()
+            catalog_cache.invalidate()
+            search_index.refresh_service(service_id)
+            notification_dispatcher.committed(notifications)
             cursor.close()
             db.close()
             
             return jsonify({'success': True, 'service_id': service_id})
         except Exception as e:
-            print(f"Error adding provider service: {str(e)}")
+            app.logger.error("Error adding provider service: %s", e)
             return jsonify({'success': False, 'message': str(e)}), 500
     return jsonify({'success': False, 'message': 'Unauthorized'}), 401
 
@@ -2135,7 +5042,7 @@ def get_provider_service(service_id):
             else:
                 return jsonify({'error': 'Service not found or not authorized'}), 404
         except Exception as e:
-            print(f"Error in get_provider_service: {str(e)}")
+            app.logger.error("Error in get_provider_service: %s", e)
             return jsonify({'error': str(e)}), 500
     return jsonify({'error': 'Unauthorized'}), 401
 
@@ -2165,12 +5072,14 @@ def update_provider_service(service_id):
                 return jsonify({'success': False, 'message': 'Service not found or not authorized'}), 404
                 
             db.commit()
+            catalog_cache.invalidate()
+            search_index.refresh_service(service_id)
             cursor.close()
             db.close()
             
             return jsonify({'success': True})
         except Exception as e:
-            print(f"Error updating provider service: {str(e)}")
+            app.logger.error("Error updating provider service: %s", e)
             return jsonify({'success': False, 'message': str(e)}), 500
     return jsonify({'success': False, 'message': 'Unauthorized'}), 401
 
@@ -2205,12 +5114,14 @@ def delete_provider_service(service_id):
                 return jsonify({'success': False, 'message': 'Service not found or not authorized'}), 404
                 
             db.commit()
+            catalog_cache.invalidate()
+            search_index.remove(service_id)
             cursor.close()
             db.close()
             
             return jsonify({'success': True})
         except Exception as e:
-            print(f"Error deleting provider service: {str(e)}")
+            app.logger.error("Error deleting provider service: %s", e)
             return jsonify({'success': False, 'message': str(e)}), 500
     return jsonify({'success': False, 'message': 'Unauthorized'}), 401
 
@@ -2231,7 +5142,7 @@ def admin_update_schema():
                     cursor.execute("ALTER TABLE Services ADD COLUMN ProviderID INT DEFAULT NULL")
                     updates_made.append("Added ProviderID column")
             except Exception as e:
-                print(f"Error checking/adding ProviderID column: {str(e)}")
+                app.logger.error("Error checking/adding ProviderID column: %s", e)
             
             # Try to add is_approved column if it doesn't exist
             try:
@@ -2240,7 +5151,7 @@ def admin_update_schema():
                     cursor.execute("ALTER TABLE Services ADD COLUMN is_approved TINYINT DEFAULT 0")
                     updates_made.append("Added is_approved column")
             except Exception as e:
-                print(f"Error checking/adding is_approved column: {str(e)}")
+                app.logger.error("Error checking/adding is_approved column: %s", e)
             
             # Try to add Duration column if it doesn't exist
             try:
@@ -2249,7 +5160,7 @@ def admin_update_schema():
                     cursor.execute("ALTER TABLE Services ADD COLUMN Duration INT DEFAULT 60")
                     updates_made.append("Added Duration column")
             except Exception as e:
-                print(f"Error checking/adding Duration column: {str(e)}")
+                app.logger.error("Error checking/adding Duration column: %s", e)
             
             # Update existing services to be approved by default
             try:
@@ -2258,7 +5169,7 @@ def admin_update_schema():
                 if updated_rows > 0:
                     updates_made.append(f"Set {updated_rows} existing services to approved status")
             except Exception as e:
-                print(f"Error updating existing services: {str(e)}")
+                app.logger.error("Error updating existing services: %s", e)
             
             # Try to add foreign key constraint if it doesn't exist
             try:
@@ -2280,9 +5191,11 @@ def admin_update_schema():
                     """)
                     updates_made.append("Added foreign key constraint")
             except Exception as e:
-                print(f"Error adding foreign key constraint: {str(e)}")
+                app.logger.error("Error adding foreign key constraint: %s", e)
             
             db.commit()
+            catalog_cache.invalidate()
+            search_index.invalidate()
             cursor.close()
             db.close()
             
@@ -2311,33 +5224,35 @@ def update_schema():
             cursor.execute("SHOW COLUMNS FROM Services LIKE 'ProviderID'")
             if not cursor.fetchone():
                 cursor.execute("ALTER TABLE Services ADD COLUMN ProviderID INT DEFAULT NULL")
-                print("Added ProviderID column")
+                app.logger.info("Added ProviderID column")
         except Exception as e:
-            print(f"ProviderID column might already exist: {str(e)}")
+            app.logger.info("ProviderID column might already exist: %s", e)
         
         # Try to add is_approved column if it doesn't exist
         try:
             cursor.execute("SHOW COLUMNS FROM Services LIKE 'is_approved'")
             if not cursor.fetchone():
                 cursor.execute("ALTER TABLE Services ADD COLUMN is_approved TINYINT DEFAULT 0")
-                print("Added is_approved column")
+                app.logger.info("Added is_approved column")
         except Exception as e:
-            print(f"is_approved column might already exist: {str(e)}")
+            app.logger.info("is_approved column might already exist: %s", e)
         
         # Try to add Duration column if it doesn't exist
         try:
             cursor.execute("SHOW COLUMNS FROM Services LIKE 'Duration'")
             if not cursor.fetchone():
                 cursor.execute("ALTER TABLE Services ADD COLUMN Duration INT DEFAULT 60")
-                print("Added Duration column")
+                app.logger.info("Added Duration column")
         except Exception as e:
-            print(f"Duration column might already exist: {str(e)}")
+            app.logger.info("Duration column might already exist: %s", e)
         
         # Update existing services to be approved by default
         cursor.execute("UPDATE Services SET is_approved = 1 WHERE is_approved IS NULL OR is_approved = 0")
-        print(f"Updated {cursor.rowcount} services to approved status")
+        app.logger.info("Updated %d services to approved status", cursor.rowcount)
         
         db.commit()
+        catalog_cache.invalidate()
+        search_index.invalidate()
         cursor.close()
         db.close()
         
@@ -2375,7 +5290,7 @@ def get_provider_profile():
             else:
                 return jsonify({'error': 'Provider not found'}), 404
         except Exception as e:
-            print(f"Error in get_provider_profile: {str(e)}")
+            app.logger.error("Error in get_provider_profile: %s", e)
             return jsonify({'error': str(e)}), 500
     return jsonify({'error': 'Unauthorized'}), 401
 
@@ -2410,6 +5325,8 @@ def update_provider_profile():
             ))
             
             db.commit()
+            catalog_cache.invalidate()
+            search_index.refresh_provider(session['id'])
             
             # Update session data
             session['name'] = data.get('name', '')
@@ -2424,7 +5341,7 @@ def update_provider_profile():
                 'message': 'Profile updated successfully'
             })
         except Exception as e:
-            print(f"Error updating provider profile: {str(e)}")
+            app.logger.error("Error updating provider profile: %s", e)
             return jsonify({
                 'success': False,
                 'message': f"Error updating profile: {str(e)}"
@@ -2484,7 +5401,7 @@ def update_provider_password():
                 'message': 'Password updated successfully'
             })
         except Exception as e:
-            print(f"Error updating provider password: {str(e)}")
+            app.logger.error("Error updating provider password: %s", e)
             return jsonify({
                 'success': False,
                 'message': f"Error updating password: {str(e)}"
@@ -2510,7 +5427,7 @@ def create_test_payment():
         if not provider_id:
             return jsonify({"success": False, "message": "Provider ID not found in session"}), 400
             
-        print(f"Creating test payment for provider ID: {provider_id}, Name: {session.get('name')}")
+        app.logger.debug("Creating test payment for provider ID: %s", provider_id)
         
         db = get_db()
         cursor = db.cursor(dictionary=True)
@@ -2533,10 +5450,10 @@ def create_test_payment():
             ''', ('Test Service', 50.00, 'Test service for payment testing', 60, provider_id))
             db.commit()
             service_id = cursor.lastrowid
-            print(f"Created new service with ID: {service_id} for provider")
+            app.logger.debug("Created new service with ID: %s for provider", service_id)
         else:
             service_id = service['S_ID']
-            print(f"Using existing service with ID: {service_id}")
+            app.logger.debug("Using existing service with ID: %s", service_id)
         
         # Create multiple test bookings and payments (3 bookings in different months)
         bookings_data = [
@@ -2569,7 +5486,7 @@ def create_test_payment():
             booking_date = booking_data['date']
             booking_time = booking_data['time']
             
-            print(f"Creating booking {idx+1}: Date={booking_date}, Time={booking_time}")
+            app.logger.debug("Creating booking %d: Date=%s, Time=%s", idx + 1, booking_date, booking_time)
             
             cursor.execute('''
                 INSERT INTO Bookings (CustomerID, ProviderID, S_ID, BookingDate, BookingTime, Status, PaymentStatus)
@@ -2578,7 +5495,7 @@ def create_test_payment():
                   booking_data['status'], 'Paid' if idx < 2 else 'Not Paid'))
             
             booking_id = cursor.lastrowid
-            print(f"Created booking with ID: {booking_id}")
+            app.logger.debug("Created booking with ID: %s", booking_id)
             
             # Only create payment for confirmed bookings
             if idx < 2:
@@ -2590,7 +5507,8 @@ def create_test_payment():
                 ''', (booking_id, customer['U_ID'], booking_data['amount'], payment_date, 'Credit Card', 'Success', provider_id))
                 
                 payment_id = cursor.lastrowid
-                print(f"Created payment with ID: {payment_id}")
+                add_provider_earnings(cursor, provider_id, payment_date, amount=booking_data['amount'], payment_count=1)
+                app.logger.debug("Created payment with ID: %s", payment_id)
                 
                 # Create a test invoice
                 cursor.execute('''
@@ -2629,7 +5547,7 @@ def create_test_payment():
             }
         })
     except Exception as e:
-        print(f"Error creating test data: {str(e)}")
+        app.logger.error("Error creating test data: %s", e)
         return jsonify({"success": False, "message": f"Error creating test data: {str(e)}"}), 500
 
 def check_provider_payments(provider_id):
@@ -2664,7 +5582,7 @@ def check_provider_payments(provider_id):
             "direct_payments": direct_payment_count
         }
     except Exception as e:
-        print(f"Error checking provider payments: {str(e)}")
+        app.logger.error("Error checking provider payments: %s", e)
         return {"error": str(e)}
 
 # Add a new route for provider earnings
@@ -2675,95 +5593,19 @@ def get_provider_earnings():
             db = get_db()
             cursor = db.cursor(dictionary=True)
             
-            # Get total earnings
-            cursor.execute('''
-                SELECT SUM(p.Amount) as total_earnings
-                FROM Payments p
-                JOIN Bookings b ON p.B_ID = b.B_ID
-                WHERE b.ProviderID = %s AND p.PaymentStatus = 'Success'
-            ''', (session['id'],))
-            
-            total_earnings = cursor.fetchone()
-            
-            # Get current month earnings
-            current_month = datetime.now().strftime('%Y-%m-01')
-            cursor.execute('''
-                SELECT SUM(p.Amount) as month_earnings
-                FROM Payments p
-                JOIN Bookings b ON p.B_ID = b.B_ID
-                WHERE b.ProviderID = %s 
-                AND p.PaymentStatus = 'Success'
-                AND p.PaymentDate >= %s
-            ''', (session['id'], current_month))
-            
-            month_earnings = cursor.fetchone()
-            
-            # Get pending payments
-            cursor.execute('''
-                SELECT SUM(s.Price) as pending_amount
-                FROM Bookings b
-                JOIN Services s ON b.S_ID = s.S_ID
-                WHERE b.ProviderID = %s 
-                AND b.Status = 'Pending'
-                AND b.PaymentStatus = 'Not Paid'
-            ''', (session['id'],))
-            
-            pending_amount = cursor.fetchone()
-            
-            # Get recent payment history
-            cursor.execute('''
-                SELECT p.P_ID, p.Amount, p.PaymentDate, p.PaymentMethod, p.PaymentStatus,
-                       b.B_ID, s.Name as service_name, c.Name as customer_name
-                FROM Payments p
-                JOIN Bookings b ON p.B_ID = b.B_ID
-                JOIN Services s ON b.S_ID = s.S_ID
-                JOIN User c ON b.CustomerID = c.U_ID
-                WHERE b.ProviderID = %s
-                ORDER BY p.PaymentDate DESC
-                LIMIT 10
-            ''', (session['id'],))
-            
-            recent_payments = cursor.fetchall()
-            
-            # Format the payment dates
-            for payment in recent_payments:
-                if payment.get('PaymentDate'):
-                    payment['PaymentDate'] = payment['PaymentDate'].strftime('%Y-%m-%d')
+            # Totals, pending payments and recent payment history
+            summary = provider_earnings_summary(cursor, session['id'], pending_status='Pending', recent_limit=10)
             
             cursor.close()
             db.close()
             
-            return jsonify({
-                'total_earnings': float(total_earnings.get('total_earnings', 0) or 0),
-                'month_earnings': float(month_earnings.get('month_earnings', 0) or 0),
-                'pending_amount': float(pending_amount.get('pending_amount', 0) or 0),
-                'recent_payments': recent_payments
-            })
+            return jsonify(summary)
             
         except Exception as e:
-            print(f"Error getting provider earnings: {str(e)}")
+            app.logger.error("Error getting provider earnings: %s", e)
             return jsonify({'error': str(e)}), 500
     return jsonify({'error': 'Unauthorized'}), 401
 
-# Add a new function to get admin's name by ID
-def get_admin_name(admin_id):
-    try:
-        db = get_db()
-        cursor = db.cursor(dictionary=True)
-        
-        cursor.execute('SELECT Name FROM Admin WHERE A_ID = %s', (admin_id,))
-        admin = cursor.fetchone()
-        
-        cursor.close()
-        db.close()
-        
-        if admin and admin.get('Name'):
-            return admin['Name']
-        return "Admin"  # Default name if not found
-    except Exception as e:
-        print(f"Error getting admin name: {str(e)}")
-        return "Admin"  # Default on error
-
 # Add a route to get provider earnings data for the dashboard display
 @app.route('/api/provider/earnings/dashboard', methods=['GET'])
 def get_provider_earnings_dashboard():
@@ -2772,55 +5614,16 @@ def get_provider_earnings_dashboard():
             db = get_db()
             cursor = db.cursor(dictionary=True)
             
-            # Get total earnings
-            cursor.execute('''
-                SELECT COALESCE(SUM(p.Amount), 0) as total_earnings
-                FROM Payments p
-                JOIN Bookings b ON p.B_ID = b.B_ID
-                WHERE b.ProviderID = %s AND p.PaymentStatus = 'Success'
-            ''', (session['id'],))
-            
-            result = cursor.fetchone()
-            total_earnings = float(result['total_earnings']) if result else 0.00
-            
-            # Get current month earnings
-            current_month = datetime.now().strftime('%Y-%m-01')
-            cursor.execute('''
-                SELECT COALESCE(SUM(p.Amount), 0) as month_earnings
-                FROM Payments p
-                JOIN Bookings b ON p.B_ID = b.B_ID
-                WHERE b.ProviderID = %s 
-                AND p.PaymentStatus = 'Success'
-                AND p.PaymentDate >= %s
-            ''', (session['id'], current_month))
-            
-            result = cursor.fetchone()
-            month_earnings = float(result['month_earnings']) if result else 0.00
-            
-            # Get pending payments (from confirmed but unpaid bookings)
-            cursor.execute('''
-                SELECT COALESCE(SUM(s.Price), 0) as pending_amount
-                FROM Bookings b
-                JOIN Services s ON b.S_ID = s.S_ID
-                WHERE b.ProviderID = %s 
-                AND b.Status != 'Cancelled'
-                AND b.PaymentStatus = 'Not Paid'
-            ''', (session['id'],))
-            
-            result = cursor.fetchone()
-            pending_amount = float(result['pending_amount']) if result else 0.00
+            # Pending payments are those of confirmed but unpaid bookings
+            summary = provider_earnings_summary(cursor, session['id'])
             
             cursor.close()
             db.close()
             
-            return jsonify({
-                'total_earnings': total_earnings,
-                'month_earnings': month_earnings,
-                'pending_amount': pending_amount
-            })
+            return jsonify(summary)
             
         except Exception as e:
-            print(f"Error getting provider earnings dashboard: {str(e)}")
+            app.logger.error("Error getting provider earnings dashboard: %s", e)
             return jsonify({
                 'total_earnings': 0.00,
                 'month_earnings': 0.00,
@@ -2834,6 +5637,67 @@ def get_provider_earnings_dashboard():
         'error': 'Unauthorized'
     })
 
+@app.route('/api/provider/earnings/series', methods=['GET'])
+def get_provider_earnings_series():
+    """Earnings chart data: ?start=&end=&granularity=day|week|month&moving_average=N"""
+    if 'loggedin' in session and session.get('user_type') == 'ServiceProvider':
+        try:
+            start, end, granularity, window = parse_series_args(request.args)
+            db = get_db()
+            cursor = db.cursor()
+            series = earnings_series(cursor, start, end, granularity, window, provider_id=session['id'])
+            cursor.close()
+            db.close()
+            return jsonify(series)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            app.logger.error("Error getting provider earnings series: %s", e)
+            return jsonify({'error': str(e)}), 500
+    return jsonify({'error': 'Unauthorized'}), 401
+
+@app.route('/api/admin/earnings/series', methods=['GET'])
+def get_admin_earnings_series():
+    """Platform-wide earnings chart data, or one provider's with ?provider_id="""
+    if is_admin_session():
+        try:
+            start, end, granularity, window = parse_series_args(request.args)
+            db = get_db()
+            cursor = db.cursor()
+            series = earnings_series(cursor, start, end, granularity, window,
+                                     provider_id=request.args.get('provider_id', type=int))
+            cursor.close()
+            db.close()
+            return jsonify(series)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            app.logger.error("Error getting admin earnings series: %s", e)
+            return jsonify({'error': str(e)}), 500
+    return jsonify({'error': 'Unauthorized'}), 401
+
+@app.route('/api/admin/analytics', methods=['GET'])
+def get_admin_analytics():
+    """Platform analytics for the admin dashboard (?days=30), served from summary tables"""
+    if is_admin_session():
+        try:
+            days = max(1, min(request.args.get('days', 30, type=int), MAX_ANALYTICS_DAYS))
+            db = get_db()
+            cursor = db.cursor(dictionary=True)
+            analytics = platform_analytics(cursor, days=days)
+            cursor.close()
+            db.close()
+            return jsonify(analytics)
+        except Exception as e:
+            app.logger.error("Error getting admin analytics: %s", e)
+            return jsonify({'error': str(e)}), 500
+    return jsonify({'error': 'Unauthorized'}), 401
+
 if __name__ == '__main__':
+    # The single-process development server applies migrations itself
+    try:
+        setup_database()
+    except mysql.connector.Error as err:
+        print(f"Database setup error: {err}")
     app.debug = True  # Explicitly set debug mode
     app.run(debug=True) 
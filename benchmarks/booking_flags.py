@@ -0,0 +1,173 @@
+"""Compare the ways of computing payment_made/is_cancelled for booking listings.
+
+Seeds 100k bookings (60% paid, 10% cancelled) into a scratch database on
+the configured MySQL server and times the queries behind
+/api/user/bookings, /api/admin/bookings and /api/booking/<id>/status with:
+
+- correlated COUNT(*) subqueries per row (the original queries)
+- LEFT JOINs against Payments/Cancellation pre-aggregated by B_ID
+- the app's current booking_list_sql()/paged_booking_query() (EXISTS probes)
+
+Uses db_config from app.py with the database replaced by BENCH_DATABASE
+(default booking_flags_bench), which is created and dropped:
+
+    python benchmarks/booking_flags.py [--bookings 100000] [--no-indexes]
+
+--no-indexes leaves Payments.B_ID and Cancellation.B_ID unindexed, as they
+were before the hot-index migrations. Each query is cut off after
+--max-seconds (MySQL's max_execution_time).
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+import mysql.connector
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import db_config, paged_booking_query
+
+CUSTOMERS = 1000
+PROVIDERS = 100
+SERVICES = 500
+
+SCHEMA = [
+    'CREATE TABLE User (U_ID INT PRIMARY KEY, Name VARCHAR(100))',
+    'CREATE TABLE Services (S_ID INT PRIMARY KEY, Name VARCHAR(100), Price DECIMAL(10,2), ProviderID INT)',
+    '''CREATE TABLE Bookings (
+        B_ID INT AUTO_INCREMENT PRIMARY KEY, CustomerID INT, ProviderID INT, S_ID INT,
+        BookingDate DATE, BookingTime TIME, Status VARCHAR(20), PaymentStatus VARCHAR(20),
+        INDEX idx_bookings_customer (CustomerID), INDEX idx_bookings_provider (ProviderID))''',
+    'CREATE TABLE Payments (P_ID INT AUTO_INCREMENT PRIMARY KEY, B_ID INT, Amount DECIMAL(10,2){index})',
+    'CREATE TABLE Cancellation (C_ID INT AUTO_INCREMENT PRIMARY KEY, B_ID INT, RefundAmount DECIMAL(10,2){index})',
+]
+
+CORRELATED_FLAGS = '''
+    (SELECT COUNT(*) FROM Payments pay WHERE pay.B_ID = b.B_ID) AS payment_made,
+    (SELECT COUNT(*) FROM Cancellation can WHERE can.B_ID = b.B_ID) AS is_cancelled
+'''
+DERIVED_FLAGS = '''
+    COALESCE(pay.payment_count, 0) AS payment_made,
+    COALESCE(can.cancel_count, 0) AS is_cancelled
+'''
+DERIVED_JOINS = '''
+    LEFT JOIN (SELECT B_ID, COUNT(*) AS payment_count FROM Payments GROUP BY B_ID) pay ON pay.B_ID = b.B_ID
+    LEFT JOIN (SELECT B_ID, COUNT(*) AS cancel_count FROM Cancellation GROUP BY B_ID) can ON can.B_ID = b.B_ID
+'''
+
+USER_LISTING = dict(columns='s.Name as service_name', joins='JOIN Services s ON b.S_ID = s.S_ID',
+                    where='b.CustomerID = %s')
+ADMIN_LISTING = dict(columns='s.Name as service_name, c.Name as customer_name, p.Name as provider_name',
+                     joins='''JOIN Services s ON b.S_ID = s.S_ID
+                              JOIN User c ON b.CustomerID = c.U_ID
+                              LEFT JOIN User p ON b.ProviderID = p.U_ID''',
+                     where='')
+BOOKING_STATUS = dict(columns='s.Name as service_name, s.Price', joins='JOIN Services s ON b.S_ID = s.S_ID',
+                      where='b.B_ID = %s AND b.CustomerID = %s')
+
+
+def listing_sql(flags, columns, joins, where, extra_joins='', suffix=''):
+    return f'''
+        SELECT b.*, {columns}, {flags}
+        FROM Bookings b
+        {joins}
+        {extra_joins}
+        {'WHERE ' + where if where else ''}
+        {suffix}
+    '''
+
+
+def variants(listing, params, page=None):
+    """(name, sql, params) for each way of computing the flags"""
+    suffix = f"ORDER BY b.B_ID DESC LIMIT {page['limit'] + 1}" if page else ''
+    return [
+        ('correlated COUNT(*)', listing_sql(CORRELATED_FLAGS, suffix=suffix, **listing), params),
+        ('derived tables', listing_sql(DERIVED_FLAGS, extra_joins=DERIVED_JOINS, suffix=suffix, **listing),
+         params),
+        ('EXISTS (current)', *paged_booking_query(params, page, **listing)),
+    ]
+
+
+def seed(cursor, bookings, indexes):
+    for statement in SCHEMA:
+        cursor.execute(statement.format(index=', INDEX (B_ID)' if indexes else ''))
+    cursor.executemany('INSERT INTO User (U_ID, Name) VALUES (%s, %s)',
+                       [(n, f'User {n}') for n in range(1, CUSTOMERS + PROVIDERS + 1)])
+    cursor.executemany('INSERT INTO Services (S_ID, Name, Price, ProviderID) VALUES (%s, %s, %s, %s)',
+                       [(n, f'Service {n}', 50 + n % 200, CUSTOMERS + 1 + n % PROVIDERS)
+                        for n in range(1, SERVICES + 1)])
+    start = date(2025, 1, 1)
+    rows = [(1 + n % CUSTOMERS, CUSTOMERS + 1 + n % PROVIDERS, 1 + n % SERVICES,
+             start + timedelta(days=n % 365), timedelta(hours=8 + n % 10), 'Confirmed',
+             'Paid' if n % 10 < 6 else 'Not Paid')
+            for n in range(bookings)]
+    for offset in range(0, len(rows), 5000):
+        cursor.executemany('''
+            INSERT INTO Bookings (CustomerID, ProviderID, S_ID, BookingDate, BookingTime, Status, PaymentStatus)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ''', rows[offset:offset + 5000])
+    cursor.execute("INSERT INTO Payments (B_ID, Amount) SELECT B_ID, 50 FROM Bookings WHERE PaymentStatus = 'Paid'")
+    cursor.execute('INSERT INTO Cancellation (B_ID, RefundAmount) SELECT B_ID, 0 FROM Bookings WHERE B_ID % 10 = 9')
+
+
+def time_query(cursor, sql, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bookings', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds', type=int, default=60)
+    parser.add_argument('--no-indexes', action='store_true')
+    args = parser.parse_args()
+
+    database = os.environ.get('BENCH_DATABASE', 'booking_flags_bench')
+    config = {key: value for key, value in db_config.items() if key != 'database'}
+    db = mysql.connector.connect(**config)
+    cursor = db.cursor()
+    cursor.execute(f'DROP DATABASE IF EXISTS {database}')
+    cursor.execute(f'CREATE DATABASE {database}')
+    cursor.execute(f'USE {database}')
+    try:
+        started = time.perf_counter()
+        seed(cursor, args.bookings, indexes=not args.no_indexes)
+        db.commit()
+        cursor.execute('ANALYZE TABLE Bookings, Payments, Cancellation')
+        cursor.fetchall()
+        print(f'Seeded {args.bookings} bookings in {time.perf_counter() - started:.1f}s '
+              f'({"without" if args.no_indexes else "with"} B_ID indexes)')
+        cursor.execute('SET SESSION max_execution_time = %s', (args.max_seconds * 1000,))
+
+        booking_id = args.bookings // 2
+        cases = [
+            ('/api/user/bookings (one customer)', variants(USER_LISTING, (1,))),
+            ('/api/admin/bookings (all rows)', variants(ADMIN_LISTING, ())),
+            ('/api/admin/bookings?limit=50', variants(ADMIN_LISTING, (), {'limit': 50, 'after': None})),
+            ('/api/booking/<id>/status', variants(BOOKING_STATUS, (booking_id, 1 + (booking_id - 1) % CUSTOMERS))),
+        ]
+        for endpoint, queries in cases:
+            print(endpoint)
+            for name, sql, params in queries:
+                try:
+                    seconds, count = time_query(cursor, sql, params, args.repeat)
+                    print(f'  {name:<22} {seconds * 1000:10.1f} ms  ({count} rows)')
+                except mysql.connector.Error as e:
+                    print(f'  {name:<22} failed: {e.msg}')
+    finally:
+        cursor.execute(f'DROP DATABASE IF EXISTS {database}')
+        cursor.close()
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
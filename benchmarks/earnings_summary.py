@@ -0,0 +1,197 @@
+"""Compare round trips and latency of the provider earnings summary.
+
+Seeds bookings, payments and the daily earnings rollup into a scratch
+database on the configured MySQL server, then times what
+/api/provider/earnings/dashboard runs for one provider with:
+
+- the original three queries (total, month and pending, two over Payments)
+- the rollup read plus a separate pending query
+- provider_earnings_summary() with EARNINGS_SOURCE=rollup (one query)
+- provider_earnings_summary() with EARNINGS_SOURCE=payments (one SUM(CASE ...) pass)
+
+Each variant is checked to return the same figures. Uses db_config from
+app.py with the database replaced by BENCH_DATABASE (default
+earnings_summary_bench), which is created and dropped:
+
+    python benchmarks/earnings_summary.py [--bookings 100000] [--providers 100]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import mysql.connector
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import backfill_earnings_rollup, db_config, provider_earnings_summary
+
+CUSTOMERS = 1000
+SERVICES = 500
+
+SCHEMA = [
+    'CREATE TABLE User (U_ID INT PRIMARY KEY, Name VARCHAR(100))',
+    'CREATE TABLE Services (S_ID INT PRIMARY KEY, Name VARCHAR(100), Price DECIMAL(10,2))',
+    '''CREATE TABLE Bookings (
+        B_ID INT AUTO_INCREMENT PRIMARY KEY, CustomerID INT, ProviderID INT, S_ID INT,
+        BookingDate DATE, Status VARCHAR(20), PaymentStatus VARCHAR(20),
+        INDEX idx_bookings_provider (ProviderID))''',
+    '''CREATE TABLE Payments (
+        P_ID INT AUTO_INCREMENT PRIMARY KEY, B_ID INT, Amount DECIMAL(10,2), PaymentDate DATE,
+        PaymentMethod VARCHAR(50), PaymentStatus VARCHAR(20), UNIQUE KEY uq_payments_booking (B_ID))''',
+    '''CREATE TABLE Cancellation (
+        C_ID INT AUTO_INCREMENT PRIMARY KEY, B_ID INT, Date DATETIME, RefundAmount DECIMAL(10,2),
+        INDEX (B_ID))''',
+    '''CREATE TABLE ProviderEarningsDaily (
+        ProviderID INT NOT NULL, Day DATE NOT NULL, Amount DECIMAL(12,2) NOT NULL DEFAULT 0,
+        PaymentCount INT NOT NULL DEFAULT 0, Refunds DECIMAL(12,2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (ProviderID, Day))''',
+]
+
+ORIGINAL_QUERIES = [
+    '''
+    SELECT COALESCE(SUM(p.Amount), 0) as total_earnings
+    FROM Payments p
+    JOIN Bookings b ON p.B_ID = b.B_ID
+    WHERE b.ProviderID = %(provider)s AND p.PaymentStatus = 'Success'
+    ''',
+    '''
+    SELECT COALESCE(SUM(p.Amount), 0) as month_earnings
+    FROM Payments p
+    JOIN Bookings b ON p.B_ID = b.B_ID
+    WHERE b.ProviderID = %(provider)s AND p.PaymentStatus = 'Success' AND p.PaymentDate >= %(month)s
+    ''',
+]
+ROLLUP_QUERY = '''
+    SELECT COALESCE(SUM(Amount), 0) as total_earnings,
+           COALESCE(SUM(CASE WHEN Day >= %(month)s THEN Amount END), 0) as month_earnings
+    FROM ProviderEarningsDaily
+    WHERE ProviderID = %(provider)s
+'''
+PENDING_QUERY = '''
+    SELECT COALESCE(SUM(s.Price), 0) as pending_amount
+    FROM Bookings b
+    JOIN Services s ON b.S_ID = s.S_ID
+    WHERE b.ProviderID = %(provider)s AND b.Status != 'Cancelled' AND b.PaymentStatus = 'Not Paid'
+'''
+
+
+class CountingCursor:
+    """Cursor wrapper that counts the statements sent to the server"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.round_trips = 0
+
+    def execute(self, query, params=None):
+        self.round_trips += 1
+        return self.cursor.execute(query, params)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+def separate_queries(queries):
+    def summary(cursor, provider_id):
+        params = {'provider': provider_id, 'month': datetime.now().strftime('%Y-%m-01')}
+        figures = {}
+        for query in queries:
+            cursor.execute(query, params)
+            figures.update({key: float(value) for key, value in cursor.fetchone().items()})
+        return figures
+    return summary
+
+
+def shared_summary(source):
+    def summary(cursor, provider_id):
+        app_module.app.config['EARNINGS_SOURCE'] = source
+        return provider_earnings_summary(cursor, provider_id)
+    return summary
+
+
+VARIANTS = [
+    ('original (3 queries)', separate_queries(ORIGINAL_QUERIES + [PENDING_QUERY])),
+    ('rollup + pending (2 queries)', separate_queries([ROLLUP_QUERY, PENDING_QUERY])),
+    ('summary, rollup source', shared_summary('rollup')),
+    ('summary, payments source', shared_summary('payments')),
+]
+
+
+def seed(db, cursor, bookings, providers):
+    for statement in SCHEMA:
+        cursor.execute(statement)
+    cursor.executemany('INSERT INTO User (U_ID, Name) VALUES (%s, %s)',
+                       [(n, f'User {n}') for n in range(1, CUSTOMERS + providers + 1)])
+    cursor.executemany('INSERT INTO Services (S_ID, Name, Price) VALUES (%s, %s, %s)',
+                       [(n, f'Service {n}', 50 + n % 200) for n in range(1, SERVICES + 1)])
+    today = date.today()
+    rows = [(1 + n % CUSTOMERS, CUSTOMERS + 1 + n % providers, 1 + n % SERVICES,
+             today - timedelta(days=n % 730), 'Cancelled' if n % 10 == 9 else 'Confirmed',
+             'Paid' if n % 10 < 6 else 'Not Paid')
+            for n in range(bookings)]
+    for offset in range(0, len(rows), 5000):
+        cursor.executemany('''
+            INSERT INTO Bookings (CustomerID, ProviderID, S_ID, BookingDate, Status, PaymentStatus)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        ''', rows[offset:offset + 5000])
+    cursor.execute('''
+        INSERT INTO Payments (B_ID, Amount, PaymentDate, PaymentMethod, PaymentStatus)
+        SELECT b.B_ID, s.Price, b.BookingDate, 'Credit Card', 'Success'
+        FROM Bookings b JOIN Services s ON b.S_ID = s.S_ID
+        WHERE b.PaymentStatus = 'Paid'
+    ''')
+    db.commit()
+    backfill_earnings_rollup(db, cursor)
+
+
+def time_variant(db, summary, provider_id, repeat):
+    timings = []
+    for _ in range(repeat):
+        cursor = CountingCursor(db.cursor(dictionary=True))
+        started = time.perf_counter()
+        figures = summary(cursor, provider_id)
+        timings.append(time.perf_counter() - started)
+        cursor.close()
+    return statistics.median(timings), cursor.round_trips, figures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bookings', type=int, default=100000)
+    parser.add_argument('--providers', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    database = os.environ.get('BENCH_DATABASE', 'earnings_summary_bench')
+    config = {key: value for key, value in db_config.items() if key != 'database'}
+    db = mysql.connector.connect(**config)
+    cursor = db.cursor(dictionary=True)
+    cursor.execute(f'DROP DATABASE IF EXISTS {database}')
+    cursor.execute(f'CREATE DATABASE {database}')
+    cursor.execute(f'USE {database}')
+    try:
+        started = time.perf_counter()
+        seed(db, cursor, args.bookings, args.providers)
+        cursor.execute('ANALYZE TABLE Bookings, Payments, ProviderEarningsDaily')
+        cursor.fetchall()
+        print(f'Seeded {args.bookings} bookings for {args.providers} providers '
+              f'in {time.perf_counter() - started:.1f}s')
+
+        provider_id = CUSTOMERS + 1
+        expected = None
+        for name, summary in VARIANTS:
+            seconds, round_trips, figures = time_variant(db, summary, provider_id, args.repeat)
+            expected = expected or figures
+            note = '' if figures == expected else f'  MISMATCH {figures}'
+            print(f'  {name:<30} {round_trips} round trips  {seconds * 1000:8.2f} ms{note}')
+    finally:
+        cursor.execute(f'DROP DATABASE IF EXISTS {database}')
+        cursor.close()
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
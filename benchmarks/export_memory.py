@@ -0,0 +1,84 @@
+"""Profile the peak memory of streaming a 1M-row export in each format.
+
+Feeds generate_export() from a synthetic unbuffered cursor, so no database
+is needed, and reports the tracemalloc peak while the whole export is
+consumed. The peak should stay flat as the row count grows. tracemalloc
+slows allocation several times over, so the times are not throughput
+figures (use benchmarks/serialization.py for those):
+
+    python benchmarks/export_memory.py [rows]
+"""
+import os
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import EXPORT_FORMATS, generate_export
+
+COLUMNS = ('B_ID', 'BookingDate', 'BookingTime', 'Status', 'PaymentStatus',
+           'service_name', 'provider_name', 'customer_name', 'Amount', 'CreatedAt')
+
+
+class SyntheticCursor:
+    """Unbuffered cursor that makes each row as it is fetched"""
+
+    column_names = COLUMNS
+
+    def __init__(self, count):
+        self.count = count
+        self.position = 0
+
+    def execute(self, query, params=None):
+        self.position = 0
+
+    def fetchmany(self, size):
+        start, self.position = self.position, min(self.position + size, self.count)
+        return [
+            (n, date(2026, 1, 1) + timedelta(days=n % 365), timedelta(minutes=(n % 48) * 30),
+             'Confirmed', 'Paid', f'Service {n % 211}', f'Provider {n % 53}', f'Customer {n % 997}',
+             Decimal(f'{n % 500}.50'), datetime(2026, 1, 1, 8) + timedelta(seconds=n))
+            for n in range(start, self.position)
+        ]
+
+    def close(self):
+        pass
+
+
+class SyntheticConnection:
+    def __init__(self, count):
+        self.count = count
+
+    def cursor(self, **kwargs):
+        return SyntheticCursor(self.count)
+
+
+def profile(fmt, count):
+    app_module.get_db = lambda: SyntheticConnection(count)
+    tracemalloc.start()
+    started = time.monotonic()
+    size = chunks = 0
+    for chunk in generate_export('SELECT 1', (), fmt):
+        size += len(chunk)
+        chunks += 1
+    elapsed = time.monotonic() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, size, chunks, peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print(f'{count} rows, batches of {app_module.EXPORT_BATCH_SIZE}')
+    for fmt in EXPORT_FORMATS:
+        elapsed, size, chunks, peak = profile(fmt, count)
+        print(f'{fmt:<7} {elapsed:7.1f} s  {size / 2**20:8.1f} MiB out in {chunks} chunks  '
+              f'peak {peak / 2**20:6.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Time building ServiceSearchIndex and answering queries over synthetic services.
+
+Generates a catalog whose words follow a Zipf-like distribution, so a few
+terms appear in a large share of the services (the broad queries) and most
+in only a handful. Reports the build time and the median latency of
+selective, broad, prefix and filtered queries, and the cost of
+incremental updates. Needs no database:
+
+    python benchmarks/search_index.py [services]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import ServiceSearchIndex
+
+VOCABULARY = 5000
+
+
+class SyntheticIndex(ServiceSearchIndex):
+    def __init__(self, services):
+        super().__init__()
+        self.services = services
+
+    def _load(self, where='', params=()):
+        return self.services
+
+
+def word(rank):
+    return f'w{rank}'
+
+
+def make_services(count, seed=1):
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, VOCABULARY + 1)]
+    ranks = range(VOCABULARY)
+    return [
+        {'S_ID': n, 'Name': ' '.join(word(r) for r in rng.choices(ranks, weights, k=3)),
+         'Description': ' '.join(word(r) for r in rng.choices(ranks, weights, k=12)),
+         'provider_specialization': word(rng.choices(ranks, weights)[0]),
+         'Price': float(20 + n % 480), 'Duration': 30 + (n % 8) * 30, 'ProviderID': n % 2000}
+        for n in range(1, count + 1)
+    ]
+
+
+def median_ms(func, repeat=20):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    index = SyntheticIndex(make_services(count))
+    started = time.perf_counter()
+    index.search(word(0))
+    print(f'Built index over {count} services in {time.perf_counter() - started:.2f}s')
+
+    queries = [
+        ('selective term', {'query': word(3000)}),
+        ('two selective terms', {'query': f'{word(1200)} {word(2400)}'}),
+        ('broad term', {'query': word(0)}),
+        ('two broad terms', {'query': f'{word(0)} {word(1)}'}),
+        ('broad prefix', {'query': 'w1'}),
+        ('broad term, price filter', {'query': word(0), 'max_price': 100}),
+        ('broad term, duration filter', {'query': word(0), 'min_duration': 200}),
+    ]
+    for name, kwargs in queries:
+        total, _ = index.search(**kwargs)
+        print(f'  {name:<30} {median_ms(lambda: index.search(**kwargs)):8.2f} ms  ({total} matches)')
+
+    services = index.services[:100]
+    print(f'  {"re-index 100 services":<30} {median_ms(lambda: index._replace(services, [])):8.2f} ms')
+    total, _ = index.search(word(0))
+    print(f'  {"broad term after updates":<30} {median_ms(lambda: index.search(word(0))):8.2f} ms  ({total} matches)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Time serializing a 50k-row listing with each JSON path.
+
+Compares the stdlib encoder the app used before (json.dumps with
+default=str over dicts) with StdlibJSONProvider and FastJSONProvider
+(orjson when installed), over dict rows and over slotted records.
+Needs no database:
+
+    python benchmarks/serialization.py [rows]
+"""
+import json
+import os
+import sys
+import timeit
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import FastJSONProvider, StdlibJSONProvider, record_class
+
+COLUMNS = ('B_ID', 'CustomerID', 'ProviderID', 'S_ID', 'BookingDate', 'BookingTime', 'Status',
+           'PaymentStatus', 'service_name', 'Price', 'customer_name', 'CreatedAt')
+
+
+def make_rows(count):
+    start = date(2026, 1, 1)
+    return [
+        (n, n % 997, n % 53, n % 211, start + timedelta(days=n % 365), timedelta(minutes=(n % 48) * 30),
+         'Confirmed', 'Paid', f'Service {n % 211}', Decimal(f'{n % 500}.50'), f'Customer {n % 997}',
+         datetime(2026, 1, 1, 8) + timedelta(minutes=n))
+        for n in range(count)
+    ]
+
+
+def best_of(func, repeat=5):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rows = make_rows(count)
+    dicts = [dict(zip(COLUMNS, row)) for row in rows]
+    record = record_class(COLUMNS)
+    records = [record(*row) for row in rows]
+
+    fast = FastJSONProvider(app_module.app)
+    stdlib = StdlibJSONProvider(app_module.app)
+    cases = [
+        ('json.dumps(default=str), dicts', lambda: json.dumps(dicts, default=str)),
+        ('StdlibJSONProvider, dicts', lambda: stdlib.dumps(dicts)),
+        ('StdlibJSONProvider, records', lambda: stdlib.dumps(records)),
+        ('FastJSONProvider, dicts', lambda: fast.dumps(dicts)),
+        ('FastJSONProvider, records', lambda: fast.dumps(records)),
+    ]
+    print(f'{count} rows, orjson {"installed" if app_module.orjson else "not installed"}')
+    baseline = None
+    for name, func in cases:
+        seconds = best_of(func)
+        baseline = baseline or seconds
+        print(f'{name:<34} {seconds * 1000:9.1f} ms  {baseline / seconds:5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
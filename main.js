@@ -142,6 +142,66 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
+// Refresh the unread notification badge
+function checkNotifications() {
+    const badge = document.getElementById('notification-count');
+    if (!badge) {
+        return;
+    }
+    
+    fetch('/api/notifications/count')
+        .then(response => response.json())
+        .then(data => {
+            badge.textContent = data.count || 0;
+        })
+        .catch(error => {
+            console.error('Error checking notifications:', error);
+        });
+}
+
+// Receive new notifications as they happen instead of polling
+function subscribeToNotifications() {
+    if (!document.getElementById('notification-count')) {
+        return;
+    }
+    
+    if (!window.EventSource) {
+        setInterval(checkNotifications, 60000); // Check every minute
+        return;
+    }
+    
+    // The stream only carries new events; a slow poll keeps the badge right
+    // if the stream stays down
+    setInterval(checkNotifications, 300000);
+    
+    const source = new EventSource('/api/notifications/stream');
+    // Recount on every (re)connect so events missed while disconnected,
+    // or read in another tab, are reflected
+    source.addEventListener('open', checkNotifications);
+    source.addEventListener('notification', function(e) {
+        const notification = JSON.parse(e.data);
+        
+        const badge = document.getElementById('notification-count');
+        badge.textContent = (parseInt(badge.textContent, 10) || 0) + 1;
+        
+        const list = document.getElementById('notifications-list');
+        if (list) {
+            const li = document.createElement('li');
+            li.className = 'list-group-item';
+            const row = document.createElement('div');
+            row.className = 'd-flex justify-content-between align-items-center';
+            const message = document.createElement('div');
+            message.textContent = notification.Message;
+            const time = document.createElement('small');
+            time.className = 'text-muted';
+            time.textContent = new Date(notification.Timestamp).toLocaleString();
+            row.append(message, time);
+            li.appendChild(row);
+            list.prepend(li);
+        }
+    });
+}
+
 // Notification System
 function showNotification(message, type = 'info') {
     const notification = document.createElement('div');
@@ -173,8 +233,9 @@ function validateDateTime(date, time) {
 }
 
 // Service Provider Availability Check
-function checkProviderAvailability(providerId, date, time) {
-    return fetch(`/api/providers/${providerId}/availability?date=${date}&time=${time}`)
+function checkProviderAvailability(providerId, date, time, serviceId) {
+    const service = serviceId ? `&service_id=${serviceId}` : '';
+    return fetch(`/api/providers/${providerId}/availability?date=${date}&time=${time}${service}`)
         .then(response => response.json())
         .then(data => data.available)
         .catch(error => {
@@ -333,18 +394,29 @@ function loadProviderReviews(providerId) {
             data.reviews.forEach(review => {
                 const reviewEl = document.createElement('div');
                 reviewEl.className = 'review-item mb-3 p-3 border rounded';
-                reviewEl.innerHTML = `
-                    <div class="d-flex justify-content-between align-items-center">
-                        <div>
-                            <strong>${review.customer_name || 'Anonymous'}</strong>
-                            <span class="text-muted ml-2">${review.ReviewDate}</span>
-                        </div>
-                        <div class="rating">
-                            ${'★'.repeat(review.Rating)}${'☆'.repeat(5 - review.Rating)}
-                        </div>
-                    </div>
-                    <p class="mt-2 mb-0">${review.Comment || 'No comment provided'}</p>
-                `;
+                // Names and comments are user input; build the nodes as text
+                const header = document.createElement('div');
+                header.className = 'd-flex justify-content-between align-items-center';
+                
+                const author = document.createElement('div');
+                const name = document.createElement('strong');
+                name.textContent = review.customer_name || 'Anonymous';
+                const reviewDate = document.createElement('span');
+                reviewDate.className = 'text-muted ml-2';
+                reviewDate.textContent = review.ReviewDate || '';
+                author.append(name, ' ', reviewDate);
+                
+                const stars = Math.max(0, Math.min(5, parseInt(review.Rating, 10) || 0));
+                const rating = document.createElement('div');
+                rating.className = 'rating';
+                rating.textContent = '★'.repeat(stars) + '☆'.repeat(5 - stars);
+                header.append(author, rating);
+                
+                const comment = document.createElement('p');
+                comment.className = 'mt-2 mb-0';
+                comment.textContent = review.Comment || 'No comment provided';
+                
+                reviewEl.append(header, comment);
                 reviewsContainer.appendChild(reviewEl);
             });
         })
@@ -610,5 +682,5 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Initialize notification checking
     checkNotifications();
-    setInterval(checkNotifications, 60000); // Check every minute
+    subscribeToNotifications();
 }); 
\ No newline at end of file
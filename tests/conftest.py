@@ -0,0 +1,5 @@
+import os
+import sys
+
+# app.py lives at the repository root; importing it needs no database
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,167 @@
+"""In-memory stand-in for MySQL with row locks, unique keys and rollback.
+
+Just enough of InnoDB's behavior to test the app's concurrency guarantees
+without a server: a connection's SELECT ... FOR UPDATE blocks while another
+connection holds the same row lock, locks are held until commit or
+rollback, and inserts that break a unique key raise IntegrityError 1062
+(or are skipped with INSERT IGNORE). Tests register statement handlers by
+a fragment of their SQL; anything unmatched fails the test.
+"""
+import threading
+import time
+from collections import defaultdict
+
+import mysql.connector
+
+
+class FakeDatabase:
+    def __init__(self, step_delay=0.001, lock_timeout=5):
+        self.tables = defaultdict(list)
+        self.unique_keys = {}          # table -> {index name: column}
+        self.handlers = []             # (SQL fragment, handler(cursor, params))
+        self.step_delay = step_delay   # widens the window between statements
+        self.lock_timeout = lock_timeout
+        self._next_id = defaultdict(int)
+        self._locks = {}
+        self._cond = threading.Condition()
+
+    def handle(self, fragment):
+        """Decorator registering a handler for statements containing `fragment`"""
+        def register(handler):
+            self.handlers.append((fragment, handler))
+            return handler
+        return register
+
+    def connect(self):
+        return FakeConnection(self)
+
+    def rows(self, table, **match):
+        with self._cond:
+            return [row for row in self.tables[table]
+                    if all(row.get(column) == value for column, value in match.items())]
+
+    def lock(self, connection, *key):
+        deadline = time.monotonic() + self.lock_timeout
+        with self._cond:
+            while self._locks.get(key, connection) is not connection:
+                if not self._cond.wait(deadline - time.monotonic()):
+                    raise mysql.connector.Error(msg='Lock wait timeout exceeded', errno=1205)
+            self._locks[key] = connection
+
+    def insert(self, connection, table, row, ignore=False):
+        """Insert a row, returning its ID (None when INSERT IGNORE skipped it)"""
+        with self._cond:
+            for index, column in self.unique_keys.get(table, {}).items():
+                value = row.get(column)
+                if value is not None and any(other.get(column) == value for other in self.tables[table]):
+                    if ignore:
+                        return None
+                    raise mysql.connector.IntegrityError(
+                        msg=f"Duplicate entry '{value}' for key '{table}.{index}'", errno=1062)
+            self._next_id[table] += 1
+            row = dict(row, id=self._next_id[table])
+            self.tables[table].append(row)
+            connection.undo.append(lambda: self.tables[table].remove(row))
+            return row['id']
+
+    def update(self, connection, table, changes, **match):
+        with self._cond:
+            for row in self.tables[table]:
+                if all(row.get(column) == value for column, value in match.items()):
+                    previous = {column: row.get(column) for column in changes}
+                    row.update(changes)
+                    connection.undo.append(lambda row=row, previous=previous: row.update(previous))
+
+    def end_transaction(self, connection, commit):
+        with self._cond:
+            if not commit:
+                for undo in reversed(connection.undo):
+                    undo()
+            connection.undo = []
+            for key in [key for key, owner in self._locks.items() if owner is connection]:
+                del self._locks[key]
+            self._cond.notify_all()
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+        self.undo = []
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.database.end_transaction(self, commit=True)
+
+    def rollback(self):
+        self.database.end_transaction(self, commit=False)
+
+    def close(self):
+        # Like returning a connection to the pool: open transactions roll back
+        self.rollback()
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.database = connection.database
+        self.result = []
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def execute(self, query, params=None):
+        time.sleep(self.database.step_delay)
+        sql = ' '.join(query.split())
+        for fragment, handler in self.database.handlers:
+            if fragment in sql:
+                self.result, self.rowcount = [], 0
+                result = handler(self, params or ())
+                if result is not None:
+                    self.result = list(result)
+                    self.rowcount = len(self.result)
+                return
+        raise AssertionError(f'Unexpected statement: {sql}')
+
+    def executemany(self, query, seq_params):
+        for params in seq_params:
+            self.execute(query, params)
+
+    def lock(self, *key):
+        self.database.lock(self.connection, *key)
+
+    def insert(self, table, row, ignore=False):
+        self.lastrowid = self.database.insert(self.connection, table, row, ignore=ignore)
+        self.rowcount = 0 if self.lastrowid is None else 1
+
+    def update(self, table, changes, **match):
+        self.database.update(self.connection, table, changes, **match)
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+def run_concurrently(count, target):
+    """Call target(n) from `count` threads released together; returns results in order"""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(n):
+        barrier.wait()
+        try:
+            results[n] = target(n)
+        except Exception as e:
+            results[n] = e
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    return results
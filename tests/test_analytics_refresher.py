@@ -0,0 +1,62 @@
+import os
+import threading
+
+import pytest
+
+from app import AnalyticsRefresher
+
+
+class CountingRefresher(AnalyticsRefresher):
+    """Refresher that counts refreshes instead of querying"""
+
+    def __init__(self, interval):
+        super().__init__(interval)
+        self.refreshes = 0
+        self.refreshed = threading.Event()
+
+    def refresh(self):
+        self.refreshes += 1
+        self.refreshed.set()
+
+
+def refresher_threads():
+    return [thread for thread in threading.enumerate() if thread.name == 'analytics-refresher']
+
+
+def test_nothing_starts_at_construction_or_when_disabled():
+    before = len(refresher_threads())
+    CountingRefresher(0.01)
+    disabled = CountingRefresher(0)
+    disabled.ensure_running()
+    assert len(refresher_threads()) == before
+    assert disabled._pid is None
+
+
+def test_first_use_starts_one_thread_per_process():
+    refresher = CountingRefresher(0.01)
+    before = len(refresher_threads())
+    refresher.ensure_running()
+    refresher.ensure_running()
+    assert len(refresher_threads()) == before + 1
+    assert refresher._pid == os.getpid()
+    assert refresher.refreshed.wait(5)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork()')
+def test_forked_child_starts_its_own_thread():
+    refresher = CountingRefresher(0.01)
+    refresher.ensure_running()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            # The parent's thread did not survive the fork
+            refresher.refreshes = 0
+            refresher.refreshed.clear()
+            refresher.ensure_running()
+            if refresher.refreshed.wait(5) and refresher._pid == os.getpid():
+                status = 0
+        finally:
+            os._exit(status)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
@@ -0,0 +1,85 @@
+from datetime import date, timedelta
+
+import pytest
+
+import app as app_module
+from app import AvailabilityCache
+from fakedb import FakeDatabase
+
+DAY = date(2026, 3, 2)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase(step_delay=0)
+    database.tables['Services'] += [
+        {'S_ID': 1, 'ProviderID': 2, 'Duration': 30},
+        {'S_ID': 2, 'ProviderID': 2, 'Duration': 120},
+        {'S_ID': 3, 'ProviderID': 2, 'Duration': None},
+    ]
+    # Busy 10:00-11:00 and 12:30-17:00: free 09:00-10:00, 11:00-12:30 and 17:00-18:00
+    database.tables['Bookings'] += [
+        {'ProviderID': 2, 'BookingDate': DAY, 'BookingTime': timedelta(hours=10), 'Duration': 60},
+        {'ProviderID': 2, 'BookingDate': DAY, 'BookingTime': timedelta(hours=12, minutes=30), 'Duration': 270},
+    ]
+
+    @database.handle('FROM Services WHERE S_ID = %s AND ProviderID = %s')
+    def service_duration(cursor, params):
+        return [{'Duration': row['Duration'] or params[0]}
+                for row in database.rows('Services', S_ID=params[1], ProviderID=params[2])]
+
+    @database.handle('AND b.BookingDate BETWEEN %s AND %s')
+    def busy(cursor, params):
+        return [(row['BookingDate'], row['BookingTime'], row['Duration'])
+                for row in database.rows('Bookings', ProviderID=params[1])
+                if params[2] <= row['BookingDate'] <= params[3]]
+
+    monkeypatch.setattr(app_module, 'get_db', database.connect)
+    monkeypatch.setattr(app_module, 'availability_cache', AvailabilityCache())
+    monkeypatch.setattr(app_module, 'check_schema_version', lambda: None)
+    monkeypatch.setattr(app_module.search_index, 'warm', lambda: None)
+    return database
+
+
+@pytest.fixture
+def client(database):
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session.update({'loggedin': True, 'id': 1, 'user_type': 'Customer'})
+    return client
+
+
+def free(client, query):
+    response = client.get(f'/api/providers/2/availability?date={DAY.isoformat()}&{query}')
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['days'][0]['free']
+
+
+def test_requires_login(database):
+    response = app_module.app.test_client().get(f'/api/providers/2/availability?date={DAY.isoformat()}')
+    assert response.status_code == 401
+
+
+def test_free_intervals_fit_the_service_duration(client):
+    assert free(client, 'service_id=1') == [['09:00', '10:00'], ['11:00', '12:30'], ['17:00', '18:00']]
+    assert free(client, 'service_id=2') == []
+    # A NULL Duration falls back to the column default of 60 minutes
+    assert free(client, 'service_id=3') == [['09:00', '10:00'], ['11:00', '12:30'], ['17:00', '18:00']]
+    assert free(client, 'duration=90') == [['11:00', '12:30']]
+
+
+def test_slot_check_uses_the_service_duration(client):
+    url = f'/api/providers/2/availability?date={DAY.isoformat()}&time=11:00'
+    assert client.get(url + '&service_id=1').get_json()['available'] is True
+    body = client.get(url + '&service_id=2').get_json()
+    assert body['available'] is False
+    assert body['duration'] == 120
+
+
+def test_unknown_or_foreign_service_is_not_found(client, database):
+    database.tables['Services'].append({'S_ID': 9, 'ProviderID': 3, 'Duration': 30})
+    for service_id in (8, 9):
+        response = client.get(f'/api/providers/2/availability?date={DAY.isoformat()}&service_id={service_id}')
+        assert response.status_code == 404
+    response = client.get(f'/api/providers/2/availability?date={DAY.isoformat()}&service_id=x')
+    assert response.status_code == 400
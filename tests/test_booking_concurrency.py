@@ -0,0 +1,84 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app import SlotUnavailableError, reserve_booking_slot
+from fakedb import FakeDatabase, run_concurrently
+
+DAY = date(2026, 5, 4)
+
+
+@pytest.fixture
+def database():
+    database = FakeDatabase()
+    database.tables['Services'] += [
+        {'S_ID': 1, 'ProviderID': 10, 'Duration': 60},
+        {'S_ID': 2, 'ProviderID': 10, 'Duration': 30},
+        {'S_ID': 3, 'ProviderID': 20, 'Duration': 60},
+    ]
+    database.tables['ServiceProvider'] += [
+        {'U_ID': 10, 'Status': 'Approved'},
+        {'U_ID': 20, 'Status': 'Approved'},
+    ]
+    durations = {service['S_ID']: service['Duration'] for service in database.tables['Services']}
+
+    @database.handle('FROM Services WHERE S_ID = %s')
+    def select_service(cursor, params):
+        return database.rows('Services', S_ID=params[1])
+
+    @database.handle('SELECT Status FROM ServiceProvider WHERE U_ID = %s FOR UPDATE')
+    def lock_provider(cursor, params):
+        cursor.lock('ServiceProvider', params[0])
+        return database.rows('ServiceProvider', U_ID=params[0])
+
+    @database.handle('SELECT b.B_ID FROM Bookings b JOIN Services s')
+    def overlapping(cursor, params):
+        provider_id, booking_date, end, default_duration, start = params
+        return [
+            {'B_ID': row['id']} for row in database.rows('Bookings', ProviderID=provider_id, BookingDate=booking_date)
+            if row['Status'] != 'Cancelled' and row['BookingTime'] < end
+            and row['BookingTime'] + timedelta(minutes=durations.get(row['S_ID'], default_duration)) > start
+        ][:1]
+
+    @database.handle('INSERT INTO Bookings')
+    def insert_booking(cursor, params):
+        cursor.insert('Bookings', dict(zip(('CustomerID', 'ProviderID', 'S_ID', 'BookingDate', 'BookingTime',
+                                            'Status'), params)))
+
+    return database
+
+
+def reserve(database, customer_id, service_id, booking_time):
+    db = database.connect()
+    cursor = db.cursor(dictionary=True)
+    try:
+        result = reserve_booking_slot(cursor, customer_id, service_id, DAY, booking_time)
+        db.commit()
+        return result
+    except Exception:
+        db.rollback()
+        raise
+
+
+def test_one_of_many_concurrent_reservations_wins(database):
+    results = run_concurrently(20, lambda n: reserve(database, 100 + n, 1, '10:00'))
+    winners = [result for result in results if not isinstance(result, Exception)]
+    losers = [result for result in results if isinstance(result, Exception)]
+    assert len(winners) == 1
+    assert all(isinstance(error, SlotUnavailableError) and error.status_code == 409 for error in losers)
+    assert len(database.rows('Bookings')) == 1
+
+
+def test_overlapping_slots_of_different_services_conflict(database):
+    # 10:30-11:00 overlaps 10:00-11:00 booked through another of the provider's services
+    results = run_concurrently(10, lambda n: reserve(database, 100 + n, 1 if n % 2 else 2,
+                                                     '10:00' if n % 2 else '10:30'))
+    assert sum(not isinstance(result, Exception) for result in results) == 1
+    assert len(database.rows('Bookings')) == 1
+
+
+def test_disjoint_slots_and_providers_all_succeed(database):
+    slots = [(1, '09:00'), (1, '10:00'), (1, '11:00'), (3, '09:00'), (3, '10:00')]
+    results = run_concurrently(len(slots), lambda n: reserve(database, 100 + n, *slots[n]))
+    assert not any(isinstance(result, Exception) for result in results)
+    assert len(database.rows('Bookings')) == len(slots)
@@ -0,0 +1,85 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+import app as app_module
+from fakedb import FakeDatabase, run_concurrently
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    database.unique_keys['Cancellation'] = {'uq_cancellation_booking': 'B_ID'}
+    database.tables['Bookings'].append({'B_ID': 5, 'CustomerID': 1, 'ProviderID': 2, 'Status': 'Confirmed',
+                                        'PaymentStatus': 'Paid', 'BookingDate': date(2026, 3, 1)})
+    database.tables['Payments'].append({'B_ID': 5, 'Amount': Decimal('80.00')})
+
+    @database.handle('SELECT * FROM Bookings WHERE B_ID = %s AND CustomerID = %s FOR UPDATE')
+    def select_booking(cursor, params):
+        cursor.lock('Bookings', params[0])
+        return [dict(row) for row in database.rows('Bookings', B_ID=params[0], CustomerID=params[1])]
+
+    @database.handle('UPDATE Bookings SET Status')
+    def update_booking(cursor, params):
+        cursor.update('Bookings', {'Status': params[0]}, B_ID=params[1])
+
+    @database.handle('SELECT * FROM Payments WHERE B_ID')
+    def select_payment(cursor, params):
+        return database.rows('Payments', B_ID=params[0])
+
+    @database.handle('SELECT NOW()')
+    def now(cursor, params):
+        return [{'now': datetime(2026, 3, 1, 23, 59, 59)}]
+
+    @database.handle('INSERT IGNORE INTO Cancellation')
+    def insert_cancellation(cursor, params):
+        cursor.insert('Cancellation', {'B_ID': params[0], 'RefundAmount': params[1], 'Date': params[2]},
+                      ignore=True)
+
+    @database.handle('INSERT INTO ProviderEarningsDaily')
+    def add_earnings(cursor, params):
+        cursor.insert('ProviderEarningsDaily', dict(zip(('ProviderID', 'Day', 'Amount', 'PaymentCount',
+                                                         'Refunds'), params)))
+
+    @database.handle('INSERT INTO Notifications')
+    def insert_notification(cursor, params):
+        cursor.insert('Notifications', {'U_ID': params[0], 'Message': params[1]})
+
+    monkeypatch.setattr(app_module, 'get_db', database.connect)
+    monkeypatch.setattr(app_module, 'check_schema_version', lambda: None)
+    monkeypatch.setattr(app_module.search_index, 'warm', lambda: None)
+    return database
+
+
+def cancel(booking_id):
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session.update({'loggedin': True, 'id': 1, 'user_type': 'Customer'})
+    return client.post(f'/cancel_booking/{booking_id}').get_json()
+
+
+def test_cancel_records_refund_on_the_cancellation_day(database):
+    assert cancel(5) == {'success': True}
+    assert database.rows('Cancellation', B_ID=5)[0]['RefundAmount'] == Decimal('80.00')
+    (earnings,) = database.rows('ProviderEarningsDaily')
+    assert earnings['Day'] == date(2026, 3, 1)
+    assert earnings['Refunds'] == Decimal('80.00')
+
+
+def test_concurrent_cancels_refund_once(database):
+    results = run_concurrently(8, lambda n: cancel(5))
+    assert results == [{'success': True}] * 8
+    assert len(database.rows('Cancellation', B_ID=5)) == 1
+    assert len(database.rows('ProviderEarningsDaily')) == 1
+
+
+def test_failed_rollup_rolls_back_the_cancellation(database):
+    @database.handle('INSERT INTO ProviderEarningsDaily')
+    def fail(cursor, params):
+        raise RuntimeError('rollup down')
+    database.handlers.insert(0, database.handlers.pop())
+
+    assert cancel(5)['success'] is False
+    assert database.rows('Cancellation') == []
+    assert database.rows('Bookings', B_ID=5)[0]['Status'] == 'Confirmed'
@@ -0,0 +1,136 @@
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+import app as app_module
+from app import (QueryArgumentError, bucket_totals, decode_cursor, encode_cursor, fetch_records,
+                 free_intervals, is_slot_free, moving_average, paged_query, record_class, split_page)
+
+
+@pytest.fixture(params=['numpy', 'pure'])
+def numpy_or_not(request, monkeypatch):
+    if request.param == 'pure':
+        monkeypatch.setattr(app_module, 'np', None)
+    elif app_module.np is None:
+        pytest.skip('numpy is not installed')
+
+
+class TupleCursor:
+    def __init__(self, columns, rows):
+        self.column_names = columns
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_record_class_is_cached_and_slotted():
+    cls = record_class(('B_ID', 'Status'))
+    assert record_class(('B_ID', 'Status')) is cls
+    row = cls(1, 'Pending')
+    assert not hasattr(row, '__dict__')
+    assert row['B_ID'] == 1
+    assert row.get('Status') == 'Pending'
+    assert row.get('Nope', 'x') == 'x'
+    row['Status'] = 'Confirmed'
+    assert row.as_dict() == {'B_ID': 1, 'Status': 'Confirmed'}
+
+
+def test_record_class_extra_fields_default_to_none():
+    cls = record_class(('B_ID',), extra=('payment_made', 'B_ID'))
+    assert cls(5).as_dict() == {'B_ID': 5, 'payment_made': None}
+    assert cls is not record_class(('B_ID', 'payment_made'))
+
+
+def test_record_class_rejects_unusable_columns():
+    assert record_class(('B_ID', 'B_ID')) is None
+    assert record_class(('COUNT(*)',)) is None
+
+
+def test_fetch_records_falls_back_to_dicts():
+    rows = fetch_records(TupleCursor(('a', 'b'), [(1, 2)]))
+    assert rows[0].as_dict() == {'a': 1, 'b': 2}
+    rows = fetch_records(TupleCursor(('a', 'a'), [(1, 2)]))
+    assert rows == [{'a': 2}]
+
+
+def test_bucket_totals(numpy_or_not):
+    starts = [date(2026, 1, 1), date(2026, 1, 8), date(2026, 1, 15)]
+    days = [date(2026, 1, 1), date(2026, 1, 7), date(2026, 1, 8), date(2026, 1, 20)]
+    assert bucket_totals(days, [1, 2, 3.5, 4], starts) == [3.0, 3.5, 4.0]
+    assert bucket_totals([], [], starts) == [0.0, 0.0, 0.0]
+
+
+def test_moving_average(numpy_or_not):
+    assert moving_average([1.0, 2.0, 3.0, 4.0], 2) == [None, 1.5, 2.5, 3.5]
+    assert moving_average([1.0, 2.0, 3.0], 3) == [None, None, 2.0]
+    assert moving_average([1.0, 2.0], 3) == [None, None]
+    assert moving_average([1.0, 2.0], 1) == [1.0, 2.0]
+    assert moving_average([], 5) == []
+
+
+BUSY = [(540, 600), (660, 720)]  # 09:00-10:00 and 11:00-12:00
+
+
+@pytest.mark.parametrize('start, end, free', [
+    (480, 540, True),    # ends as the first booking starts
+    (600, 660, True),    # fits the gap exactly
+    (590, 610, False),   # overlaps the end of the first booking
+    (650, 670, False),   # overlaps the start of the second booking
+    (540, 720, False),   # spans both
+    (720, 780, True),    # starts as the last booking ends
+])
+def test_is_slot_free(start, end, free):
+    assert is_slot_free(BUSY, start, end) is free
+
+
+def test_is_slot_free_without_bookings():
+    assert is_slot_free([], 0, 1440)
+
+
+def test_free_intervals():
+    assert free_intervals(BUSY, 480, 1020) == [(480, 540), (600, 660), (720, 1020)]
+    assert free_intervals([], 480, 1020) == [(480, 1020)]
+    assert free_intervals([(400, 1100)], 480, 1020) == []
+    assert free_intervals([(480, 540), (1000, 1100)], 480, 1020) == [(540, 1000)]
+
+
+def test_cursor_round_trip():
+    values = ['2026-01-02', 17, None, 1.5]
+    assert decode_cursor(encode_cursor(values)) == values
+    assert decode_cursor(encode_cursor([date(2026, 1, 2), 3])) == ['2026-01-02', 3]
+
+
+def test_keyset_pages_walk_past_null_dates():
+    # SQLite stands in for MySQL: its dates are ISO strings, which compare like DATETIMEs
+    db = sqlite3.connect(':memory:')
+    db.row_factory = sqlite3.Row
+    db.execute('CREATE TABLE Notifications (N_ID INTEGER PRIMARY KEY, Timestamp TEXT)')
+    db.executemany('INSERT INTO Notifications VALUES (?, ?)', [
+        (1, '2026-01-01 09:00:00'), (2, None), (3, '2026-01-03 09:00:00'),
+        (4, None), (5, '2026-01-03 09:00:00'), (6, '2026-01-02 09:00:00'),
+    ])
+    keys = ['Timestamp', 'N_ID']
+    seen, after = [], None
+    for _ in range(10):
+        page = {'limit': 2, 'after': decode_cursor(after) if after else None}
+        query, params = paged_query('SELECT * FROM Notifications', (), keys, page, nullable=['Timestamp'])
+        query = query.replace('%s', '?').replace("TIMESTAMP '", "'")
+        rows, after = split_page([dict(row) for row in db.execute(query, params)], keys, page)
+        seen.extend(row['N_ID'] for row in rows)
+        if after is None:
+            break
+    # Newest first, ties broken by ID, NULL dates last
+    assert seen == [5, 3, 6, 1, 4, 2]
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    encode_cursor({'a': 1}),
+    encode_cursor([[1]]),
+    encode_cursor([{'a': 1}]),
+])
+def test_decode_cursor_rejects_malformed_input(cursor):
+    with pytest.raises(QueryArgumentError):
+        decode_cursor(cursor)
@@ -0,0 +1,96 @@
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+import app as app_module
+from app import FastJSONProvider, StdlibJSONProvider, fill_defaults, json_default, record_class
+
+
+ROW = {
+    'B_ID': 7,
+    'BookingDate': date(2026, 3, 9),
+    'BookingTime': timedelta(hours=9, minutes=30),
+    'Midnight': timedelta(0),
+    'Timestamp': datetime(2026, 3, 9, 14, 5, 7, 123456),
+    'Amount': Decimal('49.90'),
+    'Notes': b'ok',
+    'Missing': None,
+}
+
+WIRE = {
+    'B_ID': 7,
+    'BookingDate': '2026-03-09',
+    'BookingTime': '09:30',
+    'Midnight': '00:00',
+    'Timestamp': '2026-03-09 14:05:07',
+    'Amount': 49.9,
+    'Notes': 'ok',
+    'Missing': None,
+}
+
+
+@pytest.fixture(params=['fast', 'stdlib'])
+def provider(request):
+    cls = FastJSONProvider if request.param == 'fast' else StdlibJSONProvider
+    return cls(app_module.app)
+
+
+def test_json_default_converts_db_types():
+    assert json_default(date(2026, 1, 2)) == '2026-01-02'
+    assert json_default(datetime(2026, 1, 2, 3, 4, 5, 600)) == '2026-01-02 03:04:05'
+    assert json_default(timedelta(hours=17, minutes=5)) == '17:05'
+    assert json_default(Decimal('10.50')) == 10.5
+    assert json_default(bytearray(b'x')) == 'x'
+    assert json_default({1}) == [1]
+
+
+def test_json_default_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        json_default(object())
+
+
+def test_dict_rows_wire_format(provider):
+    assert json.loads(provider.dumps([ROW])) == [WIRE]
+
+
+def test_record_rows_wire_format(provider):
+    cls = record_class(tuple(ROW))
+    assert json.loads(provider.dumps([cls(*ROW.values())])) == [WIRE]
+
+
+def test_providers_produce_identical_output():
+    cls = record_class(tuple(ROW))
+    rows = [ROW, cls(*ROW.values())]
+    fast = FastJSONProvider(app_module.app).dumps(rows)
+    stdlib = StdlibJSONProvider(app_module.app).dumps(rows)
+    assert fast == stdlib
+
+
+def test_response_body_matches_dumps(provider):
+    with app_module.app.app_context():
+        response = provider.response([ROW])
+    assert response.mimetype == 'application/json'
+    assert json.loads(response.get_data()) == [WIRE]
+
+
+def test_fill_defaults_replaces_only_missing_and_null():
+    rows = [
+        {'Status': None, 'BookingTime': None},
+        {'Status': '', 'BookingTime': timedelta(0)},
+        {'Amount': 0},
+    ]
+    fill_defaults(rows, {'Status': 'Pending', 'BookingTime': 'Not specified', 'Amount': 1})
+    assert rows[0] == {'Status': 'Pending', 'BookingTime': 'Not specified', 'Amount': 1}
+    assert rows[1] == {'Status': '', 'BookingTime': timedelta(0), 'Amount': 1}
+    assert rows[2] == {'Amount': 0, 'Status': 'Pending', 'BookingTime': 'Not specified'}
+
+
+def test_fill_defaults_on_records():
+    cls = record_class(('Status', 'Amount'), extra=('BookingDate',))
+    row = cls(None, Decimal('0.00'))
+    fill_defaults([row], {'Status': 'Pending', 'Amount': 1, 'BookingDate': 'Not specified'})
+    assert row.Status == 'Pending'
+    assert row.Amount == Decimal('0.00')
+    assert row.BookingDate == 'Not specified'
@@ -0,0 +1,75 @@
+import os
+import sys
+
+import pytest
+
+from app import NotificationDispatcher
+
+
+class RecordingDispatcher(NotificationDispatcher):
+    """Dispatcher whose writes are recorded instead of inserted"""
+
+    def __init__(self, **kwargs):
+        super().__init__(flush_interval=0.01, **kwargs)
+        self.written = []
+
+    def _write(self, notifications):
+        self.written.extend(notifications)
+
+
+def test_synchronous_stage_writes_with_the_transaction():
+    class Cursor:
+        rows = None
+
+        def executemany(self, query, rows):
+            self.rows = rows
+
+    cursor = Cursor()
+    dispatcher = RecordingDispatcher()
+    staged = dispatcher.stage(cursor, [(1, 'a'), (None, 'skipped'), (2, 'b')])
+    assert staged == [(1, 'a'), (2, 'b')]
+    assert cursor.rows == staged
+
+
+def test_background_writer_starts_on_first_commit():
+    dispatcher = RecordingDispatcher(background=True)
+    assert dispatcher._thread is None
+    assert dispatcher.stage(object(), [(1, 'a')]) == [(1, 'a')]
+    dispatcher.committed([(1, 'a')])
+    assert dispatcher._thread.is_alive()
+    dispatcher.stop()
+    assert dispatcher.written == [(1, 'a')]
+
+
+def test_full_queue_writes_inline():
+    dispatcher = RecordingDispatcher(background=True, max_queue_size=1)
+    dispatcher._pid = os.getpid()  # keep the writer from draining the queue
+    dispatcher.committed([(1, 'a'), (2, 'b')])
+    assert dispatcher.written == [(2, 'b')]
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork()')
+def test_forked_child_starts_its_own_writer():
+    dispatcher = RecordingDispatcher(background=True)
+    dispatcher.committed([(1, 'parent')])
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.close(read_end)
+            dispatcher.committed([(2, 'child')])
+            dispatcher.stop()
+            os.write(write_end, repr(dispatcher.written).encode())
+            status = 0
+        finally:
+            sys.stdout.flush()
+            os._exit(status)
+    os.close(write_end)
+    with os.fdopen(read_end) as pipe:
+        child_written = pipe.read()
+    _, status = os.waitpid(pid, 0)
+    dispatcher.stop()
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert "(2, 'child')" in child_written
+    assert (1, 'parent') in dispatcher.written
@@ -0,0 +1,128 @@
+import threading
+from datetime import datetime
+
+import pytest
+
+import app as app_module
+from app import NotificationBus, NotificationPoller
+
+
+class FakeDB:
+    """Pool connection answering the notification queries from a list of rows"""
+
+    def __init__(self, notifications):
+        self.notifications = notifications
+        self.queries = []
+
+    def acquire(self):
+        return self
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.result = []
+
+    def execute(self, query, params=None):
+        self.db.queries.append(' '.join(query.split()))
+        rows = self.db.notifications
+        if 'GROUP BY U_ID' in query:
+            latest = {}
+            for row in rows:
+                if row['N_ID'] > params[0]:
+                    latest[row['U_ID']] = max(latest.get(row['U_ID'], 0), row['N_ID'])
+            self.result = [{'U_ID': u, 'last_id': n} for u, n in latest.items()]
+        elif 'MAX(N_ID)' in query:
+            ids = [row['N_ID'] for row in rows if 'U_ID = %s' not in query or row['U_ID'] == params[0]]
+            self.result = [{'last_id': max(ids, default=0)}]
+        else:
+            user_id, last_id, limit = params
+            self.result = [row for row in rows if row['U_ID'] == user_id and row['N_ID'] > last_id][:limit]
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+def notification(n_id, user_id, message='hi'):
+    return {'N_ID': n_id, 'U_ID': user_id, 'Message': message, 'Timestamp': datetime(2026, 1, 1)}
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeDB([notification(1, 7), notification(2, 8)])
+    monkeypatch.setattr(app_module, 'get_pool', lambda: db)
+    return db
+
+
+def test_poller_wakes_only_users_with_new_rows(db):
+    bus = NotificationBus()
+    seven, eight = bus.subscribe(7), bus.subscribe(8)
+    poller = NotificationPoller(bus)
+    last_id = poller.poll(None)
+    assert last_id == 2
+    assert seven.empty() and eight.empty()
+
+    db.notifications += [notification(3, 7), notification(4, 7), notification(5, 9)]
+    assert poller.poll(last_id) == 5
+    assert seven.get_nowait() == {'N_ID': 4}
+    assert seven.empty() and eight.empty()
+
+
+def test_poller_query_count_does_not_grow_with_streams(db):
+    bus = NotificationBus()
+    for user_id in range(100):
+        bus.subscribe(user_id)
+    NotificationPoller(bus).poll(0)
+    assert len(db.queries) == 1
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setattr(app_module.notification_poller, 'ensure_running', lambda: None)
+    monkeypatch.setattr(app_module.search_index, 'warm', lambda: None)
+    monkeypatch.setattr(app_module, 'check_schema_version', lambda: None)
+    monkeypatch.setitem(app_module.app.config, 'SSE_MAX_SECONDS', 0.3)
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session.update({'loggedin': True, 'id': 7, 'user_type': 'Customer'})
+    return client
+
+
+def test_idle_stream_reads_once(client, db):
+    body = client.get('/api/notifications/stream').get_data(as_text=True)
+    assert body == 'retry: 5000\n\n'
+    assert len(db.queries) == 1
+
+
+def test_stream_resumes_after_last_event_id(client, db):
+    db.notifications.append(notification(3, 7, 'later'))
+    body = client.get('/api/notifications/stream', headers={'Last-Event-ID': '1'}).get_data(as_text=True)
+    assert 'id: 3\nevent: notification' in body
+    assert 'later' in body
+    assert 'id: 1\n' not in body
+
+
+def test_stream_reads_after_a_wake_up(client, db):
+
+    def wake():
+        db.notifications.append(notification(3, 7, 'woken'))
+        app_module.notification_bus.publish(7, {'N_ID': 3})
+
+    timer = threading.Timer(0.1, wake)
+    timer.start()
+    body = client.get('/api/notifications/stream').get_data(as_text=True)
+    timer.join()
+    assert 'id: 3\nevent: notification' in body
+    assert len(db.queries) == 2
@@ -0,0 +1,96 @@
+from decimal import Decimal
+
+import pytest
+
+from app import PaymentError, record_payment
+from fakedb import FakeDatabase, run_concurrently
+
+
+@pytest.fixture
+def database():
+    database = FakeDatabase()
+    database.unique_keys['Payments'] = {'uq_payments_booking': 'B_ID',
+                                        'uq_payments_idempotency_key': 'IdempotencyKey'}
+    database.tables['Bookings'] += [
+        {'B_ID': 5, 'CustomerID': 1, 'ProviderID': 2, 'Status': 'Pending', 'S_ID': 1},
+        {'B_ID': 6, 'CustomerID': 1, 'ProviderID': 2, 'Status': 'Pending', 'S_ID': 1},
+    ]
+
+    @database.handle('FROM Bookings b JOIN Services s ON b.S_ID = s.S_ID WHERE b.B_ID = %s FOR UPDATE OF b')
+    def lock_booking(cursor, params):
+        cursor.lock('Bookings', params[0])
+        return [dict(row, Price=Decimal('80.00')) for row in database.rows('Bookings', B_ID=params[0])]
+
+    @database.handle('FROM Payments p LEFT JOIN Invoices i ON i.B_ID = p.B_ID WHERE p.B_ID = %s FOR UPDATE OF p')
+    def existing_payment(cursor, params):
+        return [{'P_ID': row['id'], 'Amount': row['Amount'], 'IdempotencyKey': row['IdempotencyKey'],
+                 'I_ID': next((i['id'] for i in database.rows('Invoices', B_ID=row['B_ID'])), None)}
+                for row in database.rows('Payments', B_ID=params[0])]
+
+    @database.handle('SELECT B_ID FROM Payments WHERE IdempotencyKey = %s')
+    def key_owner(cursor, params):
+        return database.rows('Payments', IdempotencyKey=params[0])
+
+    @database.handle('INSERT INTO Payments')
+    def insert_payment(cursor, params):
+        cursor.insert('Payments', dict(zip(('B_ID', 'CustomerID', 'Amount', 'PaymentDate', 'PaymentMethod',
+                                            'PaymentStatus', 'ProviderID', 'IdempotencyKey'), params)))
+
+    @database.handle('INSERT INTO ProviderEarningsDaily')
+    def add_earnings(cursor, params):
+        cursor.insert('ProviderEarningsDaily', dict(zip(('ProviderID', 'Day', 'Amount', 'PaymentCount',
+                                                         'Refunds'), params)))
+
+    @database.handle('UPDATE Bookings SET Status')
+    def confirm_booking(cursor, params):
+        cursor.update('Bookings', {'Status': 'Confirmed', 'PaymentStatus': 'Paid'}, B_ID=params[0])
+
+    @database.handle('INSERT INTO Invoices')
+    def insert_invoice(cursor, params):
+        cursor.insert('Invoices', dict(zip(('U_ID', 'B_ID', 'Amount', 'Date'), params)))
+
+    @database.handle('INSERT INTO Notifications')
+    def insert_notification(cursor, params):
+        cursor.insert('Notifications', {'U_ID': params[0], 'Message': params[1]})
+
+    return database
+
+
+def pay(database, booking_id, key):
+    db = database.connect()
+    try:
+        return record_payment(db, booking_id, 1, 'Credit Card', idempotency_key=key, owner_id=1)
+    finally:
+        db.close()
+
+
+def test_concurrent_retries_with_one_key_record_one_payment(database):
+    results = run_concurrently(20, lambda n: pay(database, 5, 'key-1'))
+    assert not any(isinstance(result, Exception) for result in results), results
+    assert sum(result['created'] for result in results) == 1
+    assert len({result['payment_id'] for result in results}) == 1
+    assert len({result['invoice_id'] for result in results}) == 1
+    assert len(database.rows('Payments', B_ID=5)) == 1
+    (earnings,) = database.rows('ProviderEarningsDaily')
+    assert earnings['PaymentCount'] == 1
+    assert earnings['Amount'] == Decimal('80.00')
+    assert len(database.rows('Invoices')) == 1
+
+
+def test_concurrent_payments_with_different_keys_pay_once(database):
+    results = run_concurrently(10, lambda n: pay(database, 5, f'key-{n}'))
+    created = [result for result in results if not isinstance(result, Exception)]
+    errors = [result for result in results if isinstance(result, Exception)]
+    assert len(created) == 1
+    assert all(isinstance(error, PaymentError) and error.status_code == 409 for error in errors)
+    assert len(database.rows('Payments')) == 1
+    assert len(database.rows('ProviderEarningsDaily')) == 1
+
+
+def test_key_reused_for_another_booking_is_rejected(database):
+    pay(database, 5, 'key-1')
+    with pytest.raises(PaymentError) as error:
+        pay(database, 6, 'key-1')
+    assert error.value.status_code == 422
+    assert database.rows('Payments', B_ID=6) == []
+    assert len(database.rows('ProviderEarningsDaily')) == 1
@@ -0,0 +1,160 @@
+import threading
+import time
+
+import app as app_module
+from app import ServiceSearchIndex, search_tokens
+
+
+def service(service_id, name, description='', price=50, duration=60, provider_id=1, specialization=''):
+    return {'S_ID': service_id, 'Name': name, 'Description': description, 'Price': price,
+            'Duration': duration, 'ProviderID': provider_id, 'provider_specialization': specialization}
+
+
+class FakeIndex(ServiceSearchIndex):
+    """Index that loads from a list instead of the database"""
+
+    def __init__(self, services, **kwargs):
+        super().__init__(**kwargs)
+        self.services = services
+        self.loads = 0
+        self.release = None
+
+    def _load(self, where='', params=()):
+        self.loads += 1
+        services = [dict(s) for s in self.services]
+        if self.release is not None and not params:
+            # Hold a full load after reading, so later changes are missing from it
+            self.release.wait(5)
+        if params:
+            services = [s for s in services if params[0] in (s['S_ID'], s['ProviderID'])]
+        return services
+
+
+def ids(results):
+    return [s['S_ID'] for s in results]
+
+
+SERVICES = [
+    service(1, 'Deep house cleaning', 'Kitchen and bathroom scrub', price=120, duration=180),
+    service(2, 'Window cleaning', price=40, duration=60),
+    service(3, 'Plumbing repair', 'Leaky pipes and taps', price=90, duration=90, provider_id=2,
+            specialization='Plumber'),
+]
+
+
+def test_search_tokens_lowercases_and_splits():
+    assert search_tokens('Deep-House  CLEANING!') == ['deep', 'house', 'cleaning']
+    assert search_tokens(None) == []
+
+
+def test_search_ranks_matches_and_counts_total():
+    index = FakeIndex(SERVICES)
+    total, results = index.search('cleaning')
+    assert total == 2
+    assert set(ids(results)) == {1, 2}
+    # The shorter document mentions the term with more weight
+    assert ids(results)[0] == 2
+    assert all('score' in s for s in results)
+
+
+def test_last_term_matches_as_prefix():
+    index = FakeIndex(SERVICES)
+    assert ids(index.search('plum')[1]) == [3]
+    assert index.search('plumber rep')[0] == 1
+
+
+def test_empty_query_does_not_build():
+    index = FakeIndex(SERVICES)
+    assert index.search('  ') == (0, [])
+    assert index.loads == 0
+
+
+def test_price_and_duration_filters():
+    index = FakeIndex(SERVICES)
+    assert ids(index.search('cleaning', max_price=50)[1]) == [2]
+    assert ids(index.search('cleaning', min_duration=120)[1]) == [1]
+    assert index.search('cleaning', min_price=500) == (0, [])
+
+
+def test_limit_keeps_total():
+    index = FakeIndex(SERVICES)
+    total, results = index.search('cleaning', limit=1)
+    assert total == 2
+    assert len(results) == 1
+
+
+def test_refresh_and_remove_update_the_built_index():
+    services = list(SERVICES)
+    index = FakeIndex(services)
+    index.search('cleaning')
+    services.append(service(4, 'Carpet cleaning'))
+    index.refresh_service(4)
+    assert 4 in ids(index.search('carpet')[1])
+    index.remove(4)
+    assert index.search('carpet') == (0, [])
+    assert index.loads == 2
+
+
+def test_stale_index_is_served_while_rebuilding():
+    services = list(SERVICES)
+    index = FakeIndex(services)
+    index.search('cleaning')
+    services.append(service(4, 'Carpet cleaning'))
+    index.release = threading.Event()
+    index.invalidate()
+
+    started = time.monotonic()
+    assert index.search('carpet') == (0, [])
+    assert time.monotonic() - started < 1
+    for _ in range(100):
+        if index.loads == 2:
+            break
+        time.sleep(0.01)
+    # A change made while the rebuild is loading is replayed onto the new index
+    index.remove(2)
+    index.release.set()
+    for _ in range(100):
+        if not index._building:
+            break
+        time.sleep(0.01)
+    assert ids(index.search('carpet')[1]) == [4]
+    assert 2 not in ids(index.search('cleaning')[1])
+
+
+def wait_for(condition):
+    for _ in range(100):
+        if condition():
+            return
+        time.sleep(0.01)
+
+
+def test_refresh_during_the_first_build_is_replayed():
+    services = list(SERVICES)
+    index = FakeIndex(services)
+    index.release = threading.Event()
+    index.warm()
+    wait_for(lambda: index.loads == 1)
+    services.append(service(4, 'Carpet cleaning'))
+    index.refresh_service(4)
+    index.release.set()
+    wait_for(lambda: index._built and not index._building)
+    assert ids(index.search('carpet')[1]) == [4]
+
+
+def test_long_posting_lists_score_only_their_top_weights(monkeypatch):
+    monkeypatch.setattr(app_module, 'SEARCH_POSTINGS_BUDGET', 3)
+    # Longer names weigh "cleaning" less
+    services = [service(n, 'cleaning' + ' extra' * n) for n in range(1, 7)]
+    index = FakeIndex(services)
+    total, results = index.search('cleaning')
+    assert total == 3
+    assert ids(results) == [1, 2, 3]
+
+    # Updates keep the sorted top postings exact
+    index.remove(1)
+    services.append(service(7, 'cleaning'))
+    index.refresh_service(7)
+    assert ids(index.search('cleaning')[1]) == [7, 2, 3]
+    index.remove(7)
+    index.remove(2)
+    assert ids(index.search('cleaning')[1]) == [3, 4, 5]
@@ -0,0 +1,182 @@
+import time
+
+import pytest
+
+import app as app_module
+from app import LRUCounterBackend, RedisCounterBackend, UnreadCounter
+
+
+class FakeRedis:
+    """In-memory stand-in for the redis-py calls RedisCounterBackend makes"""
+
+    def __init__(self):
+        self.values = {}
+        self.expiry = {}
+
+    def _expire(self, name):
+        expires_at = self.expiry.get(name)
+        if expires_at is not None and time.monotonic() >= expires_at:
+            self.values.pop(name, None)
+            self.expiry.pop(name, None)
+
+    def get(self, name):
+        self._expire(name)
+        value = self.values.get(name)
+        return str(value).encode() if value is not None else None
+
+    def set(self, name, value, ex=None):
+        self.values[name] = int(value)
+        self.expiry[name] = time.monotonic() + ex if ex is not None else None
+
+    def register_script(self, script):
+        assert 'EXISTS' in script and 'INCRBY' in script
+
+        def incr_if_exists(keys, args):
+            # Runs atomically, like a script on the server
+            self._expire(keys[0])
+            if keys[0] not in self.values:
+                return None
+            self.values[keys[0]] += int(args[0])
+            return self.values[keys[0]]
+        return incr_if_exists
+
+    def delete(self, name):
+        self.values.pop(name, None)
+        self.expiry.pop(name, None)
+
+
+class FakeCursor:
+    def __init__(self, watermark, count):
+        self.watermark = watermark
+        self.count = count
+        self.query = None
+
+    def execute(self, query, params=None):
+        self.query = query
+
+    def fetchone(self):
+        if 'NotificationReadState' in self.query:
+            return {'ReadUpTo': self.watermark} if self.watermark else None
+        return {'count': self.count}
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, watermark=0, count=0):
+        self.watermark = watermark
+        self.count = count
+        self.opened = 0
+
+    def cursor(self, dictionary=False):
+        self.opened += 1
+        return FakeCursor(self.watermark, self.count)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(params=['lru', 'redis'])
+def backend(request):
+    if request.param == 'lru':
+        return LRUCounterBackend(max_entries=10, ttl=60)
+    return RedisCounterBackend(FakeRedis(), ttl=60)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    conn = FakeConnection(watermark=3, count=4)
+    monkeypatch.setattr(app_module, 'get_db', lambda: conn)
+    return conn
+
+
+def test_count_miss_rebuilds_from_db_and_caches(backend, db):
+    counter = UnreadCounter(backend)
+    assert counter.count(7) == 4
+    assert backend.get(7) == 4
+    db.count = 99
+    assert counter.count(7) == 4
+    assert db.opened == 1
+
+
+def test_added_increments_cached_count(backend, db):
+    counter = UnreadCounter(backend)
+    counter.count(7)
+    counter.added(7)
+    counter.added(7, amount=2)
+    assert counter.count(7) == 7
+    assert db.opened == 1
+
+
+def test_added_leaves_missing_count_missing(backend, db):
+    counter = UnreadCounter(backend)
+    counter.added(7)
+    assert backend.get(7) is None
+    assert counter.count(7) == 4
+
+
+def test_reset_marks_everything_read(backend, db):
+    counter = UnreadCounter(backend)
+    counter.count(7)
+    counter.reset(7)
+    assert counter.count(7) == 0
+
+
+def test_added_after_reset_keeps_the_count(backend, db):
+    counter = UnreadCounter(backend)
+    counter.count(7)
+    counter.reset(7)
+    counter.added(7)
+    assert backend.get(7) == 1
+    assert counter.count(7) == 1
+    assert db.opened == 1
+
+
+def test_invalidate_forces_rebuild(backend, db):
+    counter = UnreadCounter(backend)
+    counter.count(7)
+    db.count = 1
+    counter.invalidate(7)
+    assert counter.count(7) == 1
+    assert db.opened == 2
+
+
+def test_counts_are_per_user(backend, db):
+    counter = UnreadCounter(backend)
+    counter.count(7)
+    counter.count(8)
+    counter.added(7)
+    assert backend.get(7) == 5
+    assert backend.get(8) == 4
+
+
+def test_expired_count_is_rebuilt(db):
+    backend = LRUCounterBackend(max_entries=10, ttl=0)
+    counter = UnreadCounter(backend)
+    counter.count(7)
+    assert backend.get(7) is None
+
+
+def test_lru_evicts_least_recently_used():
+    backend = LRUCounterBackend(max_entries=2, ttl=60)
+    backend.set(1, 1)
+    backend.set(2, 2)
+    backend.get(1)
+    backend.set(3, 3)
+    assert backend.get(2) is None
+    assert backend.get(1) == 1
+    assert backend.get(3) == 3
+
+
+def test_failing_backend_falls_back_to_db(db):
+    class Broken:
+        def __getattr__(self, name):
+            def fail(*args):
+                raise ConnectionError('cache down')
+            return fail
+
+    counter = UnreadCounter(Broken())
+    assert counter.count(7) == 4
+    counter.added(7)
+    counter.invalidate(7)